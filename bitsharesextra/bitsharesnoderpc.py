@@ -37,6 +37,7 @@ class BitSharesNodeRPC(object):
         self.requests = queue.Queue()
         self.replies = {}#queue.Queue()
         self.replylock = threading.Lock()
+        self.sendlock = threading.Lock() # calls may come from several threads
         self.errors = queue.Queue()
         self.ws = None # hack
         self.needed = True
@@ -73,8 +74,9 @@ class BitSharesNodeRPC(object):
 
 
     def get_request_id(self):
-        self._request_id += 1
-        return self._request_id
+        with self.sendlock:
+            self._request_id += 1
+            return self._request_id
 
     def get_subscription_id(self):
         self._subscription_id += 1
@@ -145,7 +147,7 @@ class BitSharesNodeRPC(object):
 
             try:
                 payload = self.requests.get(block=False)
-                self.ws.send(json.dumps(payload, ensure_ascii=False).encode('utf8'))
+                self.wssend(payload)
             except KeyboardInterrupt:
                 raise
             except queue.Empty:
@@ -367,7 +369,9 @@ class BitSharesNodeRPC(object):
     #   self.shutting_down = True
 
     def wssend(self, payload):
-        self.ws.send(json.dumps(payload, ensure_ascii=False).encode('utf8'))
+        data = json.dumps(payload, ensure_ascii=False).encode('utf8')
+        with self.sendlock:
+            self.ws.send(data)
 
     def wsconnect(self):
         self.connecting = True
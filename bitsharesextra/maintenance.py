@@ -0,0 +1,210 @@
+""" Wallet database maintenance: statistics, ANALYZE, VACUUM and
+    integrity checks.
+
+    Functions below operate on an open sqlite3 connection (see
+    `BitsharesStorageExtra.maintain` for running them against a wallet
+    that is in use). `vacuum_into` and the command line interface
+
+        python -m bitsharesextra.maintenance wallet.bts --check --vacuum
+
+    work on a closed wallet file.
+"""
+import os
+import sqlite3
+import logging
+log = logging.getLogger(__name__)
+
+
+def database_size(connection):
+    """ Returns (total_bytes, free_bytes) of the database
+    """
+    page_size = connection.execute("PRAGMA page_size").fetchone()[0]
+    page_count = connection.execute("PRAGMA page_count").fetchone()[0]
+    freelist = connection.execute("PRAGMA freelist_count").fetchone()[0]
+    return (page_size * page_count, page_size * freelist)
+
+
+def table_stats(connection):
+    """ Returns a list of dicts, one per table and index, with keys
+        `name`, `type`, `table`, `rows` (tables only), `bytes` (None if
+        SQLite was built without `dbstat`) and `stat` (`sqlite_stat1`
+        entry, available after `analyze`).
+    """
+    objects = connection.execute(
+        "SELECT type, name, tbl_name FROM sqlite_master " +
+        "WHERE type IN ('table', 'index') " +
+        "ORDER BY tbl_name, type DESC, name").fetchall()
+    sizes = { }
+    try:
+        query = "SELECT name, SUM(pgsize) FROM dbstat GROUP BY name"
+        for name, size in connection.execute(query):
+            sizes[name] = size
+    except sqlite3.OperationalError:
+        sizes = None
+    stat1 = { }
+    try:
+        for tbl, idx, stat in connection.execute("SELECT tbl, idx, stat FROM sqlite_stat1"):
+            stat1[idx or tbl] = stat
+    except sqlite3.OperationalError:
+        pass # never analyzed
+    stats = [ ]
+    for type, name, table in objects:
+        rows = None
+        if type == 'table':
+            try:
+                rows = connection.execute('SELECT COUNT(*) FROM "%s"' % name).fetchone()[0]
+            except sqlite3.OperationalError: # e.g. virtual table without module
+                pass
+        stats.append({
+            "name": name,
+            "type": type,
+            "table": table,
+            "rows": rows,
+            "bytes": sizes.get(name, 0) if sizes is not None else None,
+            "stat": stat1.get(name, None),
+        })
+    return stats
+
+
+def analyze(connection):
+    """ Gather statistics for the query planner
+    """
+    connection.execute("ANALYZE")
+    connection.commit()
+
+
+def integrity_check(connection, quick=False):
+    """ Returns a list of problems found, empty if all is well
+    """
+    pragma = "quick_check" if quick else "integrity_check"
+    rows = [ row[0] for row in connection.execute("PRAGMA %s" % pragma) ]
+    if rows == [ "ok" ]:
+        return [ ]
+    return rows
+
+
+def vacuum(connection):
+    """ Rebuild the database file in place
+    """
+    connection.commit()
+    connection.execute("VACUUM")
+
+
+def vacuum_into(path):
+    """ Rebuild a closed database file by `VACUUM INTO` a fresh copy,
+        checking it, and swapping it in. Falls back to an in-place
+        VACUUM on SQLite older than 3.27.
+    """
+    tmp = path + ".vacuum"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    connection = sqlite3.connect(path)
+    try:
+        try:
+            connection.execute("VACUUM INTO ?", (tmp, ))
+        except sqlite3.OperationalError:
+            log.info("VACUUM INTO unsupported, vacuuming in place")
+            vacuum(connection)
+            return
+    finally:
+        connection.close()
+    check = sqlite3.connect(tmp)
+    try:
+        problems = integrity_check(check, quick=True)
+    finally:
+        check.close()
+    if problems:
+        os.remove(tmp)
+        raise ValueError("Vacuumed copy failed integrity check: %s" % problems[0])
+    os.replace(tmp, path)
+
+
+def measured(connection, func, *args):
+    """ Run `func(connection, *args)`, returning (result, bytes_before, bytes_after)
+    """
+    before = database_size(connection)[0]
+    result = func(connection, *args)
+    after = database_size(connection)[0]
+    return (result, before, after)
+
+
+def format_size(n):
+    if n is None:
+        return "?"
+    for unit in [ "B", "KiB", "MiB" ]:
+        if abs(n) < 1024:
+            return "%d %s" % (n, unit)
+        n /= 1024
+    return "%.1f GiB" % n
+
+
+def format_stats(connection):
+    """ Human-readable report of `table_stats` and `database_size`
+    """
+    total, free = database_size(connection)
+    lines = [ "Database: %s, free: %s" % (format_size(total), format_size(free)) ]
+    for entry in table_stats(connection):
+        if entry["type"] == "table":
+            lines.append("%-28s %10s rows %12s" % (entry["name"],
+                entry["rows"] if entry["rows"] is not None else "?",
+                format_size(entry["bytes"])))
+        else:
+            lines.append("  index %-20s %16s %12s" % (entry["name"],
+                entry["stat"] or "", format_size(entry["bytes"])))
+    return "\n".join(lines)
+
+
+def format_step(name, before, after):
+    return "%s: %s -> %s (reclaimed %s)" % (name,
+        format_size(before), format_size(after), format_size(before - after))
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(
+        prog="python -m bitsharesextra.maintenance",
+        description="Maintenance of a (closed!) wallet database file")
+    parser.add_argument("wallet", help="Wallet file (.bts / .sqlite)")
+    parser.add_argument("--check", action="store_true", help="Run integrity check")
+    parser.add_argument("--analyze", action="store_true", help="Run ANALYZE")
+    parser.add_argument("--vacuum", action="store_true", help="VACUUM INTO a fresh file and swap it in")
+    parser.add_argument("--stats", action="store_true", help="Print per-table statistics (default)")
+    args = parser.parse_args(argv)
+
+    if not os.path.isfile(args.wallet):
+        parser.error("No such file: %s" % args.wallet)
+    if not(args.check or args.analyze or args.vacuum):
+        args.stats = True
+
+    connection = sqlite3.connect(args.wallet)
+    try:
+        if args.check:
+            problems = integrity_check(connection)
+            print("Integrity check: %s" % ("ok" if not problems else "FAILED"))
+            for problem in problems:
+                print("  " + problem)
+            if problems:
+                return 1
+        if args.analyze:
+            _, before, after = measured(connection, analyze)
+            print(format_step("ANALYZE", before, after))
+    finally:
+        connection.close()
+
+    if args.vacuum:
+        before = os.path.getsize(args.wallet)
+        vacuum_into(args.wallet)
+        print(format_step("VACUUM", before, os.path.getsize(args.wallet)))
+
+    if args.stats:
+        connection = sqlite3.connect(args.wallet)
+        try:
+            print(format_stats(connection))
+        finally:
+            connection.close()
+    return 0
+
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(main())
@@ -1,8 +1,20 @@
 from bitshares.storage import DataDir as BTSDataDir
 from appdirs import user_data_dir, system
 import json
+import zlib
+import sqlite3
+import threading
+import queue
+import weakref
 
 import os
+import re
+import urllib.parse
+import bisect
+import gzip
+import shutil
+import time
+from datetime import datetime
 import logging
 log = logging.getLogger(__name__)
 log.setLevel(logging.DEBUG)
@@ -10,6 +22,252 @@ log.addHandler(logging.StreamHandler())
 
 timeformat = "%Y%m%d-%H%M%S"
 
+# Header `format` of asset snapshot files
+ASSET_SNAPSHOT_FORMAT = "citadel-assets"
+
+# Fast-changing parts of an asset, kept in `AssetData`:
+# kind => (object id key, embedded object key)
+ASSET_DATA_KEYS = {
+    "dynamic": ("dynamic_asset_data_id", "dynamic_asset_data"),
+    "bitasset": ("bitasset_data_id", "bitasset_data"),
+}
+
+# Large JSON blobs are stored zlib-compressed, as BLOBs starting
+# with a format marker byte. Plain TEXT rows are left as is, so
+# both formats can co-exist in the same column.
+COMPRESS_MARKER = b"z"
+COMPRESS_THRESHOLD = 256
+
+def pack_text(text):
+    """ Prepare (JSON) text for storage, compressing it if worthwhile
+    """
+    if text is None or len(text) < COMPRESS_THRESHOLD:
+        return text
+    return COMPRESS_MARKER + zlib.compress(text.encode('utf-8'))
+
+def unpack_text(data):
+    """ Reverse of `pack_text`, always returns text (or None)
+    """
+    if isinstance(data, bytes):
+        if data[:1] == COMPRESS_MARKER:
+            return zlib.decompress(data[1:]).decode('utf-8')
+        return data.decode('utf-8')
+    return data
+
+def pack_json(obj):
+    return pack_text(json.dumps(obj))
+
+def unpack_json(data):
+    return json.loads(unpack_text(data))
+
+# Connection.backup (Python 3.7+) is what makes a backup "online"
+ONLINE_BACKUP = hasattr(sqlite3.Connection, "backup")
+
+def copy_database(source, target_path, pages=256, progress=None):
+    """ Copy an open SQLite connection into a new file at `target_path`,
+        `pages` pages at a time. Refuses to run without ONLINE_BACKUP:
+        a dump would hold the database for the whole copy.
+    """
+    if not ONLINE_BACKUP:
+        raise RuntimeError("Online backup requires Python 3.7 or newer")
+    target = sqlite3.connect(target_path)
+    try:
+        source.backup(target, pages=pages, progress=progress)
+    finally:
+        target.close()
+
+
+class WriterJob(object):
+    """ A `func(connection, progress)` call performed by the writer
+        thread, on its connection. `progress` applies queued writes,
+        long-running jobs (backups) call it between steps.
+    """
+    def __init__(self, func):
+        self.func = func
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+    def run(self, connection, progress=None):
+        try:
+            self.result = self.func(connection, progress)
+        except Exception as error:
+            self.error = error
+        self.done.set()
+
+    def wait(self):
+        self.done.wait()
+        if self.error:
+            raise self.error
+        return self.result
+
+
+class WriteBehind(object):
+    """ Applies queued mutations to an SQLite file from a single
+        background thread, so callers never wait on disk I/O.
+        Everything that piled up since the last round is committed
+        as one transaction.
+
+        Writes are numbered as they are queued. Readers only wait
+        for writes queued by their own thread (see `settle`), not
+        for the whole queue, and the database is switched to WAL
+        mode, so reads are not blocked by a commit in progress.
+        A thread handing results over to another one settles first.
+    """
+    instances = weakref.WeakSet()
+
+    def __init__(self, path):
+        self.path = path
+        self.queue = queue.Queue()
+        self.idle = threading.Condition()
+        self.pending = 0
+        self.queued = 0 # number of last queued write
+        self.applied = 0 # number of last committed (or dropped) write
+        self.local = threading.local() # .last: number of thread's last write
+        self.running = True
+        self.jobs = [ ]
+        self.thread = threading.Thread(target=self.run, name="StorageWriter")
+        self.thread.daemon = True
+        self.thread.start()
+        WriteBehind.instances.add(self)
+
+    def put(self, queries, many=False):
+        """ Queue a list of (query, params) tuples, or, if `many` is
+            set, a list of (query, rows) tuples for `executemany`
+        """
+        with self.idle:
+            self.pending += 1
+            self.queued += 1
+            self.local.last = self.queued
+            # numbered under the lock, so queue order is number order
+            self.queue.put( (queries, many, self.queued) )
+
+    def call(self, func):
+        """ Run `func(connection, progress)` on the writer thread,
+            once all previously queued writes are done. Blocks the
+            caller until it returns.
+        """
+        job = WriterJob(func)
+        if self.onWriterThread():
+            raise RuntimeError("Writer job started from the writer thread")
+        self.queue.put(job)
+        return job.wait()
+
+    def onWriterThread(self):
+        return threading.current_thread() is self.thread
+
+    def settle(self):
+        """ Block until writes queued by the calling thread are on
+            disk. Cheap if there are none.
+        """
+        if self.onWriterThread():
+            return
+        wanted = getattr(self.local, "last", 0)
+        if self.applied >= wanted:
+            return
+        with self.idle:
+            while self.applied < wanted:
+                self.idle.wait()
+
+    @classmethod
+    def settleAll(cls):
+        """ `settle` the calling thread with every live writer """
+        for writer in list(cls.instances):
+            writer.settle()
+
+    def backup(self, target_path, pages=256):
+        """ Copy the database to `target_path` from the writer thread.
+            Queued writes keep being applied between backup steps and,
+            since they go through the same connection, land in the
+            copy without restarting it.
+        """
+        self.call(lambda connection, progress:
+            copy_database(connection, target_path, pages, progress))
+
+    def flush(self):
+        """ Block until every queued mutation is on disk. This is a
+            barrier for all threads; reads only need `settle`.
+        """
+        if self.onWriterThread():
+            return
+        with self.idle:
+            while self.pending:
+                self.idle.wait()
+
+    def close(self):
+        """ Flush and stop the writer thread
+        """
+        self.queue.put(None)
+        self.thread.join()
+
+    def _apply(self, cursor, item):
+        queries, many, number = item
+        for query in queries:
+            if many:
+                cursor.executemany(*query)
+            else:
+                cursor.execute(*query)
+
+    def _commit(self, connection, batch):
+        try:
+            cursor = connection.cursor()
+            for item in batch:
+                self._apply(cursor, item)
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            log.exception("Batched write failed, retrying one by one")
+            for item in batch:
+                try:
+                    self._apply(connection.cursor(), item)
+                    connection.commit()
+                except Exception:
+                    connection.rollback()
+                    log.exception("Dropped write: %s" % str(item[0][0][0]))
+        with self.idle:
+            self.pending -= len(batch)
+            self.applied = batch[-1][2]
+            self.idle.notify_all()
+
+    def _process(self, connection, batch):
+        """ Commit writes from `batch`, set aside jobs and stop marker
+        """
+        writes = [ ]
+        for item in batch:
+            if item is None:
+                self.running = False
+            elif isinstance(item, WriterJob):
+                self.jobs.append(item)
+            else:
+                writes.append(item)
+        if writes:
+            self._commit(connection, writes)
+
+    def _drain(self):
+        items = [ ]
+        while True:
+            try:
+                items.append(self.queue.get_nowait())
+            except queue.Empty:
+                return items
+
+    def run(self):
+        connection = sqlite3.connect(self.path)
+        try:
+            # readers see the last commit while we write the next
+            connection.execute("PRAGMA journal_mode=WAL")
+        except sqlite3.DatabaseError as error:
+            log.warning("WAL unavailable, reads may wait for commits: %s" % str(error))
+        def between_steps(status, remaining, total):
+            self._process(connection, self._drain())
+        while self.running or self.jobs:
+            if not self.jobs:
+                self._process(connection, [ self.queue.get() ] + self._drain())
+            if self.jobs:
+                self.jobs.pop(0).run(connection, between_steps)
+        connection.close()
+
+
 class DataDir(BTSDataDir):
     """ This class ensures that the user's data is stored in its OS
         preotected user directory:
@@ -34,6 +292,98 @@ class DataDir(BTSDataDir):
     appauthor = "Fabian Shuch"
     storageDatabaseDefault = "bitshares.sqlite"
 
+    # Columns holding `pack_text`-ed data
+    __packed__ = [ ]
+
+    # Optional `WriteBehind` queue, see `BitsharesStorageExtra`
+    writer = None
+
+    def __init__(self, path=None, *args, **kwargs):
+        super(DataDir, self).__init__(path, *args, **kwargs)
+        if path:
+            self.sqlDataBaseFile = path
+
+    def sql_execute(self, query, lastid=False):
+        """ Execute a mutating query. With a writer attached, the
+            query is queued, unless we need `lastid` back; then it
+            runs here, after our own queued writes.
+        """
+        if self.writer:
+            if not lastid:
+                self.writer.put([ query ])
+                return None
+            self.writer.settle()
+        return super(DataDir, self).sql_execute(query, lastid)
+
+    def sql_fetchone(self, query):
+        self.settle()
+        return super(DataDir, self).sql_fetchone(query)
+
+    def sql_fetchall(self, query):
+        self.settle()
+        return super(DataDir, self).sql_fetchall(query)
+
+    def settle(self):
+        """ Wait until writes queued by this thread are on disk,
+            so we read our own writes (writes of other threads
+            may still be in flight)
+        """
+        if self.writer:
+            self.writer.settle()
+
+    def sql_executemany(self, query, rows):
+        """ Execute one statement for many rows, in a single transaction
+        """
+        if self.writer:
+            self.writer.put([ (query, rows) ], many=True)
+            return
+        connection = sqlite3.connect(self.sqlDataBaseFile)
+        try:
+            cursor = connection.cursor()
+            cursor.executemany(query, rows)
+            connection.commit()
+        finally:
+            connection.close()
+
+    def sql_batch(self, queries):
+        """ Execute several (query, params) tuples in a single transaction
+        """
+        if self.writer:
+            self.writer.put(queries)
+            return
+        connection = sqlite3.connect(self.sqlDataBaseFile)
+        try:
+            cursor = connection.cursor()
+            for query in queries:
+                cursor.execute(*query)
+            connection.commit()
+        finally:
+            connection.close()
+
+    def repack(self, key="id"):
+        """ Rewrite all `__packed__` columns of this table using
+            current `pack_text` rules. Returns number of rows touched.
+        """
+        if not self.__packed__:
+            return 0
+        query = ("SELECT %s, %s FROM %s" % (key,
+                 ",".join(self.__packed__), self.__tablename__), )
+        rows = self.sql_fetchall(query)
+        updates = [ ]
+        for row in rows:
+            vals = [ ]
+            for data in row[1:]:
+                vals.append( pack_text(unpack_text(data)) )
+            if vals == list(row[1:]):
+                continue
+            updates.append( vals + [ row[0] ] )
+        if updates:
+            query = ("UPDATE %s SET " % self.__tablename__ +
+                     ", ".join(col + "=?" for col in self.__packed__) +
+                     " WHERE %s=?" % key)
+            self.sql_executemany(query, updates)
+        return len(updates)
+
     @classmethod
     def preflight(self, filename=True):
         d = user_data_dir(self.appname, self.appauthor)
@@ -52,6 +402,7 @@ class Accounts(DataDir):
     """
     __tablename__ = 'accounts'
     __columns__ = [ 'id', 'account', 'account_id', 'graphene_json', 'balances_json' ]
+    __packed__ = [ 'graphene_json', 'balances_json' ]
 
     def __init__(self, *args, **kwargs):
         super(Accounts, self).__init__(*args, **kwargs)
@@ -81,17 +432,17 @@ class Accounts(DataDir):
         """
         if key not in ['account', 'account_id']:
             raise KeyError("'key' must be account or account_id")
-        query = ("SELECT graphene_json, balances_json, account, account_id from %s " % (self.__tablename__) +
+        query = ("SELECT graphene_json, account, account_id from %s " % (self.__tablename__) +
                  "WHERE %s=?" % (key),
                  (some_id, ))
         row = self.sql_fetchone(query)
         if not row:
             return None
 
-        body = json.loads(row[0])
-        body['balances'] = json.loads(row[1]) if row[1] else { }
-        body['name'] = row[2]
-        body['id'] = row[3]
+        # balances live in the `balances` table, see `Balances`
+        body = unpack_json(row[0])
+        body['name'] = row[1]
+        body['id'] = row[2]
         return body
 
     def getById(self, account_id):
@@ -109,7 +460,7 @@ class Accounts(DataDir):
            val.pop('balances', None)
         query = ("UPDATE %s " % self.__tablename__ +
                  ("SET %s=? WHERE account=?" % key),
-                 (json.dumps(val), account_name))
+                 (pack_json(val), account_name))
         self.sql_execute(query)
 
     def add(self, account_name, account_id=None, keys=2):
@@ -142,6 +493,307 @@ class Accounts(DataDir):
 
 
 
+class AccountNames(DataDir):
+    """ This is the account directory, mapping ids of any accounts
+        we came across (not just our own) to their names, in the
+        `account_names` table. Names of accounts never change.
+    """
+    __tablename__ = 'account_names'
+    __columns__ = [ 'id', 'account_id', 'name' ]
+
+    def __init__(self, *args, **kwargs):
+        super(AccountNames, self).__init__(*args, **kwargs)
+
+    def create_table(self):
+        """ Create the new table in the SQLite database
+        """
+        query = ('CREATE TABLE %s (' % self.__tablename__ +
+                 'id INTEGER PRIMARY KEY AUTOINCREMENT,' +
+                 'account_id STRING(256) UNIQUE,' +
+                 'name STRING(256)' +
+                 ')', )
+        self.sql_execute(query)
+        query = ('CREATE INDEX %s_name ON %s (name)' % (self.__tablename__, self.__tablename__), )
+        self.sql_execute(query)
+
+    def migrateFrom(self, accounts):
+        """ Fill the directory from the `accounts` table
+        """
+        query = ('INSERT OR IGNORE INTO %s (account_id, name) ' % self.__tablename__ +
+                 'SELECT account_id, account FROM %s ' % accounts.__tablename__ +
+                 'WHERE account_id IS NOT NULL', )
+        self.sql_execute(query)
+
+    def getNames(self, account_ids):
+        """ Returns a dict of account_id => name, for those
+            of `account_ids` we know
+        """
+        found = { }
+        account_ids = list(account_ids)
+        for j in range(0, len(account_ids), 500):
+            chunk = account_ids[j:j+500]
+            query = ("SELECT account_id, name FROM %s " % self.__tablename__ +
+                     "WHERE account_id IN (%s)" % ",".join("?" * len(chunk)),
+                     tuple(chunk))
+            for account_id, name in self.sql_fetchall(query):
+                found[account_id] = name
+        return found
+
+    def getId(self, name):
+        """ Returns account id by name, or None
+        """
+        query = ("SELECT account_id FROM %s WHERE name=?" % self.__tablename__, (name, ))
+        row = self.sql_fetchone(query)
+        return row[0] if row else None
+
+    def saveMany(self, names):
+        """ Remember many accounts in one transaction
+
+           :param list names: List of (account_id, name) tuples
+        """
+        queries = [ ('INSERT OR REPLACE INTO %s (account_id, name) ' % self.__tablename__ +
+                     'VALUES (?, ?)', (account_id, name))
+                    for account_id, name in names ]
+        if queries:
+            self.sql_batch(queries)
+
+    def wipe(self):
+        """ Delete ALL entries
+        """
+        query = ("DELETE FROM %s " % (self.__tablename__),)
+        self.sql_execute(query)
+
+
+def account_keys(graphene_json):
+    """ Returns a list of (pubkey, authority) tuples of an account
+    """
+    keys = [ ]
+    for authority in [ "owner", "active" ]:
+        for key_auth in graphene_json.get(authority, { }).get("key_auths", [ ]):
+            keys.append( (key_auth[0], authority) )
+    memo_key = graphene_json.get("options", { }).get("memo_key", None)
+    if memo_key:
+        keys.append( (memo_key, "memo") )
+    return keys
+
+
+class AccountKeys(DataDir):
+    """ This is the public key index, mapping keys to accounts
+        that have them in their authorities, in the `account_keys`
+        table. Rows with `authority` set to "reference" come from
+        `get_key_references` lookups of unknown keys.
+    """
+    __tablename__ = 'account_keys'
+    __columns__ = [ 'id', 'pubkey', 'account_id', 'authority' ]
+
+    def __init__(self, *args, **kwargs):
+        super(AccountKeys, self).__init__(*args, **kwargs)
+
+    def create_table(self):
+        """ Create the new table in the SQLite database
+        """
+        query = ('CREATE TABLE %s (' % self.__tablename__ +
+                 'id INTEGER PRIMARY KEY AUTOINCREMENT,' +
+                 'pubkey STRING(256),' +
+                 'account_id STRING(256),' +
+                 'authority STRING(16)' +
+                 ')', )
+        self.sql_execute(query)
+        query = ('CREATE UNIQUE INDEX %s_pubkey ON %s ' % (self.__tablename__, self.__tablename__) +
+                 '(pubkey, account_id, authority)', )
+        self.sql_execute(query)
+        query = ('CREATE INDEX %s_account_id ON %s (account_id)' % (self.__tablename__, self.__tablename__), )
+        self.sql_execute(query)
+
+    def migrateFrom(self, accounts):
+        """ Index keys of all accounts in the `accounts` table
+        """
+        query = ("SELECT account_id, graphene_json FROM %s " % accounts.__tablename__ +
+                 "WHERE account_id IS NOT NULL AND graphene_json IS NOT NULL", )
+        for account_id, data in accounts.sql_fetchall(query):
+            try:
+                keys = account_keys(unpack_json(data))
+            except (ValueError, AttributeError):
+                continue
+            self.setKeys(account_id, keys)
+
+    def setKeys(self, account_id, keys):
+        """ Replace indexed keys of an account
+
+           :param str account_id: Account ID (1.2.X)
+           :param list keys: List of (pubkey, authority) tuples
+        """
+        queries = [ ("DELETE FROM %s WHERE account_id=? AND authority != 'reference'" % self.__tablename__,
+                     (account_id, )) ]
+        for pubkey, authority in keys:
+            queries.append(
+                ('INSERT OR IGNORE INTO %s (pubkey, account_id, authority) ' % self.__tablename__ +
+                 'VALUES (?, ?, ?)', (pubkey, account_id, authority)) )
+        self.sql_batch(queries)
+
+    def addReferences(self, references):
+        """ Remember results of key reference lookups
+
+           :param list references: List of (pubkey, account_id) tuples
+        """
+        queries = [ ('INSERT OR IGNORE INTO %s (pubkey, account_id, authority) ' % self.__tablename__ +
+                     "VALUES (?, ?, 'reference')", (pubkey, account_id))
+                    for pubkey, account_id in references ]
+        if queries:
+            self.sql_batch(queries)
+
+    def getAccounts(self, pubkeys, references=True):
+        """ Returns a dict of pubkey => list of account ids, for
+            those of `pubkeys` we know
+        """
+        found = { }
+        pubkeys = list(pubkeys)
+        extra = "" if references else "AND authority != 'reference' "
+        for j in range(0, len(pubkeys), 500):
+            chunk = pubkeys[j:j+500]
+            query = ("SELECT pubkey, account_id FROM %s " % self.__tablename__ +
+                     "WHERE pubkey IN (%s) " % ",".join("?" * len(chunk)) + extra +
+                     "ORDER BY id",
+                     tuple(chunk))
+            for pubkey, account_id in self.sql_fetchall(query):
+                ids = found.setdefault(pubkey, [ ])
+                if not(account_id in ids):
+                    ids.append(account_id)
+        return found
+
+    def wipe(self):
+        """ Delete ALL entries
+        """
+        query = ("DELETE FROM %s " % (self.__tablename__),)
+        self.sql_execute(query)
+
+
+class Balances(DataDir):
+    """ This is the balance storage that stores one row per
+        (account, asset) pair, with the amount as an integer
+        in the asset's base units, in the `balances` table.
+    """
+    __tablename__ = 'balances'
+    __columns__ = [ 'id', 'account_id', 'asset_id', 'amount_int', 'updated_block' ]
+
+    def __init__(self, *args, **kwargs):
+        super(Balances, self).__init__(*args, **kwargs)
+
+    def create_table(self):
+        """ Create the new table in the SQLite database
+        """
+        query = ('CREATE TABLE %s (' % self.__tablename__ +
+                 'id INTEGER PRIMARY KEY AUTOINCREMENT,' +
+                 'account_id STRING(256),' +
+                 'asset_id STRING(256),' +
+                 'amount_int INTEGER,' +
+                 'updated_block INTEGER' +
+                 ')', )
+        self.sql_execute(query)
+        query = ('CREATE UNIQUE INDEX %s_account_asset ON %s ' % (self.__tablename__, self.__tablename__) +
+                 '(account_id, asset_id)', )
+        self.sql_execute(query)
+
+    def getBalances(self, account_id):
+        """ Returns a list of (asset_id, amount_int) tuples
+        """
+        query = ("SELECT asset_id, amount_int FROM %s " % self.__tablename__ +
+                 "WHERE account_id=? ORDER BY asset_id",
+                 (account_id, ))
+        return [ (x[0], int(x[1])) for x in self.sql_fetchall(query) ]
+
+    def getTotals(self, account_ids=None):
+        """ Returns a list of (asset_id, amount_int) tuples, summed
+            over `account_ids` (or over all accounts if None)
+        """
+        where = ""
+        params = ( )
+        if account_ids is not None:
+            where = "WHERE account_id IN (%s) " % ",".join("?" * len(account_ids))
+            params = tuple(account_ids)
+        query = ("SELECT asset_id, SUM(amount_int) FROM %s " % self.__tablename__ +
+                 where + "GROUP BY asset_id ORDER BY asset_id",
+                 params)
+        return [ (x[0], int(x[1])) for x in self.sql_fetchall(query) ]
+
+    def setBalance(self, account_id, asset_id, amount_int, updated_block=None):
+        """ Insert or update balance of a single asset
+
+           :param str account_id: Account ID (1.2.X)
+           :param str asset_id: Asset ID (1.3.X)
+           :param int amount_int: Amount in base units
+           :param int updated_block: Block number of this information
+        """
+        query = ('INSERT OR REPLACE INTO %s ' % self.__tablename__ +
+                 '(account_id, asset_id, amount_int, updated_block) ' +
+                 'VALUES (?, ?, ?, ?)',
+                 (account_id, asset_id, int(amount_int), updated_block))
+        self.sql_execute(query)
+
+    def setBalances(self, account_id, balances, updated_block=None):
+        """ Replace all balances of an account
+
+           :param str account_id: Account ID (1.2.X)
+           :param list balances: List of (asset_id, amount_int) tuples
+           :param int updated_block: Block number of this information
+        """
+        queries = [ ("DELETE FROM %s WHERE account_id=?" % self.__tablename__,
+                     (account_id, )) ]
+        for asset_id, amount_int in balances:
+            queries.append(
+                ('INSERT INTO %s ' % self.__tablename__ +
+                 '(account_id, asset_id, amount_int, updated_block) ' +
+                 'VALUES (?, ?, ?, ?)',
+                 (account_id, asset_id, int(amount_int), updated_block)) )
+        self.sql_batch(queries)
+
+    def migrateFrom(self, accounts, assets):
+        """ Import legacy `balances_json` ({symbol: float}) blobs,
+            then clear them, so this happens once. Accounts which
+            already have rows here are left alone, balances in
+            assets we know nothing about are skipped (they are
+            fetched again once online).
+
+           :param Accounts accounts: Account storage to read from
+           :param Assets assets: Asset storage to resolve symbols
+        """
+        query = ("SELECT account_id, balances_json FROM %s " % accounts.__tablename__ +
+                 "WHERE balances_json IS NOT NULL", )
+        rows = accounts.sql_fetchall(query)
+        if not rows:
+            return
+        query = ("SELECT DISTINCT account_id FROM %s" % self.__tablename__, )
+        migrated = set(x[0] for x in self.sql_fetchall(query))
+        for account_id, balances_json in rows:
+            if not account_id or account_id in migrated:
+                continue
+            balances = [ ]
+            for symbol, value in unpack_json(balances_json).items():
+                asset = assets.getBySymbol(symbol)
+                if not asset:
+                    continue
+                amount_int = int(round(float(value) * 10 ** int(asset["precision"])))
+                balances.append( (asset["id"], amount_int) )
+            self.setBalances(account_id, balances)
+        query = ("UPDATE %s SET balances_json=NULL " % accounts.__tablename__ +
+                 "WHERE balances_json IS NOT NULL", )
+        accounts.sql_execute(query)
+
+    def delete(self, account_id):
+        """ Delete all balances of `account_id`
+        """
+        query = ("DELETE FROM %s " % (self.__tablename__) +
+                 "WHERE account_id=?",
+                 (account_id, ))
+        self.sql_execute(query)
+
+    def wipe(self):
+        """ Delete ALL entries
+        """
+        query = ("DELETE FROM %s " % (self.__tablename__),)
+        self.sql_execute(query)
+
+
 class Label(DataDir):
     """ This is the account storage that stores account names,
         and optional public keys (for cache sake)
@@ -204,19 +856,438 @@ class Label(DataDir):
 
 
 
+class Transactions(DataDir):
+    """ This is the transaction storage that stores full signed
+        transactions, addressed by their position in the chain
+        (block_num, trx_in_block), in the `transactions` table.
+
+        A transaction is stored once, no matter how many `history`
+        rows (several ops, several of our accounts) refer to it.
+    """
+    __tablename__ = 'transactions'
+    __columns__ = [ 'id', 'block_num', 'trx_in_block', 'trxid', 'trxfull' ]
+    __packed__ = [ 'trxfull' ]
+    # `size` is the unpacked length of `trxfull`, so a fuller copy of
+    # a transaction can replace a partial one without unpacking it
+
+    def __init__(self, *args, **kwargs):
+        super(Transactions, self).__init__(*args, **kwargs)
+
+    def create_table(self):
+        """ Create the new table in the SQLite database
+        """
+        query = ('CREATE TABLE %s (' % self.__tablename__ +
+                 'id INTEGER PRIMARY KEY AUTOINCREMENT,' +
+                 'block_num INTEGER,' +
+                 'trx_in_block INTEGER,' +
+                 'trxid STRING(256),' +
+                 'trxfull TEXT,' +
+                 'stored INTEGER,' +
+                 'size INTEGER' +
+                 ')', )
+        self.sql_execute(query)
+        query = ('CREATE UNIQUE INDEX %s_position ON %s ' % (self.__tablename__, self.__tablename__) +
+                 '(block_num, trx_in_block)', )
+        self.sql_execute(query)
+
+    def upgrade_table(self):
+        """ Add `stored` (unix time a transaction was cached) column
+            missing from older wallets, counting from now
+        """
+        query = ("PRAGMA table_info(%s)" % self.__tablename__, )
+        columns = [ row[1] for row in self.sql_fetchall(query) ]
+        if not('stored' in columns):
+            query = ("ALTER TABLE %s ADD COLUMN stored INTEGER" % self.__tablename__, )
+            self.sql_execute(query)
+            query = ("UPDATE %s SET stored = ?" % self.__tablename__, (int(time.time()), ))
+            self.sql_execute(query)
+        if not('size' in columns):
+            query = ("ALTER TABLE %s ADD COLUMN size INTEGER" % self.__tablename__, )
+            self.sql_execute(query)
+            # compressed ones stay unknown, and get replaced on next add
+            query = ("UPDATE %s SET size = length(trxfull) " % self.__tablename__ +
+                     "WHERE typeof(trxfull) = 'text'", )
+            self.sql_execute(query)
+
+    def getEntry(self, block_num, trx_in_block):
+        """ Returns transaction stored at given chain position
+        """
+        query = ("SELECT " +
+            (",".join(self.__columns__)) +
+            (" FROM %s " % self.__tablename__) +
+            "WHERE block_num=? AND trx_in_block=?",
+            (block_num, trx_in_block, )
+        )
+        row = self.sql_fetchone(query)
+        if not row:
+            return None
+        entry = self.sql_todict(self.__columns__, [row])[0]
+        entry['trxfull'] = unpack_text(entry['trxfull'])
+        return entry
+
+    def getMany(self, positions):
+        """ Returns a dict of (block_num, trx_in_block) => (full
+            transaction JSON text, trxid), for those of `positions`
+            we have
+        """
+        positions = set(positions)
+        blocks = sorted(set(block_num for block_num, trx_in_block in positions))
+        found = { }
+        for j in range(0, len(blocks), 500):
+            chunk = blocks[j:j+500]
+            query = ("SELECT block_num, trx_in_block, trxfull, trxid FROM %s " % self.__tablename__ +
+                     "WHERE block_num IN (%s)" % ",".join("?" * len(chunk)),
+                     tuple(chunk))
+            for block_num, trx_in_block, trxfull, trxid in self.sql_fetchall(query):
+                if (block_num, trx_in_block) in positions:
+                    found[(block_num, trx_in_block)] = (unpack_text(trxfull), trxid)
+        return found
+
+    def add(self, block_num, trx_in_block, trxid, trxfull):
+        """ Add a transaction. If one is already stored at that
+            position, it is replaced only if `trxfull` is fuller
+            (longer) or brings the missing `trxid`.
+
+           :param int block_num: Block number
+           :param int trx_in_block: Transaction position inside the block
+           :param str trxid: Transaction id
+           :param str trxfull: Full transaction JSON
+        """
+        size = len(trxfull) if trxfull else 0
+        packed = pack_text(trxfull)
+        insert = ('INSERT OR IGNORE INTO %s ' % self.__tablename__ +
+                  '(block_num, trx_in_block, trxid, trxfull, stored, size) ' +
+                  'VALUES (?, ?, ?, ?, ?, ?)',
+                  (block_num, trx_in_block, trxid, packed, int(time.time()), size))
+        upgrade = ('UPDATE %s ' % self.__tablename__ +
+                   'SET trxid = COALESCE(?, trxid), trxfull = ?, size = ? ' +
+                   'WHERE block_num = ? AND trx_in_block = ? ' +
+                   'AND (COALESCE(size, 0) < ? OR (trxid IS NULL AND ? IS NOT NULL))',
+                   (trxid, packed, size, block_num, trx_in_block, size, trxid))
+        self.sql_batch([ insert, upgrade ])
+
+    def prune(self, history, days=0, rows=0):
+        """ Drop full transactions no longer worth keeping, all in SQL.
+            A transaction survives if it was cached less than `days`
+            days ago AND at least one `history` row referencing it is
+            among the `rows` most recent rows of its account (0
+            disables either rule). Unreferenced ones are dropped.
+            Returns number of deleted transactions.
+
+           :param History history: History storage referencing us
+           :param int days: Maximum age in days
+           :param int rows: Maximum number of rows per account
+        """
+        keep = ("EXISTS (SELECT 1 FROM %s h " % history.__tablename__ +
+                "LEFT JOIN temp.prune_cut c ON c.account = h.account " +
+                "WHERE h.block_num = t.block_num AND h.trx_in_block = t.trx_in_block " +
+                "AND h.op_seq >= COALESCE(c.seq, h.op_seq))")
+        params = ( )
+        if days:
+            keep += " AND t.stored >= ?"
+            params = (int(time.time()) - days * 24 * 3600, )
+
+        def run(connection, progress=None):
+            cursor = connection.cursor()
+            cursor.execute("CREATE TEMP TABLE IF NOT EXISTS prune_cut " +
+                           "(account STRING(256) PRIMARY KEY, seq INTEGER)")
+            cursor.execute("DELETE FROM temp.prune_cut")
+            if rows:
+                # op_seq of the `rows`-th newest entry of each account,
+                # walking the (account, op_seq) index
+                cursor.execute("INSERT INTO temp.prune_cut (account, seq) " +
+                    "SELECT a.account, (SELECT op_seq FROM %s h " % history.__tablename__ +
+                    "WHERE h.account = a.account ORDER BY op_seq DESC LIMIT 1 OFFSET ?) " +
+                    "FROM (SELECT DISTINCT account FROM %s) a" % history.__tablename__,
+                    (rows - 1, ))
+            cursor.execute("DELETE FROM %s WHERE id IN " % self.__tablename__ +
+                           "(SELECT id FROM %s t WHERE NOT (%s))" % (self.__tablename__, keep),
+                           params)
+            deleted = cursor.rowcount
+            cursor.execute("DROP TABLE temp.prune_cut")
+            connection.commit()
+            return deleted
+
+        if self.writer:
+            return self.writer.call(run)
+        connection = sqlite3.connect(self.sqlDataBaseFile)
+        try:
+            return run(connection)
+        finally:
+            connection.close()
+
+    def migrateFrom(self, history):
+        """ Move full transactions out of `history` rows,
+            storing each distinct transaction once.
+
+           :param History history: History storage to dedupe
+        """
+        query = ('INSERT OR IGNORE INTO %s ' % self.__tablename__ +
+                 '(block_num, trx_in_block, trxid, trxfull, stored, size) ' +
+                 "SELECT block_num, trx_in_block, trxid, trxfull, CAST(strftime('%s', 'now') AS INTEGER), " +
+                 "CASE typeof(trxfull) WHEN 'text' THEN length(trxfull) END " +
+                 'FROM %s ' % history.__tablename__ +
+                 "WHERE trxfull IS NOT NULL AND trxfull != '' AND trxfull != '{}' " +
+                 'ORDER BY id', )
+        self.sql_execute(query)
+        query = ('UPDATE %s SET trxfull=NULL ' % history.__tablename__ +
+                 'WHERE trxfull IS NOT NULL', )
+        self.sql_execute(query)
+
+    def wipe(self):
+        """ Delete ALL entries
+        """
+        query = ("DELETE FROM %s " % (self.__tablename__),)
+        self.sql_execute(query)
+
+
+class HistorySearch(DataDir):
+    """ Full-text index over `history` rows (FTS5), covering
+        descriptions, counterparty names, operation type and,
+        optionally, memo text. Rows point back at `history`
+        via (account, op_index).
+    """
+    __tablename__ = 'history_fts'
+    __columns__ = [ 'account', 'op_index', 'description', 'counterparties', 'optype', 'memo' ]
+
+    def __init__(self, *args, **kwargs):
+        super(HistorySearch, self).__init__(*args, **kwargs)
+
+    def create_table(self):
+        """ Create the virtual table. Returns False if this SQLite
+            build has no FTS5 support.
+        """
+        query = ('CREATE VIRTUAL TABLE %s USING fts5(' % self.__tablename__ +
+                 'account UNINDEXED,' +
+                 'op_index UNINDEXED,' +
+                 'description,' +
+                 'counterparties,' +
+                 'optype,' +
+                 'memo' +
+                 ')', )
+        try:
+            super(HistorySearch, self).sql_execute(query)
+        except sqlite3.OperationalError as error:
+            log.warning("Full-text search unavailable: %s" % str(error))
+            return False
+        return True
+
+    def insertQuery(self, account, op_index, description, counterparties, optype, memo, after_insert=False):
+        """ Returns (query, params) indexing a history row. With
+            `after_insert` set, the row is only indexed if the
+            previous statement actually inserted something.
+        """
+        query = ('INSERT INTO %s ' % self.__tablename__ +
+                 '(account, op_index, description, counterparties, optype, memo) ' +
+                 'SELECT ?, ?, ?, ?, ?, ?' +
+                 (' WHERE changes() > 0' if after_insert else ''),
+                 (account, op_index, description, counterparties, optype, memo))
+        return query
+
+    def migrateFrom(self, history):
+        """ Index all existing `history` rows
+
+           :param History history: History storage to index
+        """
+        from bitsharesbase.operations import getOperationNameForId
+        query = ("SELECT account, op_index, description, operation " +
+                 "FROM %s" % history.__tablename__, )
+        rows = [ ]
+        for account, op_index, description, operation in history.sql_fetchall(query):
+            try:
+                optype = getOperationNameForId(json.loads(operation)["op"][0])
+            except:
+                optype = ""
+            rows.append( (account, op_index, description, "", optype, None) )
+        if rows:
+            self.sql_executemany(
+                'INSERT INTO %s ' % self.__tablename__ +
+                '(account, op_index, description, counterparties, optype, memo) ' +
+                'VALUES (?, ?, ?, ?, ?, ?)', rows)
+
+    @staticmethod
+    def matchExpression(text):
+        """ Turn free user input into a safe FTS5 expression:
+            every word must match, as a prefix
+        """
+        words = re.findall(r"\w+", text, re.UNICODE)
+        return " ".join('"%s"*' % w for w in words)
+
+    def wipe(self):
+        """ Delete ALL entries
+        """
+        query = ("DELETE FROM %s " % (self.__tablename__),)
+        self.sql_execute(query)
+
+
+class HistoryCheckpoints(DataDir):
+    """ Progress of history synchronization, one row per account in
+        the `history_checkpoints` table. While a row exists, history
+        of the account has a gap: operations with sequence numbers
+        between `stop` (newest op stored before the sync started) and
+        `cursor` (everything from it up to `top` is stored) are
+        still missing.
+    """
+    __tablename__ = 'history_checkpoints'
+    __columns__ = [ "account", "top", "cursor", "stop", "synced", "updated" ]
+
+    def __init__(self, *args, **kwargs):
+        super(HistoryCheckpoints, self).__init__(*args, **kwargs)
+
+    def create_table(self):
+        """ Create the new table in the SQLite database
+        """
+        query = ('CREATE TABLE %s (' % self.__tablename__ +
+                 'id INTEGER PRIMARY KEY AUTOINCREMENT,' +
+                 'account STRING(256) UNIQUE,' +
+                 'top INTEGER,' +
+                 'cursor INTEGER,' +
+                 'stop INTEGER,' +
+                 'synced INTEGER,' +
+                 'updated INTEGER' +
+                 ')', )
+        self.sql_execute(query)
+
+    def getCheckpoint(self, account_name):
+        """ Returns checkpoint dict of account, or None
+        """
+        query = ("SELECT %s FROM %s " % (",".join(self.__columns__), self.__tablename__) +
+                 "WHERE account=?",
+                 (account_name, ))
+        row = self.sql_fetchone(query)
+        if not row:
+            return None
+        return self.sql_todict(self.__columns__, [row])[0]
+
+    def getAccounts(self):
+        """ Returns names of all accounts with unfinished sync
+        """
+        query = ("SELECT account FROM %s ORDER BY updated" % self.__tablename__, )
+        return [ x[0] for x in self.sql_fetchall(query) ]
+
+    def setCheckpoint(self, account_name, top, cursor, stop, synced=0):
+        """ Record sync progress of account
+
+           :param int top: Sequence number of newest op being synced
+           :param int cursor: Sequence number of oldest op stored so far
+           :param int stop: Sequence number of newest op stored before
+           :param int synced: Number of ops stored so far
+        """
+        query = ('INSERT OR REPLACE INTO %s ' % self.__tablename__ +
+                 '(account, top, cursor, stop, synced, updated) ' +
+                 'VALUES (?, ?, ?, ?, ?, ?)',
+                 (account_name, top, cursor, stop, synced, int(time.time())))
+        self.sql_execute(query)
+
+    def clear(self, account_name):
+        """ Forget checkpoint of account (sync has finished)
+        """
+        query = ("DELETE FROM %s WHERE account=?" % self.__tablename__,
+                 (account_name, ))
+        self.sql_execute(query)
+
+    def wipe(self):
+        """ Delete ALL entries
+        """
+        query = ("DELETE FROM %s " % (self.__tablename__),)
+        self.sql_execute(query)
+
+
+_LAZY = object() # not decoded yet
+
+class HistoryRecord(object):
+    """ One history entry, as returned by `History.getRecord`. Plain
+        columns are attributes, JSON ones are decoded on first access
+        and kept: `op` ([op_id, data]), `result`, `info` (details:
+        short, plus, minus, icon) and `transaction` (full transaction
+        dict, or None). Built from a subset of `columns`, attributes
+        of the others are None.
+    """
+    __slots__ = [
+        "id", "account", "description", "op_index",
+        "operation", "memo", "block_num", "trx_in_block",
+        "op_in_trx", "virtual_op", "trxid", "details", "date",
+        "op_seq", "_trxfull", "_operation", "_info", "_transaction" ]
+
+    def __init__(self, row, columns=None):
+        if columns:
+            for slot in self.__slots__:
+                setattr(self, slot, None)
+        for col, value in zip(columns or History.__columns__, row):
+            setattr(self, "_trxfull" if col == "trxfull" else col, value)
+        self._operation = self._info = self._transaction = _LAZY
+
+    def _decoded(self):
+        if self._operation is _LAZY:
+            self._operation = json.loads(self.operation) if self.operation else { }
+        return self._operation
+
+    @property
+    def op(self):
+        return self._decoded().get("op", [ None, { } ])
+
+    @property
+    def result(self):
+        return self._decoded().get("result", None)
+
+    @property
+    def info(self):
+        if self._info is _LAZY:
+            info = { "short": self.description, "plus": "", "minus": "", "icon": None }
+            if self.details:
+                info.update(json.loads(self.details))
+            self._info = info
+        return self._info
+
+    @property
+    def trxfull(self):
+        """ Full transaction JSON text (kept packed, unpacked every time) """
+        return unpack_text(self._trxfull) if self._trxfull else None
+
+    @property
+    def transaction(self):
+        if self._transaction is _LAZY:
+            text = self.trxfull
+            self._transaction = json.loads(text) if text and text != '{}' else None
+        return self._transaction
+
+
 class History(DataDir):
-    """ This is the account storage that stores account names,
-        and optional public keys (for cache sake)
-        in the `accounts` table in the SQLite3 database.
+    """ This is the history storage that stores account operations,
+        their descriptions and references to full transactions
+        in the `history` table in the SQLite3 database.
     """
     __tablename__ = 'history'
     __columns__ = [
         "id", "account", "description", "op_index",
         "operation", "memo", "block_num", "trx_in_block",
-        "op_in_trx", "virtual_op", "trxid", "trxfull", "details", "date" ]
+        "op_in_trx", "virtual_op", "trxid", "trxfull", "details", "date",
+        "op_seq" ]
+    # Just enough to list an entry, see `getPage`
+    __listing__ = [
+        "account", "op_index", "op_seq", "date", "description",
+        "details", "memo" ]
 
     def __init__(self, *args, **kwargs):
         super(History, self).__init__(*args, **kwargs)
+        self.trxStorage = Transactions(*args, **kwargs)
+        self.searchStorage = HistorySearch(*args, **kwargs)
+        self.checkpointStorage = HistoryCheckpoints(*args, **kwargs)
+        self.searchable = False
+
+    def _select(self):
+        """ SELECT clause, which joins full transactions back in
+        """
+        trx_table = self.trxStorage.__tablename__
+        columns = [ ]
+        for col in self.__columns__:
+            if col == "trxfull":
+                columns.append("COALESCE(t.trxfull, h.trxfull)")
+            else:
+                columns.append("h." + col)
+        return ("SELECT " + (",".join(columns)) +
+            (" FROM %s h LEFT JOIN %s t " % (self.__tablename__, trx_table)) +
+            "ON t.block_num=h.block_num AND t.trx_in_block=h.trx_in_block ")
 
     def create_table(self):
         """ Create the new table in the SQLite database
@@ -237,23 +1308,121 @@ class History(DataDir):
                  'trxfull TEXT,' +
 
                  'details TEXT,' +
-                 'date TEXT'
+                 'date TEXT,' +
+                 'op_seq INTEGER'
                  ')', )
         self.sql_execute(query)
+        self.upgrade_table()
+
+    def upgrade_table(self):
+        """ Add `op_seq` column and indexes missing from older wallets
+        """
+        query = ("PRAGMA table_info(%s)" % self.__tablename__, )
+        columns = [ row[1] for row in self.sql_fetchall(query) ]
+        if not('op_seq' in columns):
+            query = ("ALTER TABLE %s ADD COLUMN op_seq INTEGER" % self.__tablename__, )
+            self.sql_execute(query)
+            query = ("UPDATE %s SET op_seq = CAST(substr(op_index,6) AS INTEGER)" % self.__tablename__, )
+            self.sql_execute(query)
+        query = ('CREATE INDEX IF NOT EXISTS %s_account_seq ON %s ' % (self.__tablename__, self.__tablename__) +
+                 '(account, op_seq)', )
+        self.sql_execute(query)
+        query = ('CREATE UNIQUE INDEX IF NOT EXISTS %s_account_op ON %s ' % (self.__tablename__, self.__tablename__) +
+                 '(account, op_index)', )
+        self.sql_execute(query)
+        query = ('CREATE INDEX IF NOT EXISTS %s_position ON %s ' % (self.__tablename__, self.__tablename__) +
+                 '(block_num, trx_in_block)', )
+        self.sql_execute(query)
+
+    @staticmethod
+    def opSequence(op_index):
+        """ Returns instance number of "1.11.X" operation id, or None
+        """
+        try:
+            return int(op_index.split(".")[2])
+        except (AttributeError, IndexError, ValueError):
+            return None
 
     def getEntries(self, account_name):
         """ Returns all entries stored in the database
         """
-        query = (("SELECT * from %s " % self.__tablename__) +
-            "WHERE account=? ORDER BY CAST(substr(op_index,6) as INTEGER) DESC ",
+        query = (self._select() +
+            "WHERE h.account=? ORDER BY h.op_seq DESC ",
             (account_name,)
         )
         rows = self.sql_fetchall(query)
-        return self.sql_todict(self.__columns__, rows)
+        return self._todict(rows)
+
+    def getPage(self, account_name, limit=500, before_seq=None, after_seq=None):
+        """ Returns up to `limit` entries of account, newest first,
+            older than `before_seq` and/or newer than `after_seq`, as
+            tuples of `__listing__` columns (no full transactions).
+        """
+        sql = ("SELECT " + ",".join(self.__listing__) +
+               " FROM %s WHERE account=? " % self.__tablename__)
+        params = [ account_name ]
+        if before_seq is not None:
+            sql += "AND op_seq<? "
+            params.append(before_seq)
+        if after_seq is not None:
+            sql += "AND op_seq>? "
+            params.append(after_seq)
+        sql += "ORDER BY op_seq DESC"
+        if limit:
+            sql += " LIMIT ?"
+            params.append(int(limit))
+        return self.sql_fetchall( (sql, tuple(params)) )
+
+    def countEntries(self, account_name, since_seq=None):
+        """ Returns number of entries of account, optionally only
+            those with `op_seq` >= `since_seq`
+        """
+        sql = "SELECT COUNT(*) FROM %s WHERE account=? " % self.__tablename__
+        params = [ account_name ]
+        if since_seq is not None:
+            sql += "AND op_seq>=?"
+            params.append(since_seq)
+        return self.sql_fetchone( (sql, tuple(params)) )[0]
+
+    def search(self, text, account_name=None, limit=100, offset=0, listing=False):
+        """ Returns entries matching `text`, best matches first.
+            Searches all accounts if `account_name` is None.
+            Falls back to a (slow) LIKE scan without FTS5.
+            With `listing`, returns tuples like `getPage` does.
+        """
+        params = [ ]
+        if listing:
+            select = ("SELECT " + ",".join("h." + col for col in self.__listing__) +
+                " FROM %s h " % self.__tablename__)
+        else:
+            select = self._select()
+        if self.searchable:
+            expr = self.searchStorage.matchExpression(text)
+            if not expr:
+                return [ ]
+            sql = (select +
+                ("JOIN %s f " % self.searchStorage.__tablename__) +
+                "ON f.account=h.account AND f.op_index=h.op_index " +
+                ("WHERE f.%s MATCH ? " % self.searchStorage.__tablename__))
+            params.append(expr)
+            order = "ORDER BY f.rank "
+        else:
+            sql = select + "WHERE h.description LIKE ? "
+            params.append("%" + text + "%")
+            order = "ORDER BY h.id DESC "
+        if account_name:
+            sql += "AND h.account=? "
+            params.append(account_name)
+        sql += order + "LIMIT ? OFFSET ?"
+        params += [ int(limit), int(offset) ]
+        rows = self.sql_fetchall( (sql, tuple(params)) )
+        if listing:
+            return rows
+        return self._todict(rows)
 
     def getLastOperation(self, account_name):
         query = (("SELECT op_index from %s " % self.__tablename__) +
-            "WHERE account=? ORDER BY CAST(substr(op_index,6) as INTEGER) DESC LIMIT 1",
+            "WHERE account=? ORDER BY op_seq DESC LIMIT 1",
             (account_name,)
         )
         op = self.sql_fetchone(query)
@@ -262,15 +1431,39 @@ class History(DataDir):
         return op[0]
 
     def getEntry(self, op_index, account_name):
-        query = (("SELECT * from %s " % self.__tablename__) +
-            "WHERE op_index=? AND account=?",
+        query = (self._select() +
+            "WHERE h.op_index=? AND h.account=?",
             (op_index,account_name,)
         )
         row = self.sql_fetchone(query)
         if not row:
             return None
-        return self.sql_todict(self.__columns__, [row])[0]
+        return self._todict([row])[0]
+
+    def getRecord(self, op_index, account_name):
+        """ Returns entry as `HistoryRecord`, or None
+        """
+        query = (self._select() +
+            "WHERE h.op_index=? AND h.account=?",
+            (op_index,account_name,)
+        )
+        row = self.sql_fetchone(query)
+        if not row:
+            return None
+        return HistoryRecord(row)
+
+    def getRecords(self, account_name):
+        """ Returns all entries of account as (listing only)
+            `HistoryRecord`s, newest first
+        """
+        return [ HistoryRecord(row, self.__listing__)
+                 for row in self.getPage(account_name, None) ]
 
+    def _todict(self, rows):
+        entries = self.sql_todict(self.__columns__, rows)
+        for entry in entries:
+            entry['trxfull'] = unpack_text(entry['trxfull'])
+        return entries
 
     def updateEntryMemo(self, id, memo):
         """ Change the memo of an entry
@@ -298,27 +1491,38 @@ class History(DataDir):
     def add(self, account, description,
             op_index, operation, memo,
             block_num, trx_in_block, op_in_trx, virtual_op,
-            trxid, trxfull, details):
-        """ Add an entry
+            trxid, trxfull, details, date=None,
+            counterparties="", optype="", memo_text=None):
+        """ Add an entry, unless it is already stored
 
            :param str account_name: Account name
            :param str description: Short description
+           :param str date: Date, defaults to current time
+           :param str counterparties: Names to index for search
+           :param str optype: Operation name to index for search
+           :param str memo_text: Decrypted memo to index for search
         """
-        if self.getEntry(op_index, account):
-            raise ValueError("Entry already in storage")
+        if trxfull and trxfull != '{}':
+            self.trxStorage.add(block_num, trx_in_block, trxid, trxfull)
+        trxfull = None
 
-        query = ('INSERT INTO %s (' % self.__tablename__ +
+        query = ('INSERT OR IGNORE INTO %s (' % self.__tablename__ +
                 'account, description,'+
                 'op_index, operation, memo,'+
                 'block_num, trx_in_block, op_in_trx, virtual_op,'+
-                'trxid, trxfull, details, date'+
+                'trxid, trxfull, details, date, op_seq'+
                 ') '  +
-           'VALUES (?,?,  ?,?,?,  ?,?,?,?,  ?,?,?,datetime(CURRENT_TIMESTAMP) )',
+           'VALUES (?,?,  ?,?,?,  ?,?,?,?,  ?,?,?,COALESCE(?, datetime(CURRENT_TIMESTAMP)), ? )',
            (account, description,
             op_index, operation, memo,
             block_num, trx_in_block, op_in_trx, virtual_op,
-            trxid, trxfull, details))
-        self.sql_execute(query)
+            trxid, trxfull, details, date, self.opSequence(op_index)))
+        if not self.searchable:
+            self.sql_execute(query)
+            return
+        self.sql_batch([ query, self.searchStorage.insertQuery(
+            account, op_index, description, counterparties, optype, memo_text,
+            after_insert=True) ])
 
     def delete(self, id):
         """ Delete the record identified by `id`
@@ -335,6 +1539,10 @@ class History(DataDir):
         """
         query = ("DELETE FROM %s " % (self.__tablename__),)
         self.sql_execute(query)
+        self.trxStorage.wipe()
+        self.checkpointStorage.wipe()
+        if self.searchable:
+            self.searchStorage.wipe()
 
 
 class ExternalHistory(DataDir):
@@ -348,6 +1556,7 @@ class ExternalHistory(DataDir):
         "inputcointype", "outputcointype", "outputaddress",
         "receipt_json", "remote_json", "coindata_json", "walletdata_json",
         "creationdate" ]
+    __packed__ = [ "remote_json" ]
 
     def __init__(self, *args, **kwargs):
         super(ExternalHistory, self).__init__(*args, **kwargs)
@@ -382,7 +1591,7 @@ class ExternalHistory(DataDir):
             ,
         )
         rows = self.sql_fetchall(query)
-        return self.sql_todict(self.__columns__, rows)
+        return self._todict(rows)
 
 
     def getEntries(self, account_name):
@@ -395,7 +1604,7 @@ class ExternalHistory(DataDir):
             (account_name,)
         )
         rows = self.sql_fetchall(query)
-        return self.sql_todict(self.__columns__, rows)
+        return self._todict(rows)
 
     def getEntry(self, id, key="gatewayid"):
         if key not in self.__columns__:
@@ -407,7 +1616,14 @@ class ExternalHistory(DataDir):
             (id,)
         )
         row = self.sql_fetchone(query)
-        return self.sql_todict(self.__columns__, [row])[0]
+        return self._todict([row])[0]
+
+    def _todict(self, rows):
+        entries = self.sql_todict(self.__columns__, rows)
+        for entry in entries:
+            for key in self.__packed__:
+                entry[key] = unpack_text(entry[key])
+        return entries
 
     def updateEntry(self, id, key, val):
         """ Change the memo of an entry
@@ -418,6 +1634,8 @@ class ExternalHistory(DataDir):
         """
         if key not in self.__columns__:
             raise ValueError("%s not in columns" % key)
+        if key in self.__packed__:
+            val = pack_text(val)
         query = ("UPDATE %s " % self.__tablename__ +
                  "SET %s=? WHERE id=?" % key ,
                  (val, id))
@@ -530,18 +1748,125 @@ class Remotes(DataDir):
         self.sql_execute(query)
 
 
+def split_asset_data(graphene_json):
+    """ Split an asset into its static definition and a list of
+        `AssetData` rows (object_id, asset_id, kind, graphene_json)
+        for the embedded dynamic/bitasset objects
+    """
+    static = dict(graphene_json)
+    parts = [ ]
+    for kind, (id_key, data_key) in ASSET_DATA_KEYS.items():
+        data = static.pop(data_key, None)
+        if data and static.get(id_key):
+            parts.append( (static[id_key], static["id"], kind, data) )
+    return static, parts
+
+
+def asset_display_name(graphene_json):
+    """ Human-readable asset name, taken from the JSON-encoded
+        description, if any
+    """
+    try:
+        desc = graphene_json['options']['description']
+    except (KeyError, TypeError):
+        return ""
+    string = str(desc)
+    try:
+        parsed = json.loads(desc)
+        if 'main' in parsed and parsed['main']:
+            string = parsed['main']
+        elif 'short_name' in parsed:
+            string = parsed['short_name']
+        else:
+            string = ""
+    except:
+        pass
+    return string
+
+
 class Assets(DataDir):
     """ This is the asset storage that stores asset names,
         ids, issuer_ids, and related graphene json data
         in the `assets` table in the SQLite3 database.
+
+        Symbol lookups (`searchSymbols`) are served from an
+        in-memory sorted index, built on first use.
+
+        With an `AssetCatalog` attached, reads also see the shared
+        catalog, with rows of our own table taking precedence
+        (per-wallet overrides), and `save` writes to the catalog.
+
+        With an `AssetData` storage set as `dataStorage`, `saveMany`
+        keeps only the static definition here and hands dynamic and
+        bitasset data over to it; `getById` merges them back in.
     """
     __tablename__ = 'assets'
+    __packed__ = [ 'graphene_json' ]
+    __catalogcolumns__ = "symbol, asset_id, issuer_id, graphene_json, display_name"
 
     def __init__(self, *args, **kwargs ):
         super(Assets, self).__init__(*args, **kwargs)
         self.symbols_to_ids = { }
         self.ids_to_symbols = { }
         self.loaded_assets = { }
+        self._index_lock = threading.Lock()
+        self._index_rows = None # symbol => (symbol, asset_id, display_name)
+        self._index_symbols = None # sorted symbols
+        self._index_suffixes = None # sorted (part after dot, symbol)
+        self.catalogStorage = None
+        self.dataStorage = None
+        self._catalog_local = threading.local() # per-thread connection
+        # Called with ids/symbols of changed assets (none if all
+        # may have changed), e.g. to drop them from memory caches
+        self.listeners = [ ]
+
+    def attachCatalog(self, catalog):
+        """ Use `catalog` (AssetCatalog or None) as fallback storage
+        """
+        self.catalogStorage = catalog
+        self._catalog_local = threading.local() # drop old connections
+        self._index_drop()
+
+    def _source(self):
+        """ Table expression to read assets from
+        """
+        if not self.catalogStorage:
+            return self.__tablename__
+        return ("(SELECT %s FROM main.%s UNION ALL " % (self.__catalogcolumns__, self.__tablename__) +
+                "SELECT %s FROM catalog.%s c WHERE NOT EXISTS " % (self.__catalogcolumns__, self.catalogStorage.__tablename__) +
+                "(SELECT 1 FROM main.%s m WHERE m.asset_id = c.asset_id))" % self.__tablename__)
+
+    def _catalog_connection(self):
+        """ Connection of the calling thread with the catalog
+            attached, opened on first use
+        """
+        local = self._catalog_local
+        connection = getattr(local, "connection", None)
+        if connection is None:
+            uri = "file:%s?mode=ro" % urllib.parse.quote(
+                os.path.abspath(self.catalogStorage.sqlDataBaseFile))
+            connection = sqlite3.connect(self.sqlDataBaseFile, uri=True)
+            connection.execute("ATTACH DATABASE ? AS catalog", (uri, ))
+            local.connection = connection
+        return connection
+
+    def _catalog_fetch(self, query, one):
+        self.settle()
+        cursor = self._catalog_connection().execute(*query)
+        try:
+            return cursor.fetchone() if one else cursor.fetchall()
+        finally:
+            cursor.close()
+
+    def sql_fetchone(self, query):
+        if self.catalogStorage:
+            return self._catalog_fetch(query, True)
+        return super(Assets, self).sql_fetchone(query)
+
+    def sql_fetchall(self, query):
+        if self.catalogStorage:
+            return self._catalog_fetch(query, False)
+        return super(Assets, self).sql_fetchall(query)
 
     def create_table(self):
         """ Create the new table in the SQLite database
@@ -551,9 +1876,149 @@ class Assets(DataDir):
                  'symbol STRING(256),' +
                  'asset_id STRING(256),' +
                  'issuer_id STRING(256),' +
-                 'graphene_json TEXT' +
+                 'graphene_json TEXT,' +
+                 'display_name TEXT' +
                  ')', )
         self.sql_execute(query)
+        self.upgrade_table()
+
+    def upgrade_table(self):
+        """ Add `display_name` column and indexes to older wallets
+        """
+        query = ('CREATE INDEX IF NOT EXISTS %s_asset_id ON %s (asset_id)' % (self.__tablename__, self.__tablename__), )
+        self.sql_execute(query)
+        query = ('CREATE INDEX IF NOT EXISTS %s_symbol ON %s (symbol)' % (self.__tablename__, self.__tablename__), )
+        self.sql_execute(query)
+        query = ("PRAGMA table_info(%s)" % self.__tablename__, )
+        columns = [ row[1] for row in self.sql_fetchall(query) ]
+        if 'display_name' in columns:
+            return
+        query = ("ALTER TABLE %s ADD COLUMN display_name TEXT" % self.__tablename__, )
+        self.sql_execute(query)
+        query = ("SELECT id, graphene_json FROM %s" % self.__tablename__, )
+        rows = [ (asset_display_name(unpack_json(data)), id)
+                 for id, data in self.sql_fetchall(query) ]
+        if rows:
+            self.sql_executemany(
+                "UPDATE %s SET display_name=? WHERE id=?" % self.__tablename__, rows)
+
+    def _index(self):
+        """ Returns (rows, symbols, suffixes), (re)building them if needed
+        """
+        with self._index_lock:
+            if self._index_rows is None:
+                query = ("SELECT symbol, asset_id, display_name FROM %s" % self._source(), )
+                self._index_rows = { row[0]: (row[0], row[1], row[2] or "")
+                                     for row in self.sql_fetchall(query) }
+                self._index_symbols = None
+            if self._index_symbols is None:
+                self._index_symbols = sorted(self._index_rows.keys())
+                self._index_suffixes = sorted(
+                    (sym.split(".", 1)[1], sym)
+                    for sym in self._index_symbols if "." in sym )
+            return (self._index_rows, self._index_symbols, self._index_suffixes)
+
+    def _index_put(self, symbol, asset_id, display_name):
+        self._changed(asset_id, symbol)
+        with self._index_lock:
+            if self._index_rows is None:
+                return
+            if not(symbol in self._index_rows):
+                self._index_symbols = None
+            self._index_rows[symbol] = (symbol, asset_id, display_name)
+
+    def _index_drop(self):
+        self._changed()
+        with self._index_lock:
+            self._index_rows = None
+
+    def _changed(self, *keys):
+        """ Tell `listeners` asset(s) `keys` (ids, symbols) changed,
+            no keys meaning any asset could have
+        """
+        for listener in self.listeners:
+            listener(*keys)
+
+    def searchSymbols(self, name, limit=None):
+        """ Returns a list of (symbol, asset_id, display_name) tuples
+            for symbols starting with `name`, followed by symbols whose
+            part after the dot starts with `name`
+        """
+        name = name.upper()
+        rows, symbols, suffixes = self._index()
+        found = [ ]
+        j = bisect.bisect_left(symbols, name)
+        while j < len(symbols) and symbols[j].startswith(name):
+            found.append(symbols[j])
+            j += 1
+            if limit and len(found) >= limit:
+                return [ rows[sym] for sym in found ]
+        name = name.replace('.', '')
+        seen = set(found)
+        j = bisect.bisect_left(suffixes, (name, ))
+        while j < len(suffixes) and suffixes[j][0].startswith(name):
+            sym = suffixes[j][1]
+            if not(sym in seen):
+                found.append(sym)
+            j += 1
+            if limit and len(found) >= limit:
+                break
+        return [ rows[sym] for sym in found ]
+
+    def maxInstance(self):
+        """ Returns highest known asset instance (X of 1.3.X), or -1
+        """
+        query = ("SELECT MAX(CAST(substr(asset_id, 5) AS INTEGER)) FROM %s" % self._source(), )
+        row = self.sql_fetchone(query)
+        return int(row[0]) if row and row[0] is not None else -1
+
+    def exportSnapshot(self, path, header):
+        """ Write all assets to `path` as gzip-compressed JSON lines,
+            first line being `header` (dict, e.g. chain_id, block).
+            Returns the header written.
+        """
+        query = ("SELECT graphene_json FROM %s ORDER BY asset_id" % self._source(), )
+        rows = self.sql_fetchall(query)
+        header = dict(header, format=ASSET_SNAPSHOT_FORMAT, version=1, count=len(rows))
+        with gzip.open(path, "wt", encoding="utf-8") as f:
+            f.write(json.dumps(header) + "\n")
+            for (data, ) in rows:
+                f.write(unpack_text(data) + "\n")
+        return header
+
+    @staticmethod
+    def snapshotHeader(path):
+        """ Returns header of an asset snapshot file
+        """
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            header = json.loads(f.readline())
+        if header.get("format") != ASSET_SNAPSHOT_FORMAT:
+            raise ValueError("Not an asset snapshot")
+        return header
+
+    def importSnapshot(self, path):
+        """ Load assets from a file written by `exportSnapshot`,
+            in a single transaction. Returns the header.
+        """
+        header = self.snapshotHeader(path)
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            f.readline()
+            assets = [ ]
+            for line in f:
+                if not line.strip():
+                    continue
+                asset = json.loads(line)
+                assets.append( (asset["id"], asset["symbol"], asset) )
+        self.saveMany(assets)
+        return header
+
+    def getSymbolsByIssuer(self, issuer_id):
+        """ Returns a list of (symbol, asset_id, display_name) tuples
+        """
+        query = ("SELECT symbol, asset_id, display_name FROM %s " % (self._source()) +
+                 "WHERE issuer_id = ? ORDER BY symbol",
+                (issuer_id, ))
+        return [ (x[0], x[1], x[2] or "") for x in self.sql_fetchall(query) ]
 
     def getAssets(self, invert_keys=None):
         """ Returns all assets cached in the database
@@ -587,20 +2052,20 @@ class Assets(DataDir):
             extra += " ORDER BY symbol"
         if limit:
             extra += " LIMIT %d" % (limit)
-        query = ("SELECT graphene_json FROM %s " % (self.__tablename__) +
+        query = ("SELECT graphene_json FROM %s " % (self._source()) +
                  "WHERE symbol LIKE ? OR symbol LIKE ?" + extra,
                 (name+"%", "%."+name.replace('.',''),))
         results = self.sql_fetchall(query)
-        return [x[0] for x in results]
+        return [unpack_text(x[0]) for x in results]
 
     def getByIssuer(self, issuer_id):
         """
         """
-        query = ("SELECT graphene_json FROM %s " % (self.__tablename__) +
+        query = ("SELECT graphene_json FROM %s " % (self._source()) +
                  "WHERE issuer_id = ?",
                 (issuer_id, ))
         results = self.sql_fetchall(query)
-        return [x[0] for x in results]
+        return [unpack_text(x[0]) for x in results]
 
     def getBySymbol(self, symbol):
         """
@@ -612,11 +2077,11 @@ class Assets(DataDir):
         """
         """
         if not is_symbol:
-            query = ("SELECT graphene_json from %s " % (self.__tablename__) +
+            query = ("SELECT graphene_json from %s " % (self._source()) +
                      "WHERE asset_id=?",
                      (asset_id, ))
         else:
-            query = ("SELECT graphene_json from %s " % (self.__tablename__) +
+            query = ("SELECT graphene_json from %s " % (self._source()) +
                      "WHERE symbol=?",
                      (asset_id, ))
 
@@ -624,7 +2089,24 @@ class Assets(DataDir):
         if not row:
             return None
 
-        return json.loads(row[0])
+        asset = unpack_json(row[0])
+        if self.dataStorage:
+            for kind, (data, updated) in self.dataStorage.getByAsset(asset["id"]).items():
+                asset[ASSET_DATA_KEYS[kind][1]] = data
+        return asset
+
+    def getManyById(self, asset_ids):
+        """ Returns static definitions of those of `asset_ids` we know
+        """
+        found = [ ]
+        asset_ids = list(asset_ids)
+        for j in range(0, len(asset_ids), 500):
+            chunk = asset_ids[j:j+500]
+            query = ("SELECT graphene_json FROM %s " % (self._source()) +
+                     "WHERE asset_id IN (%s)" % ",".join("?" * len(chunk)),
+                     tuple(chunk))
+            found += [ unpack_json(x[0]) for x in self.sql_fetchall(query) ]
+        return found
 
     def add(self, asset_id, symbol, graphene_json):
         """ Add an asset
@@ -633,52 +2115,259 @@ class Assets(DataDir):
            :param str symbol: Asset Symbol
            :param dict graphene_json: Dump from blockchain
         """
-        if self.getById(asset_id):
+        # only our own rows, catalog ones can be overridden
+        query = ("SELECT 1 FROM %s WHERE asset_id=?" % self.__tablename__, (asset_id, ))
+        if super(Assets, self).sql_fetchone(query):
             raise ValueError("Asset already in storage")
         if not('issuer' in graphene_json):
             raise KeyError("Missing issuer key")
         issuer_id = graphene_json['issuer']
-        query = ('INSERT INTO %s (symbol, asset_id, issuer_id, graphene_json) ' % self.__tablename__ +
-                 'VALUES (?, ?, ?, ?)',
-                 (symbol.upper(), asset_id, issuer_id, json.dumps(graphene_json)))
+        display_name = asset_display_name(graphene_json)
+        query = ('INSERT INTO %s (symbol, asset_id, issuer_id, graphene_json, display_name) ' % self.__tablename__ +
+                 'VALUES (?, ?, ?, ?, ?)',
+                 (symbol.upper(), asset_id, issuer_id, pack_json(graphene_json), display_name))
         self.sql_execute(query)
+        self._index_put(symbol.upper(), asset_id, display_name)
 
     def countEntries(self):
-        query = (("SELECT COUNT(id) from %s " % self.__tablename__),)
+        query = (("SELECT COUNT(*) from %s " % self._source()),)
         op = self.sql_fetchone(query)
         return int(op[0])
 
+    def save(self, asset_id, symbol, graphene_json):
+        """ Add an asset or update an existing one, without
+            reading it back first
+
+           :param str asset_id: Asset ID (1.3.X)
+           :param str symbol: Asset Symbol
+           :param dict graphene_json: Dump from blockchain
+        """
+        self.saveMany([ (asset_id, symbol, graphene_json) ])
+
+    def _saveQueries(self, asset_id, symbol, graphene_json, update=True):
+        """ Returns queries updating (if `update` is set) or else
+            inserting an asset
+        """
+        if not('issuer' in graphene_json):
+            raise KeyError("Missing issuer key")
+        issuer_id = graphene_json['issuer']
+        data = pack_json(graphene_json)
+        display_name = asset_display_name(graphene_json)
+        queries = [ ]
+        if update:
+            queries.append(
+            ('UPDATE %s SET graphene_json = ?, display_name = ? ' % self.__tablename__ +
+             'WHERE asset_id = ?',
+             (data, display_name, asset_id)) )
+        queries.append(
+            ('INSERT INTO %s (symbol, asset_id, issuer_id, graphene_json, display_name) ' % self.__tablename__ +
+             'SELECT ?, ?, ?, ?, ? WHERE NOT EXISTS ' +
+             '(SELECT 1 FROM %s WHERE asset_id = ?)' % self.__tablename__,
+             (symbol.upper(), asset_id, issuer_id, data, display_name, asset_id)) )
+        return queries
+
+    def saveMany(self, assets):
+        """ Add or update many assets in one transaction. Goes to the
+            shared catalog, if one is attached.
+
+           :param list assets: List of (asset_id, symbol, graphene_json) tuples
+        """
+        store = self.catalogStorage or self
+        queries = [ ]
+        parts = [ ]
+        for asset_id, symbol, graphene_json in assets:
+            if self.dataStorage:
+                graphene_json, asset_parts = split_asset_data(graphene_json)
+                parts += asset_parts
+            queries += store._saveQueries(asset_id, symbol, graphene_json)
+        if queries:
+            store.sql_batch(queries)
+        if parts:
+            self.dataStorage.saveMany(parts)
+        for asset_id, symbol, graphene_json in assets:
+            self._index_put(symbol.upper(), asset_id, asset_display_name(graphene_json))
+
     def update(self, asset_id, graphene_json):
-        """ Add an account
+        """ Update definition of a known asset, in our own table
+            and, if one is attached, in the shared catalog (where
+            most assets live)
 
-           :param str account_name: Account name
+           :param str asset_id: Asset ID (1.3.X)
+           :param dict graphene_json: Dump from blockchain
         """
-        query = ('UPDATE %s SET graphene_json = ? ' % self.__tablename__ +
-                 'WHERE asset_id = ?',
-                 (json.dumps(graphene_json), asset_id))
-        self.sql_execute(query)
+        display_name = asset_display_name(graphene_json)
+        data = pack_json(graphene_json)
+        for store in [ self, self.catalogStorage ]:
+            if not store:
+                continue
+            query = ('UPDATE %s SET graphene_json = ?, display_name = ? ' % store.__tablename__ +
+                     'WHERE asset_id = ?',
+                     (data, display_name, asset_id))
+            store.sql_execute(query)
+        if 'symbol' in graphene_json:
+            self._index_put(graphene_json['symbol'], asset_id, display_name)
 
     def deleteBySymbol(self, symbol):
         """ Delete the record identified as `symbol`
 
            :param str symbol: Asset Symbol ('bts')
         """
-        self.sql_execute(
-            "DELETE FROM %s " % (self.__tablename__) +
-            "WHERE symbol=?",
-             (symbol.upper())
-        )
+        query = ("DELETE FROM %s " % (self.__tablename__) +
+                 "WHERE symbol=?",
+                 (symbol.upper(), ))
+        self.sql_execute(query)
+        self._index_drop()
 
     def deleteById(self, asset_id):
         """ Delete the record identified as `asset_id`
 
            :param str asset_id: Asset ID ('1.2.0')
         """
-        self.sql_execute(
-            "DELETE FROM %s " % (self.__tablename__) +
-            "WHERE asset_id=?",
-            (asset_id)
-        )
+        query = ("DELETE FROM %s " % (self.__tablename__) +
+                 "WHERE asset_id=?",
+                 (asset_id, ))
+        self.sql_execute(query)
+        self._index_drop()
+
+    def wipe(self):
+        """ Delete ALL entries
+        """
+        query = ("DELETE FROM %s " % (self.__tablename__),)
+        self.sql_execute(query)
+        if self.dataStorage:
+            self.dataStorage.wipe()
+        self._index_drop()
+
+
+class AssetCatalog(Assets):
+    """ Asset definitions shared by all wallets, in a separate
+        database in the data directory. Wallets ATTACH it read-only
+        (see `Assets.attachCatalog`), it is only written through
+        this class.
+    """
+    storageDatabaseDefault = "assets-catalog.sqlite"
+    __metatable__ = 'catalog_meta'
+    __version__ = 1
+
+    def __init__(self, path=None, *args, **kwargs):
+        super(AssetCatalog, self).__init__(path or self.preflight(), *args, **kwargs)
+
+    def exists_table(self):
+        query = ("SELECT name FROM sqlite_master WHERE type='table' AND name=?",
+                 (self.__metatable__, ))
+        return bool(self.sql_fetchone(query)) and super(AssetCatalog, self).exists_table()
+
+    def create_table(self):
+        """ Create the new tables in the SQLite database
+        """
+        for table in [ self.__tablename__, self.__metatable__ ]:
+            self.sql_execute( ("DROP TABLE IF EXISTS %s" % table, ) )
+        super(AssetCatalog, self).create_table()
+        query = ('CREATE TABLE %s (' % self.__metatable__ +
+                 'key STRING(256) PRIMARY KEY,' +
+                 'value TEXT' +
+                 ')', )
+        self.sql_execute(query)
+        self.setMeta('version', self.__version__)
+
+    def upgrade_table(self):
+        if self.exists_table() and self.getMeta('version') != str(self.__version__):
+            log.info("Asset catalog format changed, recreating")
+            self.create_table()
+            return
+        super(AssetCatalog, self).upgrade_table()
+
+    def getMeta(self, key, default=None):
+        query = ("SELECT value FROM %s WHERE key=?" % self.__metatable__, (key, ))
+        row = self.sql_fetchone(query)
+        return row[0] if row else default
+
+    def setMeta(self, key, value):
+        query = ("INSERT OR REPLACE INTO %s (key, value) VALUES (?, ?)" % self.__metatable__,
+                 (key, str(value)))
+        self.sql_execute(query)
+
+    def importFrom(self, assets):
+        """ Copy rows of a wallet's own `assets` table, unless already known
+
+           :param Assets assets: Wallet asset storage
+        """
+        query = ("SELECT asset_id, symbol, graphene_json FROM %s" % assets.__tablename__, )
+        rows = DataDir.sql_fetchall(assets, query) # own rows only
+        queries = [ ]
+        for asset_id, symbol, data in rows:
+            queries += self._saveQueries(asset_id, symbol, unpack_json(data), update=False)
+        if queries:
+            self.sql_batch(queries)
+        self._index_drop()
+
+
+class AssetData(DataDir):
+    """ This is the storage of fast-changing parts of assets,
+        `dynamic_asset_data` (2.3.X: supply, fee pool) and
+        `bitasset_data` (2.4.X: feeds, settlement), one row per
+        object with the time it was fetched, in the `asset_data`
+        table. Static definitions stay in `Assets`.
+    """
+    __tablename__ = 'asset_data'
+    __packed__ = [ 'graphene_json' ]
+
+    def __init__(self, *args, **kwargs):
+        super(AssetData, self).__init__(*args, **kwargs)
+
+    def create_table(self):
+        """ Create the new table in the SQLite database
+        """
+        query = ('CREATE TABLE %s (' % self.__tablename__ +
+                 'id INTEGER PRIMARY KEY AUTOINCREMENT,' +
+                 'object_id STRING(256) UNIQUE,' +
+                 'asset_id STRING(256),' +
+                 'kind STRING(16),' +
+                 'graphene_json TEXT,' +
+                 'updated INTEGER' +
+                 ')', )
+        self.sql_execute(query)
+        query = ('CREATE INDEX %s_asset_id ON %s (asset_id)' % (self.__tablename__, self.__tablename__), )
+        self.sql_execute(query)
+
+    def getByAsset(self, asset_id):
+        """ Returns a dict of kind => (graphene_json, updated)
+        """
+        query = ("SELECT kind, graphene_json, updated FROM %s " % self.__tablename__ +
+                 "WHERE asset_id=?",
+                 (asset_id, ))
+        return { x[0]: (unpack_json(x[1]), x[2]) for x in self.sql_fetchall(query) }
+
+    def getUpdated(self, object_ids):
+        """ Returns a dict of object_id => time it was last fetched,
+            for those of `object_ids` we have
+        """
+        found = { }
+        object_ids = list(object_ids)
+        for j in range(0, len(object_ids), 500):
+            chunk = object_ids[j:j+500]
+            query = ("SELECT object_id, updated FROM %s " % self.__tablename__ +
+                     "WHERE object_id IN (%s)" % ",".join("?" * len(chunk)),
+                     tuple(chunk))
+            for object_id, updated in self.sql_fetchall(query):
+                found[object_id] = updated
+        return found
+
+    def saveMany(self, rows, updated=None):
+        """ Insert or replace many objects in one transaction
+
+           :param list rows: List of (object_id, asset_id, kind, graphene_json) tuples
+           :param int updated: Fetch time (unix), defaults to now
+        """
+        if updated is None:
+            updated = int(time.time())
+        queries = [ ('INSERT OR REPLACE INTO %s ' % self.__tablename__ +
+                     '(object_id, asset_id, kind, graphene_json, updated) ' +
+                     'VALUES (?, ?, ?, ?, ?)',
+                     (object_id, asset_id, kind, pack_json(data), updated))
+                    for object_id, asset_id, kind, data in rows ]
+        if queries:
+            self.sql_batch(queries)
 
     def wipe(self):
         """ Delete ALL entries
@@ -688,6 +2377,7 @@ class Assets(DataDir):
 
 
 from bitshares.storage import BitsharesStorage
+from . import maintenance
 
 class BitsharesStorageExtra(BitsharesStorage):
 
@@ -707,10 +2397,74 @@ class BitsharesStorageExtra(BitsharesStorage):
         self.assetStorage = Assets(path, mustexist=not(create))
         if not self.assetStorage.exists_table() and create:
             self.assetStorage.create_table()
+        elif self.assetStorage.exists_table():
+            self.assetStorage.upgrade_table()
+
+        # Asset definitions shared between wallets
+        self.assetCatalog = None
+        try:
+            catalog = AssetCatalog()
+            if not catalog.exists_table():
+                catalog.create_table()
+            else:
+                catalog.upgrade_table()
+            self.assetCatalog = catalog
+        except Exception as error:
+            log.warning("Asset catalog unavailable: %s" % str(error))
+        if self.assetCatalog and self.assetStorage.exists_table():
+            # Only if it was checked against our chain before, see
+            # `attachCatalog`; until then, we keep to our own rows
+            chain_id = self.configStorage["assets-catalog-chain"]
+            if chain_id and chain_id == self.assetCatalog.getMeta('chain_id'):
+                self.assetStorage.attachCatalog(self.assetCatalog)
+
+        # Added in later versions, create (and migrate) on open
+        self.accountNameStorage = AccountNames(path, mustexist=not(create))
+        if not self.accountNameStorage.exists_table():
+            self.accountNameStorage.create_table()
+            if self.accountStorage.exists_table():
+                self.accountNameStorage.migrateFrom(self.accountStorage)
+
+        self.accountKeyStorage = AccountKeys(path, mustexist=not(create))
+        if not self.accountKeyStorage.exists_table():
+            self.accountKeyStorage.create_table()
+            if self.accountStorage.exists_table():
+                self.accountKeyStorage.migrateFrom(self.accountStorage)
+
+        self.assetDataStorage = AssetData(path, mustexist=not(create))
+        if not self.assetDataStorage.exists_table():
+            self.assetDataStorage.create_table()
+        self.assetStorage.dataStorage = self.assetDataStorage
 
         self.historyStorage = History(path, mustexist=not(create))
         if not self.historyStorage.exists_table() and create:
             self.historyStorage.create_table()
+        elif self.historyStorage.exists_table():
+            try:
+                self.historyStorage.upgrade_table()
+            except sqlite3.IntegrityError:
+                log.warning("Duplicate history entries, not indexing")
+
+        self.searchStorage = self.historyStorage.searchStorage
+        if self.searchStorage.exists_table():
+            self.historyStorage.searchable = True
+        elif self.historyStorage.exists_table():
+            if self.searchStorage.create_table():
+                self.historyStorage.searchable = True
+                self.searchStorage.migrateFrom(self.historyStorage)
+
+        # Added in later versions, create (and migrate) on open
+        self.transactionStorage = self.historyStorage.trxStorage
+        if not self.transactionStorage.exists_table():
+            self.transactionStorage.create_table()
+            if self.historyStorage.exists_table():
+                self.transactionStorage.migrateFrom(self.historyStorage)
+        else:
+            self.transactionStorage.upgrade_table()
+
+        self.checkpointStorage = self.historyStorage.checkpointStorage
+        if not self.checkpointStorage.exists_table():
+            self.checkpointStorage.create_table()
 
         self.remotesStorage = Remotes(path, mustexist=not(create))
         if not self.remotesStorage.exists_table() and create:
@@ -719,3 +2473,175 @@ class BitsharesStorageExtra(BitsharesStorage):
         self.gatewayStorage = ExternalHistory(path)
         if not self.gatewayStorage.exists_table() and create:
             self.gatewayStorage.create_table()
+
+        self.balanceStorage = Balances(path, mustexist=not(create))
+        if not self.balanceStorage.exists_table():
+            self.balanceStorage.create_table()
+        if self.accountStorage.exists_table() and self.assetStorage.exists_table():
+            # no-op once legacy balances are gone
+            self.balanceStorage.migrateFrom(self.accountStorage, self.assetStorage)
+
+        # From now on, writes are queued to a background thread
+        self.writer = WriteBehind(path)
+        for store in self._extraStorages():
+            store.writer = self.writer
+
+    def attachCatalog(self, chain_id):
+        """ Use the shared asset catalog, if it is for `chain_id`
+            (or for no chain yet). Our cached assets are moved to
+            it the first time. Returns True if attached.
+        """
+        catalog = self.assetCatalog
+        if not catalog or not self.assetStorage.exists_table():
+            return False
+        known = catalog.getMeta('chain_id')
+        if known is None:
+            catalog.setMeta('chain_id', chain_id)
+        elif known != chain_id:
+            self.detachCatalog()
+            return False
+        if not self.configStorage["assets-catalog-imported"]:
+            # Move our cached assets to the catalog, once
+            catalog.importFrom(self.assetStorage)
+            self.assetStorage.wipe()
+            self.configStorage["assets-catalog-imported"] = True
+        self.configStorage["assets-catalog-chain"] = chain_id
+        self.assetStorage.attachCatalog(catalog)
+        return True
+
+    def detachCatalog(self):
+        """ Stop using the shared asset catalog (e.g. it is for
+            a different chain)
+        """
+        self.assetStorage.attachCatalog(None)
+
+    def _extraStorages(self):
+        return [ self.accountStorage, self.accountNameStorage, self.accountKeyStorage,
+                 self.assetStorage, self.assetDataStorage,
+                 self.historyStorage, self.transactionStorage, self.checkpointStorage,
+                 self.searchStorage, self.remotesStorage, self.gatewayStorage,
+                 self.balanceStorage ]
+
+    def flush(self):
+        """ Wait for all queued writes to reach the disk
+        """
+        if self.writer:
+            self.writer.flush()
+
+    def close(self):
+        """ Flush queued writes and stop the writer thread.
+            Storage keeps working afterwards, synchronously.
+        """
+        if not self.writer:
+            return
+        for store in self._extraStorages():
+            store.writer = None
+        self.writer.close()
+        self.writer = None
+
+    def maintain(self, func, *args):
+        """ Run `func(connection, *args)` with the database to itself:
+            on the writer thread if there is one, queued writes wait.
+            See `bitsharesextra.maintenance` for suitable functions.
+        """
+        if self.writer:
+            return self.writer.call(
+                lambda connection, progress: func(connection, *args))
+        connection = sqlite3.connect(self.accountStorage.sqlDataBaseFile)
+        try:
+            return func(connection, *args)
+        finally:
+            connection.close()
+
+    @staticmethod
+    def snapshotTime(directory, name, prefix):
+        """ Sort key of a snapshot file: the time encoded in its name
+            (with or without the sub-second suffix), or its mtime if
+            the name does not parse.
+        """
+        m = re.match(r"(\d{8}-\d{6})(?:-(\d{6})(\d{3}))?\.sqlite\.gz$",
+                     name[len(prefix):])
+        if m:
+            return (datetime.strptime(m.group(1), timeformat),
+                    int(m.group(2) or 0), int(m.group(3) or 0))
+        mtime = os.path.getmtime(os.path.join(directory, name))
+        return (datetime.utcfromtimestamp(mtime), 0, 0)
+
+    def backup(self, keep=5, pages=256):
+        """ Take an online, gzip-compressed snapshot of the wallet
+            into the `backups/` directory next to it, keeping only
+            the `keep` most recent ones. Returns snapshot path, or
+            None if the wallet did not change since the last one.
+            Raises RuntimeError without ONLINE_BACKUP.
+        """
+        if not ONLINE_BACKUP:
+            raise RuntimeError("Online backup requires Python 3.7 or newer")
+        path = os.path.abspath(self.accountStorage.sqlDataBaseFile)
+        backupdir = os.path.join(os.path.dirname(path), "backups")
+        os.makedirs(backupdir, exist_ok=True)
+        prefix = os.path.basename(path) + "-"
+        bytime = lambda f: self.snapshotTime(backupdir, f, prefix)
+        snapshots = sorted((f for f in os.listdir(backupdir)
+                            if f.startswith(prefix) and f.endswith(".gz")), key=bytime)
+        if snapshots:
+            last = os.path.join(backupdir, snapshots[-1])
+            # in WAL mode, recent writes only touch the -wal file
+            changed = max(os.path.getmtime(f) for f in (path, path + "-wal")
+                          if os.path.exists(f))
+            if changed <= os.path.getmtime(last):
+                log.debug("%s unchanged since last backup" % path)
+                return None
+
+        started = time.time()
+        # Claim a name no other backup (even one in the same second) has
+        stamp = datetime.utcnow().strftime(timeformat + "-%f")
+        for n in range(1000):
+            name = prefix + stamp + ("%03d" % n) + ".sqlite"
+            target = os.path.join(backupdir, name)
+            try:
+                os.close(os.open(target + ".gz", os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                break
+            except FileExistsError:
+                continue
+        else:
+            raise FileExistsError("No free backup name for %s" % path)
+        try:
+            if self.writer:
+                self.writer.backup(target, pages)
+            else:
+                source = sqlite3.connect(path)
+                try:
+                    copy_database(source, target, pages)
+                finally:
+                    source.close()
+            with open(target, "rb") as src, gzip.open(target + ".gz", "wb") as dst:
+                shutil.copyfileobj(src, dst)
+        except:
+            os.remove(target + ".gz")
+            raise
+        finally:
+            if os.path.exists(target):
+                os.remove(target)
+        # Anything written after we started warrants the next backup
+        os.utime(target + ".gz", (started, started))
+
+        snapshots = sorted(set(snapshots + [ name + ".gz" ]), key=bytime)
+        for old in snapshots[:-keep] if keep else [ ]:
+            os.remove(os.path.join(backupdir, old))
+        log.info("Backed up %s to %s" % (path, target + ".gz"))
+        return target + ".gz"
+
+    def repack(self):
+        """ Re-encode all compressible columns of an existing wallet
+            and VACUUM the file. Returns (bytes_before, bytes_after).
+        """
+        path = self.accountStorage.sqlDataBaseFile
+        self.flush()
+        before = os.path.getsize(path)
+        for store in [ self.accountStorage, self.assetStorage,
+                       self.transactionStorage, self.gatewayStorage ]:
+            n = store.repack()
+            log.info("Repacked %d rows in %s" % (n, store.__tablename__))
+        self.maintain(maintenance.vacuum)
+        after = os.path.getsize(path)
+        return (before, after)
@@ -57,14 +57,34 @@ class WindowWithAssets(QtCore.QObject):
 			self.ui.assetissuerLine.setText( issuer )
 		except:
 			self.ui.assetissuerLine.setText( asset['issuer'] )
-		from pprint import pprint
-		pprint(asset)
 		self.ui.assetMaxSupply.setText( str(int(asset['options']['max_supply']) / pow(10, asset['precision'])) )
-		self.ui.assetCurrentSupply.setText( str(int(asset['dynamic_asset_data'][ "current_supply"]) / pow(10, asset['precision'])) )
-		self.ui.assetBlindSupply.setText( str(int(asset['dynamic_asset_data'][ "confidential_supply"]) / pow(10, asset['precision'])) )
-		self.ui.assetFeePool.setText( str(int(asset['dynamic_asset_data']['fee_pool']) / pow(10, asset['precision'])) )
+		dyn = asset.get('dynamic_asset_data', None)
+		if dyn:
+			self.ui.assetCurrentSupply.setText( str(int(dyn[ "current_supply"]) / pow(10, asset['precision'])) )
+			self.ui.assetBlindSupply.setText( str(int(dyn[ "confidential_supply"]) / pow(10, asset['precision'])) )
+			self.ui.assetFeePool.setText( str(int(dyn['fee_pool']) / pow(10, asset['precision'])) )
+		else:
+			self.ui.assetCurrentSupply.setText("")
+			self.ui.assetBlindSupply.setText("")
+			self.ui.assetFeePool.setText("")
 		self.ui.assetFeeRate.setText( str(int(asset['options']['core_exchange_rate']['base']['amount']) / pow(10, 5)) )
 		#self.ui.assetFeeSupply.setText( str(int(asset['dynamic_asset_data']["accumulated_fees"] / pow(10, asset['precision']))) )
+		
+		if not(force_remote) and not(self.iso.offline) and self.iso.assetDataStale(asset):
+			self.asset_downloader.fetch(
+				self.iso.refreshAssetData, [ asset ],
+				ready_callback=self.display_asset_refreshed,
+				error_callback=self._download_error,
+				ping_callback=self.refreshUi_ping,
+				description="Refreshing asset " + asset['symbol']
+			)
+	
+	def display_asset_refreshed(self, uid, refreshed):
+		if not refreshed:
+			return
+		symbol = self.ui.assetsymbolLine.text()
+		if symbol:
+			self.display_asset(force_symbol=symbol)
 	
 	def refilter_assets(self):
 		iso = self.iso
@@ -82,40 +102,21 @@ class WindowWithAssets(QtCore.QObject):
 		
 		entries = [ ]
 		if name:
-			entries = store.getAssetsLike(name)
+			entries = store.searchSymbols(name)
 		elif self.activeAccount:
-			entries = store.getByIssuer(self.activeAccount['id'])
+			entries = store.getSymbolsByIssuer(self.activeAccount['id'])
 		
 		table = self.ui.assetList
 		#table.setColumnCount(2)
 		table.setRowCount(0)
 		
 		j = -1
-		for graphene_json in entries:
+		for (symbol, asset_id, display_name) in entries:
 			j += 1
 			table.insertRow(j)
 			
-			obj = json.loads(graphene_json)
-			#pprint(obj)
-			desc = obj['options']['description']
-			
-			string = str(desc)
-			try:
-				parsed = json.loads(desc)
-				if 'main' in parsed and parsed['main']:
-					string = parsed['main']
-				elif 'short_name' in parsed:
-					string = parsed['short_name']
-				else:
-					string = ""
-			except:
-				# don't care
-				#import traceback
-				#traceback.print_exc()
-				pass
-			
-			set_col(table, j, 0, obj['symbol'])
-			set_col(table, j, 1, string)
+			set_col(table, j, 0, symbol)
+			set_col(table, j, 1, display_name)
 			
 			table.item(j, 0).setIcon( qicon(":/icons/images/token.png") )
 	
@@ -126,17 +127,53 @@ class WindowWithAssets(QtCore.QObject):
 			return
 		store = self.iso.store.assetStorage
 		store.wipe()
-		self.download_assets()
+		self.download_assets(restart=True)
 	
-	def download_assets(self):
+	def download_assets(self, restart=False):
 		self.assets_downloader.fetch(
-			self.iso.download_assets,
+			self.iso.download_assets, restart,
 			ready_callback=self.download_assets_after,
 			error_callback=self._download_error,
 			ping_callback=self.refreshUi_ping,
 			description="Downloading asset definitions"
 		)
 	
+	def export_assets(self):
+		path = QtGui.QFileDialog.getSaveFileName(self, 'Export asset catalog', "assets.jsonl.gz", "Asset catalog (*.jsonl.gz)")
+		if not path:
+			return False
+		try:
+			header = self.iso.exportAssets(path)
+		except Exception as error:
+			showexc(error)
+			return False
+		showmsg("Exported %d assets" % header["count"])
+		return True
+	
+	def import_assets(self):
+		path = QtGui.QFileDialog.getOpenFileName(self, 'Import asset catalog', "", "Asset catalog (*.jsonl.gz)")
+		if not path:
+			return False
+		self.assets_downloader.fetch(
+			self.iso.importAssets, path,
+			ready_callback=self.import_assets_after,
+			error_callback=self._download_error,
+			ping_callback=self.refreshUi_ping,
+			description="Importing asset catalog"
+		)
+		return True
+	
+	def import_assets_after(self, uid, args):
+		(loaded, new, changed) = args
+		self.refilter_assets()
+		additional = [ ]
+		if new:
+			additional.append("%d new assets downloaded" % new)
+		if changed:
+			additional.append("%d changed assets updated" % changed)
+		showmsg("Imported %d assets" % loaded,
+			additional=", ".join(additional) or None)
+	
 	def _download_error(self, uid, error):
 		showexc(error)
 	
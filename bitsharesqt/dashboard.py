@@ -269,10 +269,10 @@ class DashboardTab(QtGui.QWidget):
 		#	raise Exception
 		
 		# related names
-		softname = iso.softAccountName
-		softname(account['registrar'])
-		softname(account['referrer'])
-		softname(account['options']['voting_account'])
+		iso.resolveAccountNames([
+			account['registrar'],
+			account['referrer'],
+			account['options']['voting_account'] ])
 		
 		# balances
 		balances = self.iso.getBalances(account["id"], force_remote=True)
@@ -0,0 +1,429 @@
+"""
+Human-readable descriptions of operations, for history and
+transaction builder views.
+
+Formatters are registered per operation id (see `formatter`). To
+describe a batch of operations, all account and asset ids they
+mention are collected first and resolved in one pass (see
+`describe_many`), so formatters only ever hit in-memory lookups.
+
+	python -m bitsharesqt.describe [count]
+
+measures throughput on synthetic operations (see `benchmark`) and
+fails if it is below THROUGHPUT_TARGET.
+"""
+import time
+from bitsharesbase.operations import getOperationNameForId
+
+import logging
+log = logging.getLogger(__name__)
+
+FORMATTERS = { }
+
+def formatter(*op_ids):
+	""" Register decorated function as formatter for `op_ids` """
+	def register(func):
+		for op_id in op_ids:
+			FORMATTERS[op_id] = func
+		return func
+	return register
+
+
+def collect_ids(obj, accounts, assets):
+	""" Walk operation JSON, gathering 1.2.X and 1.3.X ids """
+	if isinstance(obj, dict):
+		for v in obj.values():
+			collect_ids(v, accounts, assets)
+	elif isinstance(obj, list):
+		for v in obj:
+			collect_ids(v, accounts, assets)
+	elif isinstance(obj, str):
+		if obj.startswith("1.2."):
+			accounts.add(obj)
+		elif obj.startswith("1.3."):
+			assets.add(obj)
+
+
+class Describer(object):
+	""" Resolved names and assets of a batch, plus helpers
+	    for formatters """
+	def __init__(self, iso, account=None):
+		self.iso = iso
+		self.account_id = account["id"] if account else None
+		self.names = { }
+		self.assets = { }
+
+	def resolve(self, ops):
+		accounts = set()
+		assets = set()
+		for op in ops:
+			collect_ids(op, accounts, assets)
+		self.names.update(self.iso.resolveAccountNames(accounts))
+		self.assets.update(self.iso.resolveAssetInfos(assets))
+
+	def name(self, account_id):
+		if account_id in self.names:
+			return self.names[account_id]
+		return self.iso.softAccountName(account_id)
+
+	def asset(self, asset_id):
+		info = self.assets.get(asset_id, None)
+		if info is None:
+			info = self.iso.getAssetInfo(asset_id)
+			self.assets[asset_id] = info
+		return info
+
+	def amount(self, op_amount):
+		""" Format amount JSON ({amount, asset_id}), same as str(Amount) """
+		if 'asset' in op_amount:
+			info = self.asset(op_amount['asset'])
+			value = float(op_amount['amount'])
+		else:
+			info = self.asset(op_amount['asset_id'])
+			value = int(op_amount['amount']) / 10 ** info.precision
+		return "{:,.{prec}f} {}".format(value, info.symbol, prec=info.precision)
+
+	def core(self, amount):
+		return self.amount({ 'amount': amount, 'asset_id': '1.3.0' })
+
+	def is_me(self, account_id):
+		return self.account_id is not None and self.account_id == account_id
+
+	@staticmethod
+	def generic(op_id):
+		return {
+			"long": "Some operation",
+			"short": "",
+			"plus": "",
+			"minus": "",
+			"icon": getOperationNameForId(op_id).lower(),
+		}
+
+	def describe(self, h):
+		""" Returns description dict of `h`, the generic one if its
+		    formatter fails (one odd op must not sink a batch) """
+		op_id, op_action = h['op']
+		details = self.generic(op_id)
+		func = FORMATTERS.get(op_id, None)
+		if func:
+			try:
+				func(self, op_action, details)
+			except Exception as error:
+				log.warning("Failed to describe %s: %s" % (h.get('id', "operation %d" % op_id),
+					str(error) or type(error).__name__))
+				details = self.generic(op_id)
+		return details
+
+
+def describe_many(iso, entries, account=None):
+	""" Returns a list of description dicts (long, short, plus,
+	    minus, icon) for history `entries` (dicts with 'op') """
+	started = time.time()
+	d = Describer(iso, account)
+	d.resolve([ h['op'][1] for h in entries ])
+	result = [ d.describe(h) for h in entries ]
+	took = time.time() - started
+	if len(entries) > 1:
+		log.debug("Described %d ops in %.3fs (%d ops/s)" % (len(entries),
+			took, len(entries) / took if took else 0))
+	return result
+
+
+# Bulk describing (history sync, transaction buffer) should keep up
+# with this, see `benchmark`
+THROUGHPUT_TARGET = 50000 # ops/s, 10k ops in 0.2s
+
+class SyntheticLookups(object):
+	""" In-memory stand-in for the isolator lookups `Describer` uses,
+	    so `benchmark` measures formatting alone """
+	def __init__(self, accounts=50, assets=5):
+		from .isolator import AssetInfo
+		self.names = { "1.2.%d" % i: "user%d" % i for i in range(accounts) }
+		self.infos = { "1.3.%d" % i: AssetInfo("1.3.%d" % i, "ASSET%d" % i, 5, "1.2.1")
+			for i in range(assets) }
+
+	def resolveAccountNames(self, ids):
+		return { i: self.names[i] for i in ids if i in self.names }
+
+	def resolveAssetInfos(self, ids):
+		return { i: self.infos[i] for i in ids if i in self.infos }
+
+	def softAccountName(self, account_id):
+		return self.names.get(account_id, account_id)
+
+	def getAssetInfo(self, asset_id):
+		return self.infos[asset_id]
+
+
+def synthetic_ops(count, accounts=50, assets=5):
+	""" Returns `count` history entries, a mix of common operations """
+	def amount(i):
+		return { "amount": 1000 + i, "asset_id": "1.3.%d" % (i % assets) }
+	def account(i):
+		return "1.2.%d" % (i % accounts)
+	makers = [
+		lambda i: (0, { "from": account(i), "to": account(i + 1), "amount": amount(i) }),
+		lambda i: (1, { "seller": account(i), "amount_to_sell": amount(i), "min_to_receive": amount(i + 1) }),
+		lambda i: (2, { "fee_paying_account": account(i), "order": "1.7.%d" % i }),
+		lambda i: (3, { "funding_account": account(i), "delta_collateral": amount(0), "delta_debt": amount(i) }),
+		lambda i: (4, { "account_id": account(i), "pays": amount(i), "receives": amount(i + 1) }),
+		lambda i: (14, { "issuer": account(1), "issue_to_account": account(i), "asset_to_issue": amount(i) }),
+		lambda i: (15, { "payer": account(i), "amount_to_reserve": amount(i) }),
+		lambda i: (99, { }), # unknown
+	]
+	return [ { "op": list(makers[i % len(makers)](i)) } for i in range(count) ]
+
+
+def benchmark(count=10000, rounds=5):
+	""" Describe `count` synthetic operations `rounds` times, returns
+	    best throughput in ops/s. Compare to THROUGHPUT_TARGET. """
+	lookups = SyntheticLookups()
+	entries = synthetic_ops(count)
+	account = { "id": "1.2.7" }
+	best = None
+	for _ in range(rounds):
+		started = time.time()
+		describe_many(lookups, entries, account)
+		took = time.time() - started
+		best = took if best is None else min(best, took)
+	return count / best if best else float("inf")
+
+
+@formatter(0)
+def transfer(d, op, r):
+	amt = d.amount(op['amount'])
+	r["long"] = "Transfer from " + d.name(op['from']) + " to " + d.name(op['to']) + " - " + amt
+	if d.is_me(op['from']):
+		r["short"] = "Transfered to " + d.name(op['to'])
+		r["minus"] = amt
+		r["icon"] = "transfer_to"
+	if d.is_me(op['to']):
+		r["short"] = "Transfered from " + d.name(op['from'])
+		r["plus"] = amt
+		r["icon"] = "transfer_from"
+
+@formatter(1)
+def limit_order_create(d, op, r):
+	r["long"] = "Place order for " + d.amount(op['min_to_receive']) + " paying " + d.amount(op['amount_to_sell'])
+
+@formatter(2)
+def limit_order_cancel(d, op, r):
+	r["long"] = "Cancel order"
+
+@formatter(3)
+def call_order_update(d, op, r):
+	r["long"] = ("Update margin position - collateral " + d.amount(op['delta_collateral']) +
+		", debt " + d.amount(op['delta_debt']))
+	r["short"] = "Updated margin position"
+
+@formatter(4)
+def fill_order(d, op, r):
+	amt_a = d.amount(op['pays'])
+	amt_b = d.amount(op['receives'])
+	r["long"] = "Traded - " + amt_a + " for " + amt_b
+	r["short"] = "Traded"
+	r["plus"] = amt_b
+	r["minus"] = amt_a
+
+@formatter(5)
+def account_create(d, op, r):
+	r["long"] = "Register account by " + d.name(op['registrar']) + " - " + d.name(op['name'])
+
+@formatter(6)
+def account_update(d, op, r):
+	r["long"] = "Update account - " + d.name(op['account'])
+
+@formatter(7)
+def account_whitelist(d, op, r):
+	r["long"] = ("Whitelist update by " + d.name(op['authorizing_account']) +
+		" - " + d.name(op['account_to_list']))
+
+@formatter(8)
+def account_upgrade(d, op, r):
+	r["long"] = "Upgrade account - " + d.name(op['account_to_upgrade'])
+
+@formatter(9)
+def account_transfer(d, op, r):
+	r["long"] = "Transfer account " + d.name(op['account_id']) + " to " + d.name(op['new_owner'])
+
+@formatter(10)
+def asset_create(d, op, r):
+	r["long"] = "Create asset by " + d.name(op["issuer"]) + " - " + op["symbol"].upper()
+
+def _asset_update(d, op, r, desc):
+	r["long"] = desc
+	try:
+		r["long"] += " - " + d.asset(op['asset_to_update']).symbol
+	except:
+		pass
+
+@formatter(11)
+def asset_update(d, op, r):
+	_asset_update(d, op, r, "Update asset")
+
+@formatter(12)
+def asset_update_bitasset(d, op, r):
+	_asset_update(d, op, r, "Update bitasset")
+
+@formatter(13)
+def asset_update_feed_producers(d, op, r):
+	_asset_update(d, op, r, "Update feed producers")
+
+@formatter(14)
+def asset_issue(d, op, r):
+	amt = d.amount(op['asset_to_issue'])
+	r["long"] = "Issue by " + d.name(op["issuer"]) + " to " + d.name(op["issue_to_account"]) + " - " + amt
+	if d.is_me(op["issue_to_account"]):
+		r["short"] = "Issued from " + d.name(op['issuer'])
+		r["plus"] = amt
+		r["icon"] = "transfer_from"
+	if d.is_me(op["issuer"]):
+		r["short"] = "Issued to " + d.name(op['issue_to_account'])
+		r["minus"] = amt
+		r["icon"] = "transfer_to"
+
+@formatter(15)
+def asset_reserve(d, op, r):
+	asset = d.asset(op['amount_to_reserve']['asset_id'])
+	amt = d.amount(op['amount_to_reserve'])
+	r["long"] = "Reserved by " + d.name(op["payer"]) + " - " + amt
+	r["minus"] = amt
+	if asset.issuer == op["payer"]:
+		r["plus"] = amt
+	r["short"] = "Reserved by " + d.name(op["payer"]) + " - " + amt
+
+@formatter(16)
+def asset_fund_fee_pool(d, op, r):
+	r["long"] = ("Fund fee pool of " + d.asset(op['asset_id']).symbol +
+		" by " + d.name(op['from_account']) + " - " + d.core(op['amount']))
+	if d.is_me(op['from_account']):
+		r["minus"] = d.core(op['amount'])
+
+@formatter(17)
+def asset_settle(d, op, r):
+	amt = d.amount(op['amount'])
+	r["long"] = "Settle by " + d.name(op['account']) + " - " + amt
+	r["short"] = "Settle " + amt
+
+@formatter(18)
+def asset_global_settle(d, op, r):
+	r["long"] = "Global settle - " + d.asset(op['asset_to_settle']).symbol
+
+@formatter(19)
+def asset_publish_feed(d, op, r):
+	r["long"] = "Publish feed by " + d.name(op['publisher']) + " - " + d.asset(op['asset_id']).symbol
+
+@formatter(20)
+def witness_create(d, op, r):
+	r["long"] = "Create witness - " + d.name(op['witness_account'])
+
+@formatter(21)
+def witness_update(d, op, r):
+	r["long"] = "Update witness - " + d.name(op['witness_account'])
+
+@formatter(22)
+def proposal_create(d, op, r):
+	r["long"] = "Propose transaction by " + d.name(op['fee_paying_account'])
+
+@formatter(23)
+def proposal_update(d, op, r):
+	r["long"] = "Update proposal " + op['proposal'] + " by " + d.name(op['fee_paying_account'])
+
+@formatter(24)
+def proposal_delete(d, op, r):
+	r["long"] = "Delete proposal " + op['proposal'] + " by " + d.name(op['fee_paying_account'])
+
+@formatter(32)
+def vesting_balance_create(d, op, r):
+	amt = d.amount(op['amount'])
+	r["long"] = "Create vesting balance by " + d.name(op['creator']) + " for " + d.name(op['owner']) + " - " + amt
+	if d.is_me(op['creator']):
+		r["minus"] = amt
+
+@formatter(33)
+def vesting_balance_withdraw(d, op, r):
+	amt = d.amount(op['amount'])
+	r["long"] = "Withdraw vesting balance - " + amt
+	r["short"] = "Withdrawn vesting balance"
+	r["plus"] = amt
+
+@formatter(34)
+def worker_create(d, op, r):
+	r["long"] = "Create worker by " + d.name(op['owner']) + " - " + op['name']
+
+@formatter(37)
+def balance_claim(d, op, r):
+	amt = d.amount(op['total_claimed'])
+	r["long"] = "Claim balance to " + d.name(op['deposit_to_account']) + " - " + amt
+	r["short"] = "Claimed balance"
+	r["plus"] = amt
+
+@formatter(38)
+def override_transfer(d, op, r):
+	amt = d.amount(op['amount'])
+	r["long"] = ("Override transfer by " + d.name(op['issuer']) + " from " + d.name(op['from']) +
+		" to " + d.name(op['to']) + " - " + amt)
+	if d.is_me(op['from']):
+		r["minus"] = amt
+	if d.is_me(op['to']):
+		r["plus"] = amt
+
+@formatter(39)
+def transfer_to_blind(d, op, r):
+	amt = d.amount(op['amount'])
+	r["long"] = "Transfer to blind - " + amt
+	r["short"] = "Transfered to blind"
+	r["minus"] = amt
+
+@formatter(40)
+def blind_transfer(d, op, r):
+	r["long"] = "Blind transfer"
+	r["short"] = "Blind transfer"
+
+@formatter(41)
+def transfer_from_blind(d, op, r):
+	amt = d.amount(op['amount'])
+	r["long"] = "Transfer from blind to " + d.name(op['to']) + " - " + amt
+	r["short"] = "Transfered from blind"
+	r["plus"] = amt
+
+@formatter(42)
+def asset_settle_cancel(d, op, r):
+	amt = d.amount(op['amount'])
+	r["long"] = "Settlement cancelled - " + amt
+	r["plus"] = amt
+
+@formatter(43)
+def asset_claim_fees(d, op, r):
+	amt = d.amount(op['amount_to_claim'])
+	r["long"] = "Claim fees by " + d.name(op['issuer']) + " - " + amt
+	r["plus"] = amt
+
+@formatter(45)
+def bid_collateral(d, op, r):
+	r["long"] = ("Bid collateral " + d.amount(op['additional_collateral']) +
+		" for " + d.amount(op['debt_covered']))
+
+@formatter(46)
+def execute_bid(d, op, r):
+	r["long"] = ("Bid executed - " + d.amount(op['collateral']) +
+		" for " + d.amount(op['debt']))
+
+@formatter(47)
+def asset_claim_pool(d, op, r):
+	amt = d.amount(op['amount_to_claim'])
+	r["long"] = "Claim fee pool of " + d.asset(op['asset_id']).symbol + " - " + amt
+	r["plus"] = amt
+
+@formatter(48)
+def asset_update_issuer(d, op, r):
+	r["long"] = ("Change issuer of " + d.asset(op['asset_to_update']).symbol +
+		" to " + d.name(op['new_issuer']))
+
+
+if __name__ == "__main__":
+	import sys
+	count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+	rate = benchmark(count)
+	print("Described %d ops: %d ops/s (target %d ops/s)" % (count, rate, THROUGHPUT_TARGET))
+	sys.exit(0 if rate >= THROUGHPUT_TARGET else 1)
@@ -1,17 +1,16 @@
 # -*- coding: utf-8 -*-
 from PyQt4 import QtCore, QtGui
-
-from PyQt4.QtGui import QTableWidgetItem
+from PyQt4.QtCore import Qt
 
 from .netloc import RemoteFetch
 from .utils import *
-import json
+from bitsharesextra.storage import History, HistoryRecord
+import sys
+from array import array
 
 from .memowindow import MemoWindow
 from .transactionbuilder import QTransactionBuilder
 
-from bitsharesbase.signedtransactions import Signed_Transaction
-
 import logging
 log = logging.getLogger(__name__)
 
@@ -21,6 +20,163 @@ except AttributeError:
     def _fromUtf8(s):
         return s
 
+class HistoryRows(object):
+	""" Compact columnar store of listed history entries: each field
+	    is a list (or array) of its own, there is no object per row.
+	    Newer rows are appended to `head` (so it is kept oldest first)
+	    and older ones to `tail`, adding on either end is O(1). """
+	ACCOUNT, OP_SEQ, DATE, TEXT, PLUS, MINUS, ICON, MEMO = range(8)
+	
+	def __init__(self):
+		self.clear()
+	
+	def _columns(self):
+		return [ [ ], array('q'), [ ], [ ], [ ], [ ], [ ], array('b') ]
+	
+	def clear(self):
+		self.head = self._columns()
+		self.tail = self._columns()
+	
+	def __len__(self):
+		return len(self.head[1]) + len(self.tail[1])
+	
+	def get(self, row, field):
+		n = len(self.head[1])
+		if row < n:
+			return self.head[field][n - 1 - row]
+		return self.tail[field][row - n]
+	
+	def prepend(self, values):
+		for column, value in zip(self.head, values):
+			column.append(value)
+	
+	def append(self, values):
+		for column, value in zip(self.tail, values):
+			column.append(value)
+	
+	@staticmethod
+	def fromListing(row):
+		""" Convert `History.getPage` tuple to row values """
+		h = HistoryRecord(row, History.__listing__)
+		info = h.info
+		icon = info["icon"]
+		return (
+			sys.intern(h.account),
+			h.op_seq if h.op_seq is not None else History.opSequence(h.op_index),
+			str(h.date),
+			info["short"] or h.description,
+			info["plus"],
+			info["minus"],
+			sys.intern(":/op/images/op/" + icon + ".png") if icon else None,
+			max(-1, min(int(h.memo or 0), 1)),
+		)
+
+class HistoryModel(QtCore.QAbstractTableModel):
+	""" History table, loaded page by page as it is scrolled """
+	PAGE = 500
+	MEMO_ICON = ":/icons/images/memo.png"
+	
+	_icons = { } # path to QIcon, shared by all tabs
+	
+	def __init__(self, parent=None):
+		super(HistoryModel, self).__init__(parent)
+		self.rows = HistoryRows()
+		self.source = None
+		self.more = False
+		self.plus_brush = QtGui.QBrush(QtGui.QColor(COLOR_GREEN))
+		self.minus_brush = QtGui.QBrush(QtGui.QColor(COLOR_RED))
+		self.amount_align = int(Qt.AlignRight | Qt.AlignVCenter)
+	
+	def setSource(self, source):
+		""" Replace all rows with those from `source(limit, offset,
+		    before_seq)`, which returns `History.getPage` tuples """
+		self.beginResetModel()
+		self.rows.clear()
+		self.source = source
+		self.more = source is not None
+		self.endResetModel()
+		self.fetchMore()
+	
+	def rowCount(self, parent=QtCore.QModelIndex()):
+		return 0 if parent.isValid() else len(self.rows)
+	
+	def columnCount(self, parent=QtCore.QModelIndex()):
+		return 0 if parent.isValid() else 4
+	
+	def canFetchMore(self, parent=QtCore.QModelIndex()):
+		return not(parent.isValid()) and self.more
+	
+	def fetchMore(self, parent=QtCore.QModelIndex()):
+		if parent.isValid() or not(self.more):
+			return
+		n = len(self.rows)
+		oldest = self.rows.get(n - 1, HistoryRows.OP_SEQ) if n else None
+		page = self.source(self.PAGE, n, oldest)
+		self.more = len(page) == self.PAGE
+		if not page:
+			return
+		self.beginInsertRows(QtCore.QModelIndex(), n, n + len(page) - 1)
+		for row in page:
+			self.rows.append(HistoryRows.fromListing(row))
+		self.endInsertRows()
+	
+	def prependRows(self, page):
+		""" Put newer rows (`History.getPage` tuples, newest
+		    first) on top """
+		if not page:
+			return
+		self.beginInsertRows(QtCore.QModelIndex(), 0, len(page) - 1)
+		for row in reversed(page):
+			self.rows.prepend(HistoryRows.fromListing(row))
+		self.endInsertRows()
+	
+	def sequenceAt(self, row):
+		if row < 0 or row >= len(self.rows):
+			return None
+		return self.rows.get(row, HistoryRows.OP_SEQ)
+	
+	def entryKey(self, row):
+		""" Returns (account_name, op_index) of row """
+		rows = self.rows
+		return (rows.get(row, rows.ACCOUNT), "1.11.%d" % rows.get(row, rows.OP_SEQ))
+	
+	@classmethod
+	def icon(cls, path):
+		if not path:
+			return None
+		if not path in cls._icons:
+			cls._icons[path] = qicon(path)
+		return cls._icons[path]
+	
+	def data(self, index, role=Qt.DisplayRole):
+		if not index.isValid():
+			return None
+		row, col = index.row(), index.column()
+		rows = self.rows
+		if role == Qt.DisplayRole:
+			if col == 0:
+				return rows.get(row, rows.DATE)
+			if col == 1:
+				return rows.get(row, rows.TEXT)
+			if col == 2:
+				return rows.get(row, rows.PLUS)
+			if col == 3:
+				return rows.get(row, rows.MINUS)
+		elif role == Qt.DecorationRole:
+			if col == 0:
+				return self.icon(rows.get(row, rows.ICON))
+			if col == 1 and rows.get(row, rows.MEMO) > 0:
+				return self.icon(self.MEMO_ICON)
+		elif role == Qt.ForegroundRole:
+			if col == 2:
+				return self.plus_brush
+			if col == 3:
+				return self.minus_brush
+		elif role == Qt.TextAlignmentRole:
+			if col >= 2:
+				return self.amount_align
+		return None
+
 class Ui_HistoryTab(object):
 
 	def setupUi(self, tab):
@@ -31,15 +187,25 @@ class Ui_HistoryTab(object):
 
 		self.verticalLayout = QtGui.QVBoxLayout(tab)
 		self.verticalLayout.setObjectName(_fromUtf8("verticalLayout"))
+		
+		self.searchLayout = QtGui.QHBoxLayout()
+		self.searchLayout.setObjectName(_fromUtf8("searchLayout"))
+		self.searchLine = QtGui.QLineEdit(tab)
+		self.searchLine.setPlaceholderText("Search history...")
+		self.searchLine.setObjectName(_fromUtf8("searchLine"))
+		self.searchLayout.addWidget(self.searchLine)
+		self.searchAll = QtGui.QCheckBox(tab)
+		self.searchAll.setText("All accounts")
+		self.searchAll.setObjectName(_fromUtf8("searchAll"))
+		self.searchLayout.addWidget(self.searchAll)
+		self.verticalLayout.addLayout(self.searchLayout)
 
-		self.table = QtGui.QTableWidget(tab)
+		self.table = QtGui.QTableView(tab)
 		self.table.setEditTriggers(QtGui.QAbstractItemView.NoEditTriggers)
 		self.table.setSelectionMode(QtGui.QAbstractItemView.SingleSelection)
 		self.table.setSelectionBehavior(QtGui.QAbstractItemView.SelectRows)
 		self.table.setShowGrid(False)
 		self.table.setCornerButtonEnabled(False)
-		self.table.setRowCount(0)
-		self.table.setColumnCount(4)
 		self.table.setObjectName(_fromUtf8("tableWidget_3"))
 		self.table.horizontalHeader().setVisible(False)
 		self.table.horizontalHeader().setDefaultSectionSize(294)
@@ -51,10 +217,13 @@ class Ui_HistoryTab(object):
 		#font.setPointSize(10)
 		#self.table.setFont(font)
 		
-		self.table.setStyleSheet(_fromUtf8("QTableWidget {\n"
+		self.model = HistoryModel(tab)
+		self.table.setModel(self.model)
+		
+		self.table.setStyleSheet(_fromUtf8("QTableView {\n"
 			"    font-family: monospace;\n"
 			"}\n"
-			"QTableWidget::item { padding-right: 20px; }\n"
+			"QTableView::item { padding-right: 20px; }\n"
 			"\n"
 		""))
 		
@@ -86,11 +255,13 @@ class HistoryTab(QtGui.QWidget):
 		
 		self._index = 1
 		
-		self.subscribed = False
-		self.updater = RemoteFetch()
-		self.refreshing = False
+		self.trxfetcher = RemoteFetch()
+		
+		self.ui.table.doubleClicked.connect(self.history_doubleclick)
 		
-		self.ui.table.cellDoubleClicked.connect(self.history_superclick)
+		self._search_text = ""
+		self.ui.searchLine.textChanged.connect(self.search_history)
+		self.ui.searchAll.stateChanged.connect(self.search_history)
 		
 		qmenu(self.ui.table, self.show_submenu)
 	
@@ -110,7 +281,7 @@ class HistoryTab(QtGui.QWidget):
 	def export_history(self):
 		account = self._last_account
 		iso = self._last_iso
-		entries = iso.store.historyStorage.getEntries(account.name)
+		entries = iso.store.historyStorage.getRecords(account.name)
 		
 		path = account.name + ".csv"
 		path = QtGui.QFileDialog.getSaveFileName(self, 'Export account history', path, "CSV File (*.csv)")
@@ -121,15 +292,11 @@ class HistoryTab(QtGui.QWidget):
 			s = "Date, Operation, Income, Expense\n"
 			f.write(s)
 			for h in entries:
-				if not '_details' in h:
-					h['_details'] = json.loads(h['details']) if h['details'] else {
-						"plus": "", "minus": "",
-					}
 				s = "%s, %s, %s, %s\n" % (
-					str(h["date"]),
-					h["description"],
-					h["_details"]["plus"],
-					h["_details"]["minus"]
+					str(h.date),
+					h.description,
+					h.info["plus"],
+					h.info["minus"]
 				)
 				f.write(s)
 		return True
@@ -138,11 +305,10 @@ class HistoryTab(QtGui.QWidget):
 		j = table_selrow(self.ui.table)
 		if j < 0:
 			return
-		h = self.ui.table.item(j, 0).data(99)
+		h = self.entryAt(j)
 		#if h["memo"] == -1:
 		#	return False
-		info = json.loads(h['operation'])
-		op_id, op = info["op"]
+		op_id, op = h.op
 		if not op or not(op_id == 0):
 			return
 		if not("memo" in op):
@@ -173,17 +339,15 @@ class HistoryTab(QtGui.QWidget):
 		j = table_selrow(self.ui.table)
 		if j < 0:
 			return
-		h = self.ui.table.item(j, 0).data(99)
+		h = self.entryAt(j)
 		#if h["memo"] == -1:
 		#	return False
-		info = json.loads(h['operation'])
-		#print(info)
-		op_id, op = info["op"]
+		op_id, op = h.op
 		if not op or not(op_id == 39 or op_id == 40):
 			return
 		
 		iso = self._last_iso
-		(n, text, txt2) = iso.matchBlindOutputs(op["outputs"], h["description"])
+		(n, text, txt2) = iso.matchBlindOutputs(op["outputs"], h.description)
 		
 		if n == 0:
 			showerror("No receipts found")
@@ -195,12 +359,12 @@ class HistoryTab(QtGui.QWidget):
 		j = table_selrow(self.ui.table)
 		if j < 0:
 			return
-		h = self.ui.table.item(j, 0).data(99)
+		h = self.entryAt(j)
 		
 		url = "http://bitshares-explorer.io/#/blocks/${block}"
 		url = "http://cryptofresh.com/tx/${tx}"
-		url = url.replace("${tx}", h['trxid'])
-		url = url.replace("${block}", str(h['block_num']))
+		url = url.replace("${tx}", h.trxid)
+		url = url.replace("${block}", str(h.block_num))
 		import webbrowser
 		webbrowser.open(url)
 	
@@ -208,21 +372,21 @@ class HistoryTab(QtGui.QWidget):
 		j = table_selrow(self.ui.table)
 		if j < 0:
 			return
-		h = self.ui.table.item(j, 0).data(99)
+		h = self.entryAt(j)
 		
-		qclip(str(h['block_num']))
+		qclip(str(h.block_num))
 	
 	def history_copy_trxid(self):
 		j = table_selrow(self.ui.table)
 		if j < 0:
 			return
-		h = self.ui.table.item(j, 0).data(99)
+		h = self.entryAt(j)
 		
-		if not h['trxid']:
+		if not h.trxid:
 			showerror("Transaction has no ID :(")
 			return
 		
-		qclip(h['trxid'])
+		qclip(h.trxid)
 	
 	def history_click(self):
 		j = table_selrow(self.ui.table)
@@ -230,20 +394,30 @@ class HistoryTab(QtGui.QWidget):
 			return
 		self.history_superclick(j, 0)
 	
+	def history_doubleclick(self, index):
+		self.history_superclick(index.row(), index.column())
+	
 	def history_superclick(self, row, column):
-		h = self.ui.table.item(row, 0).data(99)
-		op_id = h['op_index']
-		#op_id = self.ui.table.item(row, 0).text()
+		entry = self.entryAt(row)
 		iso = self._last_iso
-		entry = h# iso.store.historyStorage.getEntry(op_id, self._account_name)
-		#print("predata", entry["operation"])
-		data = json.loads(entry["operation"])
-		op = data['op'][1]
+		op = entry.op[1]
+		
+		if entry.transaction:
+			hl = int(entry.op_in_trx)
+			QTransactionBuilder.QViewTransaction(entry.transaction, hl, isolator=self._last_iso)
+			return
 		
-		if entry["trxfull"]:
-			ftx = json.loads(entry["trxfull"])
-			hl = int(entry["op_in_trx"])
-			QTransactionBuilder.QViewTransaction(ftx, hl, isolator=self._last_iso)
+		if not(iso.offline) and entry.block_num:
+			# full transaction was pruned from cache, refetch it
+			self.trxfetcher.fetch(
+				iso.getTransaction,
+				int(entry.block_num), int(entry.trx_in_block), entry.trxid,
+				ready_callback=self.history_superclick_after,
+				error_callback=self.history_superclick_error,
+				ping_callback=self.ping_callback,
+				description="Fetching transaction"
+			)
+			self._superclick_entry = entry
 			return
 		
 		if 'memo' in op:
@@ -254,224 +428,68 @@ class HistoryTab(QtGui.QWidget):
 		#showerror(str(entry))
 		#showerror(str(data))
 	
+	def history_superclick_after(self, uid, ftx):
+		entry = self._superclick_entry
+		if not ftx:
+			showerror("Transaction not found")
+			return
+		hl = int(entry.op_in_trx)
+		QTransactionBuilder.QViewTransaction(ftx, hl, isolator=self._last_iso)
+	
+	def history_superclick_error(self, uid, error):
+		showexc(error)
+	
 	def close(self):
-		self.updater.cancel()
+		self.trxfetcher.cancel()
+	
+	def entryAt(self, row):
+		""" Load full entry (`HistoryRecord`) shown in `row` """
+		(account_name, op_index) = self.ui.model.entryKey(row)
+		return self._last_iso.store.historyStorage.getRecord(op_index, account_name)
+	
+	def search_history(self):
+		store = self._last_iso.store.historyStorage
+		text = self.ui.searchLine.text().strip()
+		self._search_text = text
+		if not text:
+			account_name = self._account_name
+			source = lambda limit, offset, before_seq: store.getPage(
+				account_name, limit, before_seq=before_seq)
+		else:
+			account_name = None if self.ui.searchAll.isChecked() else self._account_name
+			source = lambda limit, offset, before_seq: store.search(
+				text, account_name, limit=limit, offset=offset, listing=True)
+		self.ui.model.setSource(source)
 	
 	def openHistory(self, iso, account):
 		self._last_iso = iso
 		self._last_account = account
-		entries = iso.store.historyStorage.getEntries(account.name)
 		
 		self._account_name = account.name
 		self._account_id = account.id
-		#table.setRowCount(0)#len(account.history())) #wtf
-		#table.setColumnCount(2)
 		
-		self.place_entries(entries)
+		self.search_history()
 		self.resync()
 	
-	def place_entries(self, entries):
-		table = self.ui.table
-		
-		j = -1
-		for h in entries:
-			j += 1
-			
-			if not '_details' in h:
-				h['_details'] = json.loads(h['details']) if h['details'] else {
-					"short": h['description'],
-					"plus": "", "minus": "",
-					"icon": None
-				}
-				# TODO: remove this block
-				if not('icon' in h['_details']): #
-					h['_details']['icon'] = None#
-			if not('_icon' in h):
-				h['_icon'] = ":/op/images/op/"+h['_details']['icon']+".png" if h['_details']['icon'] else None
-			description = h["_details"]["short"] or h['description']
-			
-			table.insertRow(j)
-			
-			item = QTableWidgetItem( str(h["date"]) )
-			item.setData(99, h)
-			table.setItem(j, 0, item)
-			icon = qicon(h["_icon"])
-			item.setIcon(icon)
-			
-			set_col(table, j, 1, description)
-			set_col(table, j, 2, h["_details"]["plus"], color=COLOR_GREEN, align="right")
-			set_col(table, j, 3, h["_details"]["minus"], color=COLOR_RED, align="right")
-		
-			if h["memo"] > 0:
-				icon = qicon(":/icons/images/memo.png")
-				table.item(j, 1).setIcon(icon)
-	
-	
-	def desync(self):
-		self.subscribed = False
-	
 	def resync(self):
-		if not self.refreshing:
-			self.mergeHistory_async(self._last_iso, self._last_account)
-	
-	# blocking version
-	def mergeHistory(self, iso, account):
-		raise Exception("Don't call me")
-		mergeHistory_after(0, mergeHistory_before(iso, account))
-	
-	#non-blocking version
-	def mergeHistory_async(self, iso, account, overpower=False):
-		if self.refreshing: # already busy
-			if overpower:
-				self.updater.cancel()
-			else:
-				return
-		self.refreshing = True
-		self.updater.fetch(
-			self.mergeHistory_before, iso, account,
-			ready_callback = self.mergeHistory_after,
-			error_callback = self.mergeHistory_abort,
-			ping_callback = self.ping_callback,
-			description="Synchronizing history"
-		)
+		# history is synchronized in the background (see
+		# `HistoryScheduler`), just ask for this account to go next
+		self._last_iso.history_scheduler.markDirty(self._account_name, urgent=True)
 	
-	def mergeHistory_before(self, iso, account):
-		self.refreshing = True
-		
-		#iso._wait_online(timeout=3) # will raise exception
-		#if not(iso.is_connected()):
-		#	raise Exception
-		
-		# subscribe
-		rpc = iso.bts.rpc
-		if not self.subscribed:
-			rpc.get_full_accounts([account.name], True)
-			self.subscribed = True
-		
-		# fetch history
-		last_op_index = iso.store.historyStorage.getLastOperation(account.name)
-		log.debug("Last OP INDEX for %s = %s" % (account.name, last_op_index))
-		
-		# recreate account object
-		#from bitshares.account import Account
-		#account = Account(account.name, bitshares_instance=iso.bts)
-		
-		# load from the net
-		history = list(account.history())
-		
-		# load full tx from net + generate description
-		t = 0
-		for h in history:
-			if (h['id'] == last_op_index):
-				break
-			t += 1
-			#print("Get full tx for",
-			#	int(h['block_num']), int(h['trx_in_block']),
-			#	int(h['op_in_trx']), int(h["virtual_op"]))
-			try:
-				ftx = iso.bts.rpc.get_transaction(int(h['block_num']), int(h['trx_in_block']))
-			except Exception as error:
-				#print(str(error))
-				ftx = { }
-			#print(ftx)
-			h['_fulltx_dict'] = ftx
-			h['_fulltx_obj' ] = Signed_Transaction(**ftx) if ftx else None
-			h['_fulltx'] = json.dumps(ftx)
-			
-			h['_memo'] = 0
-			try:
-				if h['op'][0] == 0:
-					h['_memo'] = -1
-					if "memo" in h['op'][1]:
-						data = h['op'][1]['memo']
-						clear = iso.getMemo(None, None, data=data)
-						if len(clear["message"]) > 0:
-							h['_memo'] = 1
-			except Exception as e:
-				#import traceback
-				#print(h['op'][1], "failed to metch memo-data")
-				#traceback.print_exc()
-				pass
-			
-			#print("Get description for", h)
-			h['_details'] = iso.historyDescription(h, account)
-			h['_icon'] = ":/op/images/op/"+h['_details']['icon']+".png"
-			h['description'] = h['_details'].pop('long')
-			h['details'] = json.dumps(h['_details'])
-		
-		history = history[0:t]
-		return (history, account.name, iso)
-	
-	def mergeHistory_after(self, request_id, args):
-		(history, account_name, iso) = args
-		
-		#last_op_index = iso.store.historyStorage.getLastOperation(account.name)
-		last_op_index = "disabled"
-		
-		added = [ ]
-		
-		#from pprint import pprint
-		#print("New entries:", len(history))
-		for h in history:#account.history():
-			
-			#pprint(h)
-			#print("NEW OP INDEX:", h['id'])
-			
-			op_index = h['id']
-			if (op_index == last_op_index):
-				break
-			
-#			if not 'description' in h:
-#				description = "...?"
-#			else:
-			description = h['description'] #iso.historyDescription(h)
-			
-			#mem_tx = Signed_transaction(
-			
-			trxid = '...' # TODO: get txid from tx full
-			short = {
-				'op': h['op'],
-				'result': h['result']
-			}
-			memo = 0
-			if '_memo' in h:
-				memo = int(h['_memo'])
-			
-			exp_date = None
-			ftx = h['_fulltx_dict']
-			if ftx:
-				signed = h['_fulltx_obj']
-				try:
-					trxid = signed.id # it's a property
-				except:
-					trxid = ''
-				if 'expiration' in ftx and ftx['expiration']:
-					exp_date = ftx['expiration']
-					if exp_date[10:11] == 'T': # prettify
-						exp_date = exp_date.replace('T', ' ')
-			try:
-				iso.store.historyStorage.add(
-					account_name, description,
-					op_index, json.dumps(short), memo,
-					int(h['block_num']), int(h['trx_in_block']), int(h['op_in_trx']),
-					int(h['virtual_op']),
-					trxid, json.dumps(ftx), h['details']
-				)
-				if exp_date:
-					iso.store.historyStorage.updateDate(op_index, exp_date)
-				h = iso.store.historyStorage.getEntry(op_index, account_name)
-			except:
-				import traceback
-				traceback.print_exc()
-				continue
-			
-			added.append(h)
-		
-		log.debug("COLLECTED %d pieces of history, ADDING TO UI" % (len(added)))
-		self.place_entries(added)
-		self.refreshing = False
-	
-	def mergeHistory_abort(self, uid, error):
-		log.debug("Failed to merge history: %s" % (str(error)))
-		self.refreshing = False
-	
\ No newline at end of file
+	def refreshHistory(self):
+		""" Pick up entries stored by background sync """
+		if self._search_text:
+			return
+		model = self.ui.model
+		store = self._last_iso.store.historyStorage
+		newest = model.sequenceAt(0)
+		if newest is None:
+			self.search_history()
+			return
+		model.prependRows(store.getPage(self._account_name, None, after_seq=newest))
+		# older entries may have filled a gap between loaded ones
+		oldest = model.sequenceAt(model.rowCount() - 1)
+		if store.countEntries(self._account_name, since_seq=oldest) != model.rowCount():
+			self.search_history()
+			return
+		model.more = True
@@ -0,0 +1,428 @@
+"""
+Synchronization of account history into the wallet database.
+
+Operations are fetched newest first, page by page. Every page is
+prepared (full transactions, memos, descriptions) and stored right
+away, and a checkpoint of the account is recorded after it (see
+`HistoryCheckpoints`), so a sync that was cancelled, timed out, lost
+its connection or crashed resumes where it stopped instead of
+starting over. `HistoryScheduler` keeps all wallet accounts in sync
+in the background; the UI only ever reads the local store.
+"""
+import json
+import time
+import threading
+from collections import deque
+from datetime import datetime
+
+from bitsharesextra.storage import HistoryRecord
+from bitsharesbase.signedtransactions import Signed_Transaction
+from bitsharesbase.operations import getOperationNameForId
+
+import logging
+log = logging.getLogger(__name__)
+
+
+def transaction_id(ftx):
+	""" Compute id of full transaction (dict), '' if it can't be.
+	    Runs in worker processes too, see `getTransactionIds`. """
+	try:
+		return Signed_Transaction(**ftx).id # it's a property
+	except:
+		return ''
+
+
+def transaction_info(ftx, trxid=None):
+	""" Returns (trxid, JSON text, date) of full transaction """
+	if not ftx:
+		return ('...', None, None)
+	if trxid is None:
+		trxid = transaction_id(ftx)
+	date = ftx.get('expiration', None) or None
+	if date and date[10:11] == 'T': # prettify
+		date = date.replace('T', ' ')
+	return (trxid, json.dumps(ftx), date)
+
+
+def prepare_page(iso, account, history, index_memos=False):
+	""" Attach transaction info, memo flags and descriptions
+	    to a page of raw operations """
+	# load full tx from storage or net, all at once, and
+	# work out each one once, however many ops it has
+	trxs = iso.getTransactions(
+		(h['block_num'], h['trx_in_block']) for h in history )
+	ids = iso.getTransactionIds(trxs)
+	for pos in trxs:
+		trxs[pos] = transaction_info(trxs[pos], ids.get(pos, None))
+	for h in history:
+		pos = (int(h['block_num']), int(h['trx_in_block']))
+		(h['_trxid'], h['_trxfull'], h['_date']) = trxs.get(pos, None) or transaction_info(None)
+
+		h['_memo'] = 0
+		try:
+			if h['op'][0] == 0:
+				h['_memo'] = -1
+				if "memo" in h['op'][1]:
+					data = h['op'][1]['memo']
+					clear = iso.getMemo(None, None, data=data)
+					if len(clear["message"]) > 0:
+						h['_memo'] = 1
+						if index_memos:
+							h['_memo_text'] = clear["message"]
+		except Exception as e:
+			pass
+
+	# generate descriptions, all at once
+	for h, details in zip(history, iso.historyDescriptions(history, account)):
+		h['description'] = details.pop('long')
+		h['details'] = json.dumps(details)
+
+		# for full-text search
+		h['_optype'] = getOperationNameForId(h['op'][0])
+		h['_counterparties'] = " ".join(set(
+			iso.softAccountName(v) for v in h['op'][1].values()
+			if isinstance(v, str) and v.startswith("1.2.")
+		))
+
+
+def store_page(iso, account_name, history):
+	""" Store a prepared page, returns list of stored entries
+	    (as listing-only `HistoryRecord`s) """
+	storage = iso.store.historyStorage
+	added = [ ]
+	seen = set()
+	for h in history:
+		op_index = h['id']
+		short = {
+			'op': h['op'],
+			'result': h['result']
+		}
+		memo = 0
+		if '_memo' in h:
+			memo = int(h['_memo'])
+		date = h['_date'] or datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+
+		# full transaction goes to storage once, not once per op
+		pos = (int(h['block_num']), int(h['trx_in_block']))
+		trxfull = h['_trxfull'] if not pos in seen else None
+		seen.add(pos)
+		try:
+			storage.add(
+				account_name, h['description'],
+				op_index, json.dumps(short), memo,
+				pos[0], pos[1], int(h['op_in_trx']),
+				int(h['virtual_op']),
+				h['_trxid'], trxfull, h['details'],
+				date=date,
+				counterparties=h['_counterparties'],
+				optype=h['_optype'],
+				memo_text=h.get('_memo_text', None)
+			)
+		except:
+			import traceback
+			traceback.print_exc()
+			continue
+
+		# Writes are queued, so build the record ourselves
+		# instead of reading it back
+		added.append(HistoryRecord(
+			(account_name, op_index, storage.opSequence(op_index),
+			 date, h['description'], h['details'], memo),
+			storage.__listing__))
+	return added
+
+
+def account_total_ops(iso, account):
+	""" Number of operations in history of `account`, per its
+	    2.6.X statistics object. None if unknown. """
+	try:
+		stats = iso.bts.rpc.get_objects([ account["statistics"] ])[0]
+		return int(stats["total_ops"]) - int(stats.get("removed_ops", 0))
+	except Exception:
+		return None
+
+
+def sync_history(iso, account, page_callback=None, progress_callback=None, throttle=0, halt=None, max_pages=None):
+	""" Fetch, prepare and store all new operations of `account`,
+	    finishing an interrupted sync first, if there is one.
+
+	    `page_callback(entries)` gets every stored page,
+	    `progress_callback(synced, percent)` is called after it,
+	    percent being the share of account's ops we have stored
+	    (None if the node did not tell the total).
+	    Waits `throttle` seconds between pages, stops early once
+	    `halt` (threading.Event) is set or `max_pages` pages are
+	    stored (checkpoint is kept, next call continues from it).
+	    Nothing is written once `halt` is set, even if a page was
+	    already fetched. Returns number of stored ops.
+	"""
+	storage = iso.store.historyStorage
+	checkpoints = storage.checkpointStorage
+	index_memos = bool(iso.bts.config.get('history-index-memos', False))
+	name = account.name
+
+	started = time.time()
+	synced = 0
+	pages = 0
+	with iso.historyLock(name):
+		total = None
+		if progress_callback:
+			total = account_total_ops(iso, account)
+			stored = storage.countEntries(name)
+		runs = [ ]
+		checkpoint = checkpoints.getCheckpoint(name)
+		if checkpoint:
+			log.info("Resuming history sync of %s at 1.11.%d (%d ops done)" % (
+				name, checkpoint["cursor"], checkpoint["synced"]))
+			runs.append( (checkpoint["top"], checkpoint["cursor"],
+				checkpoint["stop"], checkpoint["synced"]) )
+		runs.append( (None, None, None, 0) ) # everything newer
+
+		for (top, cursor, stop, done) in runs:
+			if stop is None:
+				stop = storage.opSequence(storage.getLastOperation(name)) or 0
+			start = None
+			if cursor is not None:
+				if cursor - 1 <= stop:
+					checkpoints.clear(name)
+					continue
+				start = "1.11.%d" % (cursor - 1)
+
+			for page in iso.accountHistorySince(account["id"], "1.11.%d" % stop,
+					start_op_index=start):
+				prepare_page(iso, account, page, index_memos)
+				if halt is not None and halt.is_set():
+					# whoever halted us may be closing the store
+					log.info("History sync of %s interrupted, %d ops stored" % (name, synced))
+					return synced
+				if top is None:
+					top = storage.opSequence(page[0]['id'])
+					# ops below the first page are missing until we're done
+					checkpoints.setCheckpoint(name, top, top + 1, stop, done)
+				entries = store_page(iso, name, page)
+				# writes are applied in order, so the page is in before this
+				cursor = storage.opSequence(page[-1]['id'])
+				done += len(page)
+				synced += len(entries)
+				checkpoints.setCheckpoint(name, top, cursor, stop, done)
+				storage.settle() # page is on disk before anyone hears of it
+
+				pages += 1
+				if page_callback:
+					page_callback(entries)
+				if progress_callback:
+					percent = None
+					if total:
+						percent = min(100 * (stored + synced) // total, 100)
+					progress_callback(done, percent)
+				if max_pages and pages >= max_pages:
+					return synced
+				if halt is not None:
+					if halt.wait(throttle):
+						log.info("History sync of %s interrupted, %d ops stored" % (name, synced))
+						return synced
+				elif throttle:
+					time.sleep(throttle)
+
+			checkpoints.clear(name)
+
+	took = time.time() - started
+	if synced:
+		log.info("Synchronized %d ops of %s in %.2fs (%.1f ops/s)" % (
+			synced, name, took, synced / took if took else 0))
+	return synced
+
+
+class HistoryScheduler(object):
+	""" Keeps history of every wallet account current.
+
+	    Accounts are marked dirty (on 2.6.X statistics notices, when
+	    connected, or when asked for) and synced by a fixed number of
+	    worker threads. Each turn syncs at most a few pages of one
+	    account; if there is more, the account goes to the back of
+	    the line, so one huge history can't hold up the others.
+	    Accounts that got new entries are collected for the UI,
+	    see `flushUpdated`. A failed sync is retried after a delay
+	    that doubles with each failure in a row.
+	"""
+	RETRY_DELAY = 5
+	RETRY_DELAY_MAX = 300
+
+	def __init__(self, iso):
+		self.iso = iso
+		self.lock = threading.Condition()
+		self.accounts = { } # name to last seen most_recent_op
+		self.queue = deque() # dirty accounts, in turn order
+		self.running = set()
+		self.updated = set()
+		self.progress = { } # name to description
+		self.failures = { } # name to failed syncs in a row
+		self.workers = [ ]
+		self.halt = threading.Event() # one per run, see `start`
+		self.subscribed = False
+
+	def start(self, account_names):
+		""" Start keeping `account_names` in sync, marking them dirty """
+		config = self.iso.bts.config
+		threads = max(int(config.get('history-sync-threads', 2) or 1), 1)
+		with self.lock:
+			if self.halt.is_set():
+				# workers of the previous run keep their own (set)
+				# event and quit after the page they are on
+				self.halt = threading.Event()
+				self.workers = [ ]
+			self.subscribed = False
+			for name in account_names:
+				self.accounts.setdefault(name, None)
+				self._mark(name)
+			self.workers = [ t for t in self.workers if t.is_alive() ]
+			while len(self.workers) < threads:
+				t = threading.Thread(target=self.run, args=(self.halt, ), name="HistorySync")
+				t.daemon = True
+				t.start()
+				self.workers.append(t)
+
+	def stop(self, timeout=10):
+		""" Stop syncing and forget all accounts. Waits (up to
+		    `timeout` seconds each) for workers to quit, so none
+		    writes to the store once this returns; one still stuck
+		    in a request will quit without writing. """
+		with self.lock:
+			self.halt.set()
+			self.accounts.clear()
+			self.queue.clear()
+			self.progress.clear()
+			self.failures.clear()
+			self.lock.notify_all()
+			workers = self.workers
+		for t in workers:
+			t.join(timeout)
+
+	def markDirty(self, account_name, urgent=False):
+		""" Sync account soon, or next if `urgent` """
+		with self.lock:
+			if not account_name in self.accounts:
+				return
+			self._mark(account_name, urgent)
+
+	def noteAccount(self, account_name, note):
+		""" Handle 2.6.X (account statistics) notice """
+		with self.lock:
+			if not account_name in self.accounts:
+				return
+			recent = note.get('most_recent_op', None)
+			if recent and recent == self.accounts[account_name]:
+				return
+			self.accounts[account_name] = recent
+			self._mark(account_name)
+
+	def flushUpdated(self):
+		""" Returns names of accounts that got new entries
+		    since the last call """
+		with self.lock:
+			updated = self.updated
+			self.updated = set()
+		return updated
+
+	def status(self):
+		""" Returns list of progress descriptions """
+		with self.lock:
+			return list(self.progress.values())
+
+	def _mark(self, name, urgent=False):
+		if name in self.queue:
+			if not urgent:
+				return
+			self.queue.remove(name)
+		if urgent:
+			self.queue.appendleft(name)
+		else:
+			self.queue.append(name)
+		self.lock.notify()
+
+	def _take(self):
+		for name in self.queue:
+			if not name in self.running:
+				self.queue.remove(name)
+				self.running.add(name)
+				return name
+		return None
+
+	def _retry(self, name, halt):
+		with self.lock:
+			if not halt.is_set() and name in self.accounts:
+				self._mark(name)
+
+	def run(self, halt):
+		while True:
+			with self.lock:
+				name = self._take()
+				while name is None and not halt.is_set():
+					self.lock.wait()
+					name = self._take()
+				if halt.is_set():
+					if name:
+						self.running.discard(name)
+					return
+				self.progress[name] = "Synchronizing history of " + name
+			failed = None
+			try:
+				more = self._sync(name, halt)
+			except Exception as error:
+				failed = str(error) or type(error).__name__
+				more = False
+			with self.lock:
+				self.running.discard(name)
+				self.progress.pop(name, None)
+				if halt.is_set():
+					continue
+				if failed:
+					n = self.failures.get(name, 0)
+					self.failures[name] = n + 1
+					delay = min(self.RETRY_DELAY * 2 ** n, self.RETRY_DELAY_MAX)
+					log.warning("History sync of %s failed, retrying in %ds: %s" % (name, delay, failed))
+					t = threading.Timer(delay, self._retry, args=(name, halt))
+					t.daemon = True
+					t.start()
+					continue
+				self.failures.pop(name, None)
+				if more:
+					self._mark(name)
+
+	def _sync(self, name, halt):
+		""" Sync a few pages of account, returns True if there is more """
+		iso = self.iso
+		if iso.offline:
+			return False
+		with self.lock:
+			subscribe = None
+			if not self.subscribed:
+				subscribe = list(self.accounts.keys())
+				self.subscribed = True
+		if subscribe:
+			# 2.6.X notices of all wallet accounts from now on
+			try:
+				iso.bts.rpc.get_full_accounts(subscribe, True)
+			except:
+				with self.lock:
+					self.subscribed = False
+				raise
+		config = iso.bts.config
+		account = iso.getAccount(name)
+		def updated(entries):
+			if entries:
+				with self.lock:
+					self.updated.add(name)
+		def progress(done, percent):
+			text = "Synchronizing history of %s: %d ops" % (name, done)
+			if percent is not None:
+				text += " (%d%%)" % percent
+			with self.lock:
+				self.progress[name] = text
+		sync_history(iso, account,
+			page_callback=updated,
+			progress_callback=progress,
+			throttle=float(config.get('history-sync-delay', 0.5) or 0),
+			halt=halt,
+			max_pages=int(config.get('history-sync-pages', 5) or 0))
+		return iso.store.checkpointStorage.getCheckpoint(name) is not None
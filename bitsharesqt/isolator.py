@@ -29,6 +29,7 @@
 		iso.connect(url) # regular BitSharesRPC.connect arguments
 	
 """
+import json
 import logging
 log = logging.getLogger(__name__)
 
@@ -48,6 +49,104 @@ class TimeOut(Exception):
 class WalletLocked(Exception):
 	pass
 
+from collections import namedtuple, OrderedDict
+AssetInfo = namedtuple('AssetInfo', [ 'id', 'symbol', 'precision', 'issuer' ])
+
+class BoundedCache(object):
+	""" Thread-safe dict which forgets least recently used keys
+	    beyond `size` """
+	def __init__(self, size=4096):
+		import threading
+		self.size = size
+		self._lock = threading.Lock()
+		self._data = OrderedDict()
+	
+	def __contains__(self, key):
+		return key in self._data
+	
+	def __len__(self):
+		return len(self._data)
+	
+	def get(self, key, default=None):
+		with self._lock:
+			if not(key in self._data):
+				return default
+			self._data.move_to_end(key)
+			return self._data[key]
+	
+	def put(self, key, value):
+		with self._lock:
+			self._data[key] = value
+			self._data.move_to_end(key)
+			while len(self._data) > self.size:
+				self._data.popitem(last=False)
+	
+	def clear(self):
+		with self._lock:
+			self._data.clear()
+
+class AssetRegistry(object):
+	""" Bounded LRU of Asset objects, keyed by both id and symbol,
+	    plus a (larger) one of light `AssetInfo` records. """
+	def __init__(self, size=512, info_size=8192):
+		import threading
+		self.size = size
+		self.info_size = info_size
+		self._lock = threading.Lock()
+		self._assets = OrderedDict()
+		self._infos = OrderedDict()
+	
+	@staticmethod
+	def _lookup(lru, key):
+		value = lru.get(key, None)
+		if value is not None:
+			lru.move_to_end(key)
+		return value
+	
+	@staticmethod
+	def _store(lru, value, limit, *keys):
+		for key in keys:
+			lru[key] = value
+			lru.move_to_end(key)
+		while len(lru) > limit * 2: # two keys per entry
+			lru.popitem(last=False)
+	
+	def get(self, key):
+		with self._lock:
+			return self._lookup(self._assets, key)
+	
+	def getInfo(self, key):
+		with self._lock:
+			return self._lookup(self._infos, key)
+	
+	def put(self, asset):
+		info = AssetInfo(asset["id"], asset["symbol"], int(asset["precision"]), asset.get("issuer"))
+		with self._lock:
+			self._store(self._assets, asset, self.size, info.id, info.symbol)
+			self._store(self._infos, info, self.info_size, info.id, info.symbol)
+		return info
+	
+	def putInfo(self, asset):
+		""" Remember only the light record of `asset` (dict) """
+		info = AssetInfo(asset["id"], asset["symbol"], int(asset["precision"]), asset.get("issuer"))
+		with self._lock:
+			self._store(self._infos, info, self.info_size, info.id, info.symbol)
+		return info
+	
+	def invalidate(self, *keys):
+		with self._lock:
+			for key in keys:
+				info = self._infos.get(key, None)
+				# drop the other key too
+				for k in ((info.id, info.symbol) if info else (key, )):
+					self._assets.pop(k, None)
+					self._infos.pop(k, None)
+	
+	def clear(self):
+		with self._lock:
+			self._assets.clear()
+			self._infos.clear()
+
 class BitsharesIsolator(object):
 	enabled = False
 	@classmethod
@@ -77,9 +176,21 @@ class BitsharesIsolator(object):
 		self.subscribed_accounts = set()
 		self.subscribed_markets = set()
 		
-		self.minicache_accnames = {} # 1.2.ID to name
+		self.minicache_accnames = BoundedCache(4096) # 1.2.ID to name
 		self.fave_coinnames = set() # semi-random
 		self.fave_markets = set() # same
+		self.head_block = None # last seen 2.1.0 head_block_number
+		self.asset_registry = AssetRegistry()
+		self.market_cache = BoundedCache(512) # name to (time, market)
+		self._rpc_pool = None
+		import threading
+		self._process_pool = None
+		self._process_lock = threading.Lock()
+		self.trxid_cache = BoundedCache(65536) # `trxKey` to trxid
+		self.history_locks = { }
+		
+		from .historysync import HistoryScheduler
+		self.history_scheduler = HistoryScheduler(self)
 		
 		#from bitsharesapi.bitsharesnoderpc import BitSharesNodeRPC
 	
@@ -161,7 +272,12 @@ class BitsharesIsolator(object):
 		self.bts.wallet = wallet
 	
 	def setStorage(self, storage):
+		if self.store and self._assetsChanged in self.store.assetStorage.listeners:
+			self.store.assetStorage.listeners.remove(self._assetsChanged)
 		self.store = storage
+		self.asset_registry.clear()
+		if storage is not None:
+			storage.assetStorage.listeners.append(self._assetsChanged)
 		if storage is None:
 			self.bts.config = { }
 			self.accountStorage = { }
@@ -171,36 +287,26 @@ class BitsharesIsolator(object):
 			self.accountStorage = self.store.accountStorage
 			self.assetStorage = self.store.assetStorage
 	
+	def _assetsChanged(self, *keys):
+		""" Keep asset registry in line with storage """
+		if keys:
+			self.asset_registry.invalidate(*keys)
+		else:
+			self.asset_registry.clear()
+	
 	def flush_notes(self):
 		if not self.bts.rpc:
 			return [ ]
 		return self.bts.rpc.flush_notes()
 	
-	def storeBalances(self, account_name, blnc):
-		store = self.store.accountStorage
-		#import json
-		#graphene_json = store.getByName(account_name);
-		#print(aku)
-		#graphene_json = json.loads(store.getByName(account_name)['raw'])
-		#graphene_json['balances'] = blnc
-		#store.updateRawJSON(account_name, json.dumps(blnc))
-		store.update(account_name, 'balances_json', blnc)
-	
-	def injectBalance(self, account_id, asset_symbol, amount):
-		iso = self
-		store = self.store.accountStorage
-		account = self.getAccount(account_id, force_remote=False)
-		asset = self.getAsset(asset_symbol)
-		value = int(amount) / pow(10, asset["precision"])
-		acc_blnc = iso.getBalances(account["id"])
-		blnc = { }
-		for o in acc_blnc:
-			blnc[o.symbol] = o.amount
-		blnc[asset_symbol] = value
-		#print("Post-inject", blnc)
-		self.storeBalances(account["name"], blnc)
-		account._balances = blnc
-		return account
+	def storeBalances(self, account_id, op_balances):
+		store = self.store.balanceStorage
+		blnc = [ (op["asset_id"], int(op["amount"])) for op in op_balances ]
+		store.setBalances(account_id, blnc, self.head_block)
+	
+	def injectBalance(self, account_id, asset_id, amount):
+		store = self.store.balanceStorage
+		store.setBalance(account_id, asset_id, int(amount), self.head_block)
 	
 	def getRemoteAccounts(self):
 		if self.offline or not self.bts.wallet.rpc:
@@ -289,13 +395,32 @@ class BitsharesIsolator(object):
 		return privs
 	
 	def getAccountFromPublicKey(self, pubkey):
-		account_names = self.getCachedAccounts()
-		for account_name in account_names:
-			pubs = self.getLocalAccountKeys(account_name)
-			if pubkey in pubs:
-				return account_name
+		""" Returns name of a cached account having `pubkey` """
+		found = self.store.accountKeyStorage.getAccounts([ pubkey ], references=False)
+		for account_id in found.get(pubkey, [ ]):
+			name = self.resolveAccountNames([ account_id ], remote=False).get(account_id)
+			if name:
+				return name
 		raise KeyError("Account with key " + pubkey)
 	
+	def getAccountsFromPublicKeys(self, pubkeys, remote=True):
+		""" Returns dict of pubkey => list of account ids, from the
+		    key index, asking the node about the unknown keys with
+		    a single get_key_references call (if `remote`). """
+		store = self.store.accountKeyStorage
+		pubkeys = list(set(pubkeys))
+		found = store.getAccounts(pubkeys)
+		missing = [ pub for pub in pubkeys if not(pub in found) ]
+		if missing and remote and not(self.offline):
+			references = [ ]
+			for pub, account_ids in zip(missing, self.bts.rpc.get_key_references(missing)):
+				if not account_ids:
+					continue
+				found[pub] = list(account_ids)
+				references += [ (pub, account_id) for account_id in account_ids ]
+			store.addReferences(references)
+		return found
+	
 	def getAccount(self, account_id, force_remote=False, force_local=False, cache=False):
 		
 		if account_id.startswith("1.2."):
@@ -322,7 +447,7 @@ class BitsharesIsolator(object):
 				raise ResourceUnavailableOffline("Account %s" % str(account_id))
 			if account_id.startswith("BTS"): # looks like public key
 				try: # maybe node knows something
-					account_id = self.bts.wallet.getAccountFromPublicKey(account_id)
+					account_id = self.getAccountsFromPublicKeys([ account_id ])[account_id][0]
 				except:
 					import traceback
 					traceback.print_exc()
@@ -339,6 +464,11 @@ class BitsharesIsolator(object):
 		return account
 	
 	def getAsset(self, asset_id, cache=True, force_remote=False):
+		if not(force_remote):
+			known = self.asset_registry.get(asset_id)
+			if known:
+				return known
+		
 		from bitshares.asset import Asset
 		
 		if not(force_remote):
@@ -361,6 +491,7 @@ class BitsharesIsolator(object):
 			forged_asset.asset = stored_asset["symbol"]
 			for k, v in stored_asset.items():
 				forged_asset[k] = v
+			self.asset_registry.put(forged_asset)
 			return forged_asset
 		
 		if self.offline:
@@ -376,9 +507,34 @@ class BitsharesIsolator(object):
 		
 		if cache:
 			self.saveAsset(remote_asset)
+			self.asset_registry.put(remote_asset)
 		
 		return remote_asset
 	
+	def getAssetInfo(self, asset_id):
+		""" Returns light `AssetInfo` (id, symbol, precision, issuer) record """
+		info = self.asset_registry.getInfo(asset_id)
+		if info:
+			return info
+		return self.asset_registry.put(self.getAsset(asset_id))
+	
+	def resolveAssetInfos(self, asset_ids):
+		""" Find `AssetInfo` records of many 1.3.X assets at once: from
+		    memory, then with a single storage query. Returns dict of
+		    id => AssetInfo, unknown assets are left out. """
+		found = { }
+		missing = [ ]
+		for asset_id in asset_ids:
+			info = self.asset_registry.getInfo(asset_id)
+			if info:
+				found[asset_id] = info
+			else:
+				missing.append(asset_id)
+		if missing and self.store:
+			for asset in self.assetStorage.getManyById(missing):
+				found[asset["id"]] = self.asset_registry.putInfo(asset)
+		return found
+	
 	def storeAccount(self, account):
 		iso = self
 		accountStore = iso.accountStorage
@@ -389,24 +545,161 @@ class BitsharesIsolator(object):
 		if "balances" in jsond:
 			jsond.pop("balances")
 		
-		blnc = { }
-		for amount in self.getBalances(account['id'], force_local = True):#.balances:
-			blnc[str(amount.symbol)] = float(amount)
-		
 		try:
 			accountStore.add(account['name'], account['id'])
 		except ValueError: # already exists
 			pass # it's ok
 		accountStore.update(account['name'], 'graphene_json', jsond)
-		accountStore.update(account['name'], 'balances_json', blnc)
+		
+		self.store.accountNameStorage.saveMany([ (account['id'], account['name']) ])
+		from bitsharesextra.storage import account_keys
+		self.store.accountKeyStorage.setKeys(account['id'], account_keys(jsond))
+		self.minicache_accnames.put(account['id'], account['name'])
 	
 	def saveAsset(self, asset):
 		store = self.assetStorage
-		exists = store.getById(asset['id'])
-		if exists:
-			store.update(asset['id'], asset)
-		else:
-			store.add(asset['id'], asset['symbol'], asset)
+		store.save(asset['id'], asset['symbol'], asset)
+		self.asset_registry.invalidate(asset['id'], asset['symbol'])
+	
+	def getTransaction(self, block_num, trx_in_block, trxid=None, cache=True):
+		store = self.store.transactionStorage
+		entry = store.getEntry(block_num, trx_in_block)
+		if entry and entry["trxfull"]:
+			return json.loads(entry["trxfull"])
+		
+		if self.offline:
+			raise ResourceUnavailableOffline("Transaction %d/%d" % (block_num, trx_in_block))
+		
+		ftx = self.bts.rpc.get_transaction(block_num, trx_in_block)
+		if cache and ftx:
+			store.add(block_num, trx_in_block, trxid, json.dumps(ftx))
+		return ftx
+	
+	def getTransactions(self, positions):
+		""" Get many full transactions by (block_num, trx_in_block).
+		    Duplicates are fetched once, stored ones are not fetched at
+		    all. Blocks holding several of them are fetched whole with
+		    get_block, the rest with concurrent get_transaction calls.
+		    Returns dict of position => transaction ({} if unavailable). """
+		import time
+		started = time.time()
+		wanted = set( (int(b), int(t)) for b, t in positions )
+		found = { }
+		if self.store:
+			for pos, (trxfull, trxid) in self.store.transactionStorage.getMany(wanted).items():
+				if trxfull and trxfull != '{}':
+					found[pos] = json.loads(trxfull)
+					if trxid and trxid != '...':
+						self.trxid_cache.put(self.trxKey(found[pos]), trxid)
+		missing = wanted - set(found.keys())
+		if not missing:
+			return found
+		if self.offline:
+			raise ResourceUnavailableOffline("Transactions")
+		
+		by_block = { }
+		for block_num, trx_in_block in missing:
+			by_block.setdefault(block_num, [ ]).append(trx_in_block)
+		rpc = self.bts.rpc
+		pool = self._rpcPool()
+		futures = { }
+		for block_num, trxs in by_block.items():
+			if len(trxs) > 1:
+				futures[pool.submit(rpc.get_block, block_num)] = (block_num, trxs)
+			else:
+				futures[pool.submit(rpc.get_transaction, block_num, trxs[0])] = (block_num, trxs)
+		for future, (block_num, trxs) in futures.items():
+			try:
+				reply = future.result()
+			except Exception as error:
+				log.debug("Failed to get transaction(s) of block %d: %s" % (block_num, str(error)))
+				reply = None
+			if len(trxs) > 1:
+				block_trxs = reply.get("transactions", [ ]) if reply else [ ]
+				# newer nodes list ids too, saves us computing them
+				block_ids = reply.get("transaction_ids", [ ]) if reply else [ ]
+				for t in trxs:
+					found[(block_num, t)] = block_trxs[t] if t < len(block_trxs) else { }
+					if t < len(block_ids) and block_ids[t] and t < len(block_trxs):
+						self.trxid_cache.put(self.trxKey(block_trxs[t]), block_ids[t])
+			else:
+				found[(block_num, trxs[0])] = reply or { }
+		
+		took = time.time() - started
+		log.debug("Got %d transactions (%d fetched, %d requests) in %.2fs" % (
+			len(wanted), len(missing), len(futures), took))
+		return found
+	
+	def getTransactionIds(self, trxs):
+		""" Get ids of many full transactions, `trxs` is a dict of
+		    position (block_num, trx_in_block) => transaction. Ids
+		    we have seen (stored, or listed by get_block) are not
+		    computed again; the rest are computed in bulk, by a
+		    process pool if there are enough of them.
+		    Returns dict of position => id ('' if it can't be had). """
+		import time
+		from .historysync import transaction_id
+		ids = { }
+		missing = [ ]
+		keys = { }
+		for pos, ftx in trxs.items():
+			if not ftx:
+				continue
+			keys[pos] = self.trxKey(ftx)
+			trxid = self.trxid_cache.get(keys[pos], None)
+			if trxid:
+				ids[pos] = trxid
+			else:
+				missing.append(pos)
+		if not missing:
+			return ids
+		
+		started = time.time()
+		computed = None
+		pool = None
+		try:
+			if len(missing) >= int(self.bts.config.get('trxid-process-min', 32) or 0):
+				pool = self._processPool()
+			if pool:
+				chunk = max(1, len(missing) // (self._process_workers * 4))
+				computed = list(pool.map(transaction_id,
+					[ trxs[pos] for pos in missing ], chunksize=chunk))
+		except Exception as error:
+			log.warning("Transaction id process pool failed, computing in-thread: %s" % str(error))
+			if pool:
+				pool.shutdown(wait=False)
+			self._process_pool = False # don't try again
+			pool = None
+		if computed is None:
+			computed = [ transaction_id(trxs[pos]) for pos in missing ]
+		
+		for pos, trxid in zip(missing, computed):
+			ids[pos] = trxid
+			if trxid:
+				self.trxid_cache.put(keys[pos], trxid)
+		took = time.time() - started
+		log.debug("Computed %d transaction ids in %.2fs%s" % (
+			len(missing), took, " (process pool)" if pool else ""))
+		return ids
+	
+	@staticmethod
+	def trxKey(ftx):
+		""" `trxid_cache` key of full transaction (dict): digest of
+		    its canonical JSON. Unlike its chain position, this can't
+		    be mistaken for another transaction (other network,
+		    forked block). """
+		import hashlib
+		return hashlib.sha1(json.dumps(ftx, sort_keys=True).encode('utf-8')).digest()
+	
+	def pruneTransactions(self):
+		config = self.bts.config
+		days = int(config.get('trx-retention-days', 0) or 0)
+		rows = int(config.get('trx-retention-rows', 0) or 0)
+		if not days and not rows:
+			return 0
+		n = self.store.transactionStorage.prune(self.store.historyStorage, days, rows)
+		log.debug("Pruned %d cached transactions" % n)
+		return n
 	
 	def getAmount(self, asset_amount, asset_id):
 		asset = self.getAsset(asset_id)
@@ -432,17 +725,16 @@ class BitsharesIsolator(object):
 	def getBalances(self, account_name_or_id, force_local=False, force_remote=False, cache=True):
 		account = self.getAccount(account_name_or_id)
 		balances = [ ]
-		if hasattr(account, '_balances') and not(force_remote):
-			for sym,val in account._balances.items():
+		if not(force_remote):
+			for asset_id, amount_int in self.store.balanceStorage.getBalances(account["id"]):
 				try:
-					b = self.getAmountOP({"amount":val, "asset": sym})
+					b = self.getAmount(amount_int, asset_id)
 				except:
-					b = lambda: None
-					b.symbol = sym
-					b.amount = val
-				self.fave_coinnames.add(sym)
-				balances.append( b ) #Amount(val, sym, bitshares_instance=self.iso.bts) )
-			return balances
+					continue
+				self.fave_coinnames.add(b.symbol)
+				balances.append( b )
+			if balances:
+				return balances
 		
 		if force_local:
 			return balances
@@ -455,13 +747,16 @@ class BitsharesIsolator(object):
 			balances.append(b)
 		
 		if cache:
-			blnc = { }
-			for b in balances:
-				blnc[b.symbol] = b.amount
-			self.storeBalances(account["name"], blnc)
+			self.storeBalances(account["id"], op_balances)
 		
 		return balances
 	
+	def getTotalBalances(self, account_ids=None):
+		balances = [ ]
+		for asset_id, amount_int in self.store.balanceStorage.getTotals(account_ids):
+			balances.append( self.getAmount(amount_int, asset_id) )
+		return balances
+	
 	def getMemo(self, from_account, to_account, text=None, data=None):
 		if (data):
 			from_account = data["from"]
@@ -551,17 +846,48 @@ class BitsharesIsolator(object):
 	def softAccountName(self, account_id, remote=True):
 		if not(account_id.startswith("1.2.")):
 			return account_id # already a perfect name
-		cache = self.minicache_accnames
-		if account_id in cache:
-			return cache[account_id]
+		name = self.minicache_accnames.get(account_id)
+		if name:
+			return name
 		try:
-			account = self.getAccount(account_id, force_remote=remote)
+			names = self.resolveAccountNames([ account_id ], remote=remote)
 		except:
-			account = None
-		if account:
-			cache[account_id] = account["name"]
-			return account["name"]
-		return account_id
+			names = { }
+		return names.get(account_id, account_id)
+	
+	def resolveAccountNames(self, account_ids, remote=True):
+		""" Find names of many 1.2.X accounts at once: from memory,
+		    then the account directory, then (if `remote`) with
+		    a single get_objects call. Returns dict of id => name. """
+		cache = self.minicache_accnames
+		found = { }
+		missing = set()
+		for account_id in account_ids:
+			if not(account_id.startswith("1.2.")):
+				continue
+			name = cache.get(account_id)
+			if name:
+				found[account_id] = name
+			else:
+				missing.add(account_id)
+		if missing and self.store:
+			for account_id, name in self.store.accountNameStorage.getNames(missing).items():
+				cache.put(account_id, name)
+				found[account_id] = name
+				missing.discard(account_id)
+		if missing and remote and not(self.offline):
+			missing = list(missing)
+			learned = [ ]
+			for j in range(0, len(missing), 100):
+				for account in self.bts.rpc.get_objects(missing[j:j+100]):
+					if account:
+						learned.append( (account["id"], account["name"]) )
+			for account_id, name in learned:
+				cache.put(account_id, name)
+				found[account_id] = name
+			if learned and self.store:
+				self.store.accountNameStorage.saveMany(learned)
+		return found
 	
 	def bootstrap_wallet(self, wipe=False):
 		import bitsharesqt.bootstrap as bootstrap
@@ -577,142 +903,40 @@ class BitsharesIsolator(object):
 		for n in bootstrap.KnownNodes:
 			store.add(0, n[0], n[1], n[2])
 	
+	def accountHistorySince(self, account_id, last_op_index=None, limit=100, start_op_index=None):
+		""" Yield pages (lists, newest first) of account operations
+		    newer than `last_op_index` ("1.11.X"), using explicit
+		    start/stop bounds of the history API. Nothing new costs
+		    a single (empty) request. Pass `start_op_index` to begin
+		    at that operation instead of the most recent one. """
+		if self.offline:
+			raise ResourceUnavailableOffline("History of " + account_id)
+		rpc = self.bts.rpc
+		stop = last_op_index or "1.11.0"
+		stop_seq = int(stop.split(".")[2])
+		start = start_op_index or "1.11.0" # most recent
+		while True:
+			page = rpc.get_account_history(account_id, stop, limit, start, api="history")
+			if not page:
+				break
+			yield page
+			oldest = int(page[-1]['id'].split(".")[2])
+			if len(page) < limit or oldest - 1 <= stop_seq:
+				break
+			start = "1.11.%d" % (oldest - 1)
+	
+	def historyLock(self, account_name):
+		""" Lock held while history of account is being synchronized """
+		import threading
+		return self.history_locks.setdefault(account_name, threading.Lock())
+	
 	def historyDescription(iso, h, account=None):
-		accname = iso.softAccountName
-		#from pprint import pprint
-		#pprint(h)
-		
-		op_id, op_action = h['op']
-		res_id, op_result = h['result']
-		
-		desc = "Some operation"
-		plus = ""
-		minus = ""
-		short = ""
-		from bitsharesbase.operations import getOperationNameForId
-		icon = getOperationNameForId(op_id).lower()
-		if (op_id == 0):
-			desc = "Transfer"
-			#from_account = iso.getAccount(op_action['from'])
-			#to_account = iso.getAccount(op_action['to'])
-			amt = iso.getAmountOP(op_action['amount'])
-			desc += " from " + accname(op_action['from']) #from_account['name']
-			desc += " to " + accname(op_action['to']) #to_account['name']
-			desc += " - " + str(amt)
-			if account and account["id"] == op_action["from"]:
-				short = "Transfered to " + accname(op_action['to'])
-				minus = str(amt)
-				icon = "transfer_to"
-			if account and account["id"] == op_action["to"]:
-				short = "Transfered from " + accname(op_action['from'])
-				plus = str(amt)
-				icon = "transfer_from"
-		if (op_id == 1):
-			desc = "Place order"
-			amt_a = iso.getAmountOP(op_action['amount_to_sell'])
-			amt_b = iso.getAmountOP(op_action['min_to_receive'])
-			desc += " for "
-			desc += str(amt_b)
-			desc += " paying "
-			desc += str(amt_a)
-		if (op_id == 2):
-			desc = "Cancel order"
-		if (op_id == 4):
-			desc = "Traded"
-			#who = Account(op_action['account_id'])
-			amt_a = iso.getAmountOP(op_action['pays'])
-			amt_b = iso.getAmountOP(op_action['receives'])
-			desc += " - " + str(amt_a) + " for "
-			desc += str(amt_b)
-			short = "Traded"
-			plus = str(amt_b)
-			minus = str(amt_a)
-		if (op_id == 5):
-			desc = "Register account"
-			#reg_account = iso.getAccount(op_action['registrar'])
-			#dst_account = iso.getAccount(op_action['name'])
-			desc += " by " + accname(op_action['registrar']) #reg_account['name']
-			desc += " - " + accname(op_action['name']) #self.softAccountName(#dst_account['name']
-		if (op_id == 8):
-			desc = "Upgrade account"
-			#dst_account = iso.getAccount(op_action['account_to_upgrade'])
-			desc += " - " + accname(op_action['account_to_upgrade']) #self.softAccountName(#dst_account['name']
-		if (op_id == 10):
-			desc = "Create asset"
-			try:
-				reg_asset = iso.getAsset(op_action['symbol'])
-			except:
-				pass
-			#reg_account = iso.getAccount(op_action['issuer'])
-			desc += " by " + accname(op_action["issuer"]) #reg_account['name']
-			desc += " - " + op_action["symbol"].upper() #reg_asset["symbol"]
-		if (op_id == 11):
-			desc = "Update asset"
-			try:
-				reg_asset = iso.getAsset(op_action['asset_to_update'])
-				desc += " - " + reg_asset["symbol"]
-			except:
-				pass
-		if (op_id == 12):
-			desc = "Update bitasset"
-			try:
-				reg_asset = iso.getAsset(op_action['asset_to_update'])
-				desc += " - " + reg_asset["symbol"]
-			except:
-				pass
-		if (op_id == 14):
-			desc = "Issue"
-			is_asset = iso.getAsset(op_action['asset_to_issue']['asset_id'])
-			amt = iso.getAmountOP(op_action['asset_to_issue'])
-			desc += " by " + accname(op_action["issuer"])
-			desc += " to " + accname(op_action["issue_to_account"])
-			desc += " - " + str(amt)
-			if account and account["id"] == op_action["issue_to_account"]:
-				short = "Issued from " + accname(op_action['issuer'])
-				plus = str(amt)
-				icon = "transfer_from"
-			if account and account["id"] == op_action["issuer"]:
-				short = "Issued to " + accname(op_action['issue_to_account'])
-				minus = str(amt)
-				icon = "transfer_to"
-		if (op_id == 15):
-			desc = "Reserved"
-			is_asset = iso.getAsset(op_action['amount_to_reserve']['asset_id'])
-			amt = iso.getAmountOP(op_action['amount_to_reserve'])
-			desc += " by " + accname(op_action["payer"])
-			desc += " - " + str(amt)
-			minus = str(amt)
-			if is_asset["issuer"] == op_action["payer"]:
-				plus = str(amt)
-			short = "Reserved by " + accname(op_action["payer"]) + " - " + str(amt)
-		if (op_id == 39):
-			desc = "Transfer to blind"
-			amt = iso.getAmountOP(op_action['amount'])
-			desc += " - " + str(amt)
-			short = "Transfered to blind"
-			minus = str(amt)
-		if (op_id == 40):
-			desc = "Blind transfer"
-#			amt = iso.getAmountOP(op_action['amount'])
-#			desc += " - " + str(amt)
-			short = "Blind transfer"
-#			minus = str(amt)
-		if (op_id == 41):
-			desc = "Transfer from blind"
-			desc += " to " + accname(op_action['to']) #reg_account['name']
-			amt = iso.getAmountOP(op_action['amount'])
-			desc += " - " + str(amt)
-			short = "Transfered from blind"
-			#short += " to " + accname(op_action['to']) #reg_account['name']
-			plus = str(amt)
-		
-		return {
-			"long": desc,
-			"short": short,
-			"plus": plus,
-			"minus": minus,
-			"icon": icon,
-		}
+		return iso.historyDescriptions([ h ], account)[0]
+	
+	def historyDescriptions(iso, entries, account=None):
+		""" Describe many operations at once, see `describe.describe_many` """
+		from .describe import describe_many
+		return describe_many(iso, entries, account)
 	
 	class WalletGate(object):
 		def __init__(self, wallet):
@@ -733,45 +957,257 @@ class BitsharesIsolator(object):
 		return self.WalletGate( self.bts.wallet )
 	
 	
-	def download_assets(self):
+	def assetCrawlPending(self):
+		""" True if last `download_assets` was interrupted """
+		return bool(self.bts.config.get('assets-crawl-symbol', None))
+	
+	def download_assets(self, restart=False):
+		""" Crawl all assets, `list_assets` page by page, keeping
+		    the request for the next page in flight while the current
+		    one is processed. Pages are gathered into batches of
+		    "assets-crawl-batch" assets, which get their data with one
+		    get_objects call and are stored in one transaction. Last
+		    stored symbol is checkpointed to config, so an interrupted
+		    crawl resumes from there. """
 		store = self.store.assetStorage
+		config = self.bts.config
 		rpc = self.bts.rpc
 		
-		lower_bound_symbol = ""
+		if restart:
+			config['assets-crawl-symbol'] = ""
+		lower_bound_symbol = config.get('assets-crawl-symbol', None) or ""
 		limit = 100
+		batch_size = max(int(config.get('assets-crawl-batch', 500) or 0), limit)
+		
+		batch = [ ]
+		def flush():
+			if not batch:
+				return
+			self._fill_asset_data(batch)
+			store.saveMany([ (a['id'], a['symbol'], a) for a in batch ])
+			for a in batch:
+				self.asset_registry.invalidate(a['id'], a['symbol'])
+			config['assets-crawl-symbol'] = batch[-1]['symbol']
+			del batch[:]
 		
-		done = False
-		while not done:
+		from concurrent.futures import ThreadPoolExecutor
+		prefetch = ThreadPoolExecutor(max_workers=1)
+		try:
 			if self.offline:
 				raise ResourceUnavailableOffline("Asset batch")
-			batch = rpc.list_assets(lower_bound_symbol, limit)
-			dynamic_ids = [ ]
-			bitasset_ids = [ ]
-			bitasset_assets = [ ]
-			for asset in batch:
-				if "bitasset_data_id" in asset and asset["bitasset_data_id"]:
-				#	asset["bitasset_data"] = rpc.get_object(asset["bitasset_data_id"])
-					bitasset_ids.append(asset["bitasset_data_id"])
-					bitasset_assets.append(asset)
-				#asset["dynamic_asset_data"] = rpc.get_object(asset["dynamic_asset_data_id"])
-				dynamic_ids.append(asset["dynamic_asset_data_id"])
-			if len(bitasset_ids) > 0:
-				bit_data = rpc.get_objects(bitasset_ids)
-				j = -1
-				for reply in bit_data:
-					j += 1
-					bitasset_assets[j]["bitasset_data"] = reply
-			dyn_data = rpc.get_objects(dynamic_ids)
-			j = -1
-			for reply in dyn_data:
-				j += 1
-				batch[j]["dynamic_asset_data"] = reply
-			for asset in batch:
-				self.saveAsset(asset)
+			pending = prefetch.submit(rpc.list_assets, lower_bound_symbol, limit)
+			bound = None
+			while pending:
+				page = pending.result()
+				pending = None
+				if len(page) >= limit:
+					if self.offline:
+						raise ResourceUnavailableOffline("Asset batch")
+					pending = prefetch.submit(rpc.list_assets, page[-1]['symbol'], limit)
+				if page and page[0]['id'] == bound:
+					page = page[1:] # lower bound is inclusive
+				if page:
+					bound = page[-1]['id']
+				batch.extend(page)
+				if len(batch) >= batch_size:
+					flush()
+			flush()
+		finally:
+			prefetch.shutdown(wait=False)
+		
+		config['assets-crawl-symbol'] = ""
+		catalog = self.store.assetCatalog
+		if catalog and store.catalogStorage:
+			import time
+			catalog.setMeta('updated', int(time.time()))
+	
+	def _fill_asset_data(self, batch):
+		""" Fetch dynamic and bitasset data of a batch of assets,
+		    with a single get_objects call """
+		from bitsharesextra.storage import ASSET_DATA_KEYS
+		object_ids = [ ]
+		targets = [ ]
+		for asset in batch:
+			for kind, (id_key, data_key) in ASSET_DATA_KEYS.items():
+				if asset.get(id_key):
+					object_ids.append(asset[id_key])
+					targets.append( (asset, data_key) )
+		if not object_ids:
+			return
+		for (asset, data_key), reply in zip(targets, self.bts.rpc.get_objects(object_ids)):
+			asset[data_key] = reply
+	
+	def _staleAssetData(self, assets):
+		""" Returns {object_id: (asset, kind)} of dynamic/bitasset
+		    objects of `assets` older than their TTL """
+		from bitsharesextra.storage import ASSET_DATA_KEYS
+		config = self.bts.config
+		ttl = {
+			"dynamic": int(config.get('asset-dynamic-ttl', 300) or 0),
+			"bitasset": int(config.get('asset-bitasset-ttl', 900) or 0),
+		}
+		wanted = { }
+		for asset in assets:
+			for kind, (id_key, data_key) in ASSET_DATA_KEYS.items():
+				if asset.get(id_key):
+					wanted[asset[id_key]] = (asset, kind)
+		if not wanted:
+			return { }
+		import time
+		now = time.time()
+		updated = self.store.assetDataStorage.getUpdated(wanted.keys())
+		return { oid: entry for oid, entry in wanted.items()
+			if now - (updated.get(oid) or 0) >= ttl[entry[1]] }
+	
+	def assetDataStale(self, asset):
+		return bool(self._staleAssetData([ asset ]))
+	
+	def refreshAssetData(self, assets):
+		""" Re-fetch stale dynamic/bitasset data of `assets` with
+		    a single get_objects call. Returns number of objects
+		    refreshed. """
+		from bitsharesextra.storage import ASSET_DATA_KEYS
+		stale = self._staleAssetData(assets)
+		if not stale:
+			return 0
+		if self.offline:
+			raise ResourceUnavailableOffline("Asset data")
+		object_ids = list(stale.keys())
+		rows = [ ]
+		for object_id, reply in zip(object_ids, self.bts.rpc.get_objects(object_ids)):
+			if not reply:
+				continue
+			asset, kind = stale[object_id]
+			rows.append( (object_id, asset["id"], kind, reply) )
+		self.store.assetDataStorage.saveMany(rows)
+		for object_id, asset_id, kind, reply in rows:
+			self.asset_registry.invalidate(asset_id)
+		return len(rows)
+	
+	def download_new_assets(self):
+		""" Fetch assets created after the newest one we know,
+		    probing object ids 100 at a time. Returns number found. """
+		store = self.store.assetStorage
+		rpc = self.bts.rpc
+		limit = 100
+		next_id = store.maxInstance() + 1
+		found = 0
+		while True:
+			if self.offline:
+				raise ResourceUnavailableOffline("Asset batch")
+			ids = [ "1.3.%d" % n for n in range(next_id, next_id + limit) ]
+			batch = [ a for a in rpc.get_objects(ids) if a ]
+			if not batch:
+				break
+			self._fill_asset_data(batch)
+			store.saveMany([ (a['id'], a['symbol'], a) for a in batch ])
+			for a in batch:
+				self.asset_registry.invalidate(a['id'], a['symbol'])
+			found += len(batch)
 			if len(batch) < limit:
 				break
-			last = batch[-1]
-			lower_bound_symbol = last['symbol']
+			next_id += limit
+		log.debug("Found %d new assets" % found)
+		return found
+	
+	def refresh_known_assets(self, upto_instance, ping_callback=None):
+		""" Re-fetch assets 1.3.0 to 1.3.`upto_instance`, 100 per
+		    get_objects call, saving those whose definition (issuer,
+		    options, flags...) changed. Returns number changed. """
+		from bitsharesextra.storage import split_asset_data
+		store = self.store.assetStorage
+		rpc = self.bts.rpc
+		limit = 100
+		changed = 0
+		for first in range(0, upto_instance + 1, limit):
+			if self.offline:
+				raise ResourceUnavailableOffline("Asset batch")
+			ids = [ "1.3.%d" % n for n in range(first, min(first + limit, upto_instance + 1)) ]
+			known = { a["id"]: a for a in store.getManyById(ids) }
+			updated = [ ]
+			for remote in rpc.get_objects(ids):
+				if not remote:
+					continue
+				static, _ = split_asset_data(remote)
+				if known.get(remote["id"]) != static:
+					updated.append(remote)
+			if updated:
+				store.saveMany([ (a['id'], a['symbol'], a) for a in updated ])
+				changed += len(updated)
+			if ping_callback:
+				from .work import Request
+				ping_callback(Request.PT_PROGRESS, "Checking known assets: %d of %d" % (
+					min(first + limit, upto_instance + 1), upto_instance + 1))
+		log.debug("Refreshed %d changed assets" % changed)
+		return changed
+	
+	def exportAssets(self, path):
+		header = { }
+		catalog = self.store.assetCatalog
+		if not(self.offline):
+			header["chain_id"] = self.bts.rpc.chain_params["chain_id"]
+			header["block"] = self.head_block or self.bts.rpc.get_dynamic_global_properties()["head_block_number"]
+		elif catalog:
+			header["chain_id"] = catalog.getMeta('chain_id')
+			header["block"] = catalog.getMeta('block')
+		import time
+		header["time"] = int(time.time())
+		return self.store.assetStorage.exportSnapshot(path, header)
+	
+	def importAssets(self, path, ping_callback=None):
+		""" Load asset snapshot, then, if online, fetch assets
+		    created since it was taken and refresh those changed
+		    since. Returns (loaded, new, changed). """
+		store = self.store.assetStorage
+		catalog = store.catalogStorage
+		chain_id = None
+		if not(self.offline):
+			chain_id = self.bts.rpc.chain_params["chain_id"]
+		elif catalog:
+			chain_id = catalog.getMeta('chain_id')
+		header = store.snapshotHeader(path)
+		if chain_id and header.get("chain_id") and header["chain_id"] != chain_id:
+			raise ValueError("Asset snapshot is for a different chain")
+		header = store.importSnapshot(path)
+		self.asset_registry.clear()
+		if catalog:
+			if header.get("chain_id"):
+				catalog.setMeta('chain_id', header["chain_id"])
+			catalog.setMeta('block', header.get("block", ""))
+			catalog.setMeta('updated', header.get("time", 0))
+		new = changed = 0
+		if not(self.offline):
+			known = store.maxInstance()
+			new = self.download_new_assets()
+			changed = self.refresh_known_assets(known, ping_callback)
+			if catalog:
+				import time
+				catalog.setMeta('updated', int(time.time()))
+		return (header.get("count", 0), new, changed)
+	
+	def checkAssetCatalog(self):
+		""" Make sure shared asset catalog is for the chain we are on """
+		catalog = self.store.assetCatalog
+		if not catalog:
+			return
+		chain_id = self.bts.rpc.chain_params["chain_id"]
+		attached = bool(self.store.assetStorage.catalogStorage)
+		if not self.store.attachCatalog(chain_id):
+			log.warning("Asset catalog is for chain %s, not using it" % catalog.getMeta('chain_id'))
+		if attached != bool(self.store.assetStorage.catalogStorage):
+			self.asset_registry.clear()
+	
+	def assetCatalogStale(self):
+		""" True if shared asset catalog was not refreshed lately """
+		store = self.store.assetStorage
+		if not store.catalogStorage:
+			return False
+		days = int(self.bts.config.get('catalog-refresh-days', 7) or 0)
+		if not days:
+			return False
+		import time
+		updated = int(store.catalogStorage.getMeta('updated', 0))
+		return time.time() - updated > days * 24 * 3600
 	
 	def download_asset(self, symbol):
 		rpc = self.bts.rpc
@@ -811,13 +1247,106 @@ class BitsharesIsolator(object):
 			self.fave_markets.remove(tag)
 		self.fave_markets.add(retag)
 	
-	def download_markets(self, names):
+	def _cachedMarket(self, name):
+		ttl = int(self.bts.config.get('market-cache-ttl', 60) or 0)
+		entry = self.market_cache.get(name)
+		import time
+		if entry and time.time() - entry[0] < ttl:
+			return entry[1]
+		return None
+	
+	def _rpcPool(self):
+		""" Shared thread pool for concurrent RPC calls """
+		if self._rpc_pool is None:
+			from concurrent.futures import ThreadPoolExecutor
+			threads = int(self.bts.config.get('rpc-threads', 16) or 1)
+			self._rpc_pool = ThreadPoolExecutor(max_workers=threads)
+		return self._rpc_pool
+	
+	def _processPool(self):
+		""" Process pool for CPU-bound work, None/False if disabled """
+		with self._process_lock:
+			if self._process_pool is None:
+				self._process_pool = False # unless started below
+				self._startProcessPool()
+		return self._process_pool
+	
+	def _startProcessPool(self):
+		import os
+		processes = int(self.bts.config.get('trxid-processes', os.cpu_count() or 1) or 0)
+		if processes < 2:
+			return
+		import sys
+		if sys.version_info < (3, 7):
+			# ProcessPoolExecutor can only fork there, and forking
+			# a process with threads (and their locks) is unsafe
+			log.info("No transaction id process pool before Python 3.7, computing in-thread")
+			return
+		from concurrent.futures import ProcessPoolExecutor
+		import multiprocessing
+		self._process_workers = processes
+		self._process_pool = ProcessPoolExecutor(max_workers=processes,
+			mp_context=multiprocessing.get_context("spawn"))
+	
+	def download_markets(self, names, ping_callback=None):
+		""" Fetch ticker and 24h volume of many markets, all requests
+		    in flight at once (bounded by the shared RPC thread pool).
+		    Results younger than "market-cache-ttl" seconds are served
+		    from cache. If `ping_callback` is given, results are also
+		    passed to it (as PT_PARTIAL) as soon as they arrive.
+		    Markets that fail to load are logged and left out. """
 		if names is None:
 			names = self._marketMatrix()
-		rpc = self.bts.rpc
+		from .work import Request
+		partial = lambda markets: ping_callback(Request.PT_PARTIAL, markets) if ping_callback and markets else None
+		
 		markets = [ ]
+		pending = { }
 		for name in names:
-			markets.append( self.download_market(name) )
+			cached = self._cachedMarket(name)
+			if cached:
+				markets.append(cached)
+			else:
+				pending[name] = None
+		partial(list(markets))
+		if not pending:
+			return markets
+		
+		if self.offline:
+			raise ResourceUnavailableOffline("Markets")
+		rpc = self.bts.rpc
+		pool = self._rpcPool()
+		futures = { }
+		for name in pending:
+			a, b = str.split(name,":")
+			futures[pool.submit(rpc.get_ticker, a, b)] = (name, 0)
+			futures[pool.submit(rpc.get_24_volume, a, b)] = (name, 1)
+			pending[name] = [ None, None ]
+		
+		import time
+		from concurrent.futures import wait, FIRST_COMPLETED
+		waiting = set(futures.keys())
+		while waiting:
+			done, waiting = wait(waiting, return_when=FIRST_COMPLETED)
+			arrived = [ ]
+			for future in done:
+				name, part = futures[future]
+				if pending[name] is None:
+					continue # other half failed
+				try:
+					pending[name][part] = future.result()
+				except Exception as error:
+					# skip just this market, keep sweeping the rest
+					log.warning("Could not fetch market %s: %s" % (name, str(error) or type(error).__name__))
+					pending[name] = None
+					continue
+				ticker, vol = pending[name]
+				if ticker is not None and vol is not None:
+					market = (name, ticker, vol)
+					self.market_cache.put(name, (time.time(), market))
+					arrived.append(market)
+			markets.extend(arrived)
+			partial(arrived)
 		return markets
 	
 	def download_market(self, name):
@@ -828,6 +1357,8 @@ class BitsharesIsolator(object):
 		a, b = str.split(name,":")
 		ticker = rpc.get_ticker(a, b)
 		vol = rpc.get_24_volume(a, b)
+		import time
+		self.market_cache.put(name, (time.time(), (name, ticker, vol)))
 		return (name, ticker, vol)
 	
 	# this must be called from threads only!
@@ -6,7 +6,7 @@ import uidef.res_rc
 from PyQt4.QtGui import QTableWidgetItem
 
 from .isolator import BitsharesIsolator
-from bitsharesextra.storage import BitsharesStorageExtra, DataDir
+from bitsharesextra.storage import BitsharesStorageExtra, DataDir, WriteBehind, ONLINE_BACKUP
 from bitsharesbase.account import PrivateKey
 
 from .version import VERSION, UNIX_NAME
@@ -29,11 +29,14 @@ from .trxbuffer import WindowWithTrxBuffer
 from .isolator import ResourceUnavailableOffline, WalletLocked
 
 from .netloc import RemoteFetch
-from .work import Request
+from .work import Request, HANDOFF_HOOKS
 from .utils import *
+import time
 import logging
 log = logging.getLogger(__name__)
 
+HANDOFF_HOOKS.append(WriteBehind.settleAll)
+
 class MainWindow(QtGui.QMainWindow,
 	WindowWithAssets,
 	WindowWithMarkets,
@@ -130,9 +133,12 @@ class MainWindow(QtGui.QMainWindow,
 		ui.actionResync_accounts.triggered.connect(self.mergeAccounts)
 		ui.actionWipeResync_accounts.triggered.connect(self.evilMergeAccounts)
 		ui.actionRedownload_assets.triggered.connect(self.evilDownloadAssets)
+		ui.actionExport_assets.triggered.connect(self.export_assets)
+		ui.actionImport_assets.triggered.connect(self.import_assets)
 		ui.actionWipeResync_history.triggered.connect(self.evilDownloadHistory)
 		ui.actionResync_history.triggered.connect(self.massResync)
 		ui.actionResync_orders.triggered.connect(self.massResync)
+		ui.actionRepack_wallet.triggered.connect(self.repack_wallet)
 		#
 		
 		#
@@ -150,6 +156,9 @@ class MainWindow(QtGui.QMainWindow,
 		self.init_gateway()
 		
 		self.connector = RemoteFetch()
+		self.maintenance = RemoteFetch()
+		self.backuper = RemoteFetch()
+		self._last_backup = 0
 		self.background_update.connect(self.on_connector_update)
 		self._connecting = False
 		
@@ -184,6 +193,7 @@ class MainWindow(QtGui.QMainWindow,
 		self.emptyIcon = QtGui.QIcon()
 		
 		self.notes_timer = qtimer(2500, self.mergeNotes)
+		self.backup_timer = qtimer(60 * 1000, self.backup_wallet)
 		
 		
 		# tag tabs:
@@ -454,20 +464,13 @@ class MainWindow(QtGui.QMainWindow,
 		for symCombo in symCombos:
 			symCombo.clear()
 		
-		if hasattr(account, '_balances'):
+		try:
+			balances = self.iso.getBalances(account["id"],
+				force_local=self.iso.offline)
+		except:
+			import traceback
+			traceback.print_exc()
 			balances = [ ]
-			for sym, val in account._balances.items():
-				b = lambda: None
-				b.symbol = sym
-				b.amount = val
-				balances.append( b ) #Amount(val, sym, bitshares_instance=self.iso.bts) )
-		
-		if not(self.iso.offline):
-			balances = self.iso.getBalances(account["id"])#.balances
-			blnc = { }
-			for b in balances:
-				blnc[b.symbol] = b.amount
-			self.iso.storeBalances(account.name, blnc)
 		
 		for b in balances:
 			for symCombo in symCombos:
@@ -667,6 +670,8 @@ class MainWindow(QtGui.QMainWindow,
 						continue
 					#print("Check out:", idx, note)
 					id = note['id']
+					if id == "2.1.0":
+						self.iso.head_block = note.get('head_block_number', None)
 					if id[:4] == "2.6.":
 						self.on_account_note(note)
 					if id[:4] == "2.5.":
@@ -674,6 +679,11 @@ class MainWindow(QtGui.QMainWindow,
 					#from pprint import pprint
 					#pprint(note)
 					#break
+		
+		for account_name in self.iso.history_scheduler.flushUpdated():
+			tab = self.findTab(HistoryTab, account_name)
+			if tab:
+				tab.refreshHistory()
 	
 	def sell_open_market(self):
 		asset_name_a = self.ui.sellAssetCombo.currentText()
@@ -730,14 +740,7 @@ class MainWindow(QtGui.QMainWindow,
 			print("Could not locally resolve account %s to perform sync" % (str(account_id)))
 			return
 		
-		print("Update for acc name:", account.name)
-		tab = self.findTab(HistoryTab, account.name)
-		
-		if tab:
-			print("Have a history tab for it:")
-			tab.mergeHistory_async(self.iso, account)
-		else:
-			print("No history tab for it")
+		self.iso.history_scheduler.noteAccount(account.name, note)
 	
 	def on_balance_note(self, note):
 		account_id = note["owner"]
@@ -750,7 +753,7 @@ class MainWindow(QtGui.QMainWindow,
 			print("Failed to getAsset", asset_id, "aborting injection; error-", str(error))
 			return
 		
-		account = self.iso.injectBalance(account_id, asset["symbol"], amount)
+		self.iso.injectBalance(account_id, asset["id"], amount)
 		balances = self.iso.getBalances(account_id, force_remote=False)
 		
 		dash = self.findTab(DashboardTab, account_id)
@@ -983,10 +986,14 @@ class MainWindow(QtGui.QMainWindow,
 		self.massDesync()
 		#self.mergeAccounts()
 		
-		if self.iso.store.assetStorage.countEntries() < 2:
+		self.iso.checkAssetCatalog()
+		if (self.iso.store.assetStorage.countEntries() < 2
+		or self.iso.assetCatalogStale()
+		or self.iso.assetCrawlPending()):
 			self.download_assets()
 		self.download_markets()
-		self.massResync()
+		self.iso.history_scheduler.start(sorted(self.account_names))
+		self.massResync() # open ones go first
 		
 		#self.start_periodic_updater()
 		
@@ -1027,7 +1034,13 @@ class MainWindow(QtGui.QMainWindow,
 			self.iso.disconnect()
 		#
 		print("3. shutdown threads")
+		if self.iso:
+			self.iso.history_scheduler.stop()
 		Request.shutdown(timeout=10)
+		#
+		if self.iso and self.iso.store:
+			print("4. flush storage")
+			self.iso.store.close()
 	
 	
 	def buffering(self):
@@ -1464,6 +1477,12 @@ class MainWindow(QtGui.QMainWindow,
 			self.add_account()
 		
 		self.perhaps_autoconnect()
+		
+		self.maintenance.fetch(
+			self.iso.pruneTransactions,
+			error_callback=self._ignore_error,
+			description="Pruning cached transactions"
+		)
 		return True
 	
 	def refreshUi_title(self):
@@ -1495,6 +1514,13 @@ class MainWindow(QtGui.QMainWindow,
 			table.setItem(j, 0, QTableWidgetItem( ("cancelled" if cancelled else " ") ))
 			table.setItem(j, 1, QTableWidgetItem( name ))
 			table.setItem(j, 2, QTableWidgetItem( desc ))
+		
+		for desc in (self.iso.history_scheduler.status() if self.iso else [ ]):
+			j += 1
+			table.insertRow(j)
+			table.setItem(j, 0, QTableWidgetItem( " " ))
+			table.setItem(j, 1, QTableWidgetItem( "HistoryScheduler" ))
+			table.setItem(j, 2, QTableWidgetItem( desc ))
 		#print("")
 	
 	def refreshUi_ping(self):
@@ -1604,8 +1630,12 @@ class MainWindow(QtGui.QMainWindow,
 		if not(self.iso):
 			return
 		
+		self.iso.history_scheduler.stop()
 		self.iso.disconnect()
 		
+		if self.iso.store:
+			self.iso.store.close()
+		
 		self.iso.setWallet(None)
 		self.iso.setStorage(None)
 		
@@ -1673,6 +1703,8 @@ class MainWindow(QtGui.QMainWindow,
 		for box in self.account_boxes:
 			box.addItem(name)
 		self.account_names.add(name)
+		if self.iso and not(self.iso.offline):
+			self.iso.history_scheduler.start([ name ])
 	
 	def late_inject_account_box(self, box):
 		box.clear()
@@ -1702,6 +1734,44 @@ class MainWindow(QtGui.QMainWindow,
 		store.wipe()
 		self.massResync()
 	
+	def repack_wallet(self):
+		ok = askyesno("Compress and repack wallet database? This may take a while.")
+		if not ok:
+			return
+		self.maintenance.fetch(
+			self.iso.store.repack,
+			ready_callback=self.repack_wallet_after,
+			error_callback=self.repack_wallet_error,
+			ping_callback=self.refreshUi_ping,
+			description="Repacking wallet database"
+		)
+	
+	def repack_wallet_after(self, uid, args):
+		(before, after) = args
+		showmsg("Wallet database repacked",
+			additional="%d KiB -> %d KiB" % (before / 1024, after / 1024))
+	
+	def repack_wallet_error(self, uid, error):
+		showexc(error)
+	
+	def backup_wallet(self):
+		if not(self.iso) or not(self.iso.store) or not(ONLINE_BACKUP):
+			return
+		config = self.iso.bts.config
+		interval = int(config.get('backup-interval', 60) or 0) # minutes
+		if not(interval) or time.time() - self._last_backup < interval * 60:
+			return
+		self._last_backup = time.time()
+		keep = int(config.get('backup-keep', 5) or 0)
+		self.backuper.fetch(
+			self.iso.store.backup, keep,
+			error_callback=self.backup_wallet_error,
+			description="Backing up wallet"
+		)
+	
+	def backup_wallet_error(self, uid, error):
+		log.error("Wallet backup failed: %s" % str(error))
+	
 	def evilMergeAccounts(self):
 		""" Do not call this, ever """
 		if self.iso.offline:
@@ -2,6 +2,9 @@ from PyQt4 import QtCore, QtGui
 from uidef.settings import Ui_SettingsWindow
 
 from .remotes import RemotesEditor
+from .netloc import RemoteFetch
+
+from bitsharesextra import maintenance
 
 from .utils import *
 
@@ -48,11 +51,65 @@ class SettingsWindow(QtGui.QDialog):
 		self._link_setting(self.ui.proxyHost, 'proxy_host')
 		self._link_setting(self.ui.proxyPort, 'proxy_port', int, "")
 		
+		intz = lambda x: int(x) if x else 0
+		self._link_setting(self.ui.trxRetentionDays, 'trx-retention-days', int, 0, intz)
+		self._link_setting(self.ui.trxRetentionRows, 'trx-retention-rows', int, 0, intz)
+		self._link_setting(self.ui.backupInterval, 'backup-interval', int, 60, intz)
+		self._link_setting(self.ui.backupKeep, 'backup-keep', int, 5, intz)
+		self._link_settingc(self.ui.historyIndexMemos, 'history-index-memos')
+		
 		
 		self.ui.serverList.itemSelectionChanged.connect(self.select_node)
 		stretch_table(self.ui.serverList)
 		self.relist_nodes()
-
+		
+		self.maintainer = RemoteFetch()
+		self.ui.maintStatsButton.clicked.connect(self.maint_stats)
+		self.ui.maintAnalyzeButton.clicked.connect(self.maint_analyze)
+		self.ui.maintCheckButton.clicked.connect(self.maint_check)
+		self.ui.maintVacuumButton.clicked.connect(self.maint_vacuum)
+
+	def _maint_run(self, method, description):
+		self.ui.maintOutput.setPlainText(description + "...")
+		self.maintainer.fetch(
+			self.iso.store.maintain, method,
+			ready_callback=self._maint_after,
+			error_callback=self._maint_error,
+			description=description
+		)
+	
+	def _maint_after(self, uid, text):
+		self.ui.maintOutput.setPlainText(text)
+	
+	def _maint_error(self, uid, error):
+		self.ui.maintOutput.setPlainText("Error: " + str(error))
+	
+	def maint_stats(self):
+		self._maint_run(maintenance.format_stats, "Collecting statistics")
+	
+	def maint_analyze(self):
+		def step(connection):
+			_, before, after = maintenance.measured(connection, maintenance.analyze)
+			return (maintenance.format_step("ANALYZE", before, after) + "\n\n"
+				+ maintenance.format_stats(connection))
+		self._maint_run(step, "Analyzing")
+	
+	def maint_check(self):
+		def step(connection):
+			problems = maintenance.integrity_check(connection)
+			if not problems:
+				return "Integrity check: ok"
+			return "Integrity check FAILED:\n" + "\n".join(problems)
+		self._maint_run(step, "Checking integrity")
+	
+	def maint_vacuum(self):
+		if not askyesno("Compact wallet database? This may take a while."):
+			return
+		def step(connection):
+			_, before, after = maintenance.measured(connection, maintenance.vacuum)
+			return maintenance.format_step("VACUUM", before, after)
+		self._maint_run(step, "Compacting")
+	
 	def setPage(self, page):
 		self.ui.tabWidget.setCurrentIndex(page)
 
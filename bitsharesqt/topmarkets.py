@@ -4,6 +4,7 @@ from bitshares.amount import Amount
 from bitshares.asset import Asset
 
 from .netloc import RemoteFetch
+from .work import Request
 from .utils import *
 
 import json
@@ -81,10 +82,9 @@ class WindowWithMarkets(QtCore.QObject):
 				markets.append( mtupl )
 				self._intr.append(mtupl[0])
 		
-		entries = store.getAssetsLike(name_b, limit=25)
-		for graphene_json in entries:
-			obj = json.loads(graphene_json)
-			name = name_a+":"+obj["symbol"]
+		entries = store.searchSymbols(name_b, limit=25)
+		for (symbol, asset_id, display_name) in entries:
+			name = name_a+":"+symbol
 			if name in self._intr:
 				continue
 			markets.append( (name, { }, { }) )
@@ -132,10 +132,17 @@ class WindowWithMarkets(QtCore.QObject):
 			self.iso.download_markets, markets,
 			ready_callback=self.download_markets_after,
 			error_callback=self._ignore_error if ignore_error else self._download_error,
-			ping_callback=self.refreshUi_ping,
+			ping_callback=self.download_markets_ping,
 			description="Grabbing markets"
 		)
 	
+	def download_markets_ping(self, uid, ping_type, ping_data):
+		if ping_type == Request.PT_PARTIAL:
+			if uid == self.markets_downloader.uid:
+				self.download_markets_after(uid, ping_data)
+			return
+		self.refreshUi_ping()
+	
 	def _ignore_error(self, uid, error):
 		pass
 	def _download_error(self, uid, error):
@@ -159,13 +159,17 @@ class QTransactionBuilder(QtGui.QDialog):
 		other_fees = { }
 		
 		root.clear()
+		fake_objs = [ ]
 		for op in trx.ops:
 			op_id = getOperationIdForClass(op.__class__.__name__)
-			op_json = op.json()
-			fake_obj = {
-				'op': [op_id, op_json],
+			fake_objs.append({
+				'op': [op_id, op.json()],
 				'result': [0, True]
-			}
+			})
+		descriptions = iso.historyDescriptions(fake_objs)
+		
+		for op, fake_obj, details in zip(trx.ops, fake_objs, descriptions):
+			op_id, op_json = fake_obj['op']
 			if 'fee' in op_json:
 				fee = op_json['fee']
 				fee_asset_id = fee['asset_id']
@@ -177,7 +181,6 @@ class QTransactionBuilder(QtGui.QDialog):
 					other_fees[fee_asset_id] += int(fee['amount'])
 			
 			nextstatus = getOperationNameForId(op_id).upper()
-			details = iso.historyDescription(fake_obj)
 			
 			merge_in(root, op, nextstatus, details['long'], iso=iso)
 		
@@ -423,7 +426,7 @@ class QTransactionBuilder(QtGui.QDialog):
 		bitshares_instance = iso.bts
 		src_account = iso.getAccount(issuer)
 		asset = iso.getAsset(symbol)
-		bitasset_options = asset['bitasset_data']
+		bitasset_options = dict(asset['bitasset_data'])
 		bitasset_options.update({
 			"feed_lifetime_sec": feed_lifetime_sec,
 			"minimum_feeds": minimum_feeds,
@@ -81,16 +81,18 @@ class WindowWithTrxBuffer(QtCore.QObject):
 		
 		root.setRowCount(0)
 		
-		j = -1
+		fake_objs = [ ]
 		for op in trx.ops:
 			op_id = getOperationIdForClass(op.__class__.__name__)
-			op_json = op.json()
-			fake_obj = {
-				'op': [op_id, op_json],
+			fake_objs.append({
+				'op': [op_id, op.json()],
 				'result': [0, True]
-			}
+			})
+		
+		j = -1
+		for fake_obj, details in zip(fake_objs, iso.historyDescriptions(fake_objs)):
+			op_id = fake_obj['op'][0]
 			nextstatus = getOperationNameForId(op_id).upper()
-			details = iso.historyDescription(fake_obj)
 			description = details['long']
 			
 			j += 1
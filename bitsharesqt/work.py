@@ -6,6 +6,16 @@ from PyQt4.QtCore import Qt
 import logging
 log = logging.getLogger(__name__)
 
+# Called (without arguments) whenever work changes threads: in the
+# calling thread before a task is started, and in the task's thread
+# before its result is delivered. Storage uses this to make queued
+# writes visible to the other side (see WriteBehind.settle).
+HANDOFF_HOOKS = [ ]
+
+def handoff():
+    for hook in HANDOFF_HOOKS:
+        hook()
+
 def async(method, args, uid, readycb, errorcb=None, pingcb=None, description=""):
     """
     Asynchronously runs a task
@@ -26,6 +36,7 @@ def async(method, args, uid, readycb, errorcb=None, pingcb=None, description="")
     :returns: Request instance
     """
     request = Request(method, args, uid, readycb, errorcb, pingcb, description)
+    handoff()
     QtCore.QThreadPool.globalInstance().start(request)
     return request
 
@@ -62,6 +73,8 @@ class Request(QtCore.QRunnable):
 
     """
     PT_STARTED = 1
+    PT_PARTIAL = 50 # ping_data holds partial results
+    PT_PROGRESS = 60 # ping_data holds progress description
     PT_FAILED = -1
     PT_CANCELLED = -2
     PT_FINISHED = 100
@@ -116,9 +129,14 @@ class Request(QtCore.QRunnable):
         try:
             grabber.Ping.emit(self.uid, Request.PT_STARTED, 0)
             if has_kwarg(self.method, "ping_callback"):
-                result = self.method(*self.args, ping_callback=grabber.Ping)
+                uid = self.uid
+                def ping(ping_type, ping_data):
+                    handoff()
+                    grabber.Ping.emit(uid, ping_type, ping_data)
+                result = self.method(*self.args, ping_callback=ping)
             else:
                 result = self.method(*self.args)
+            handoff()
 
             if not(self.cancelled):
                 grabber.Loaded.emit(self.uid, result)
@@ -129,6 +147,7 @@ class Request(QtCore.QRunnable):
         except Exception as error:
             import traceback
             traceback.print_exc()
+            handoff()
             if not(self.cancelled):
                 grabber.Error.emit(self.uid, error)
                 grabber.Ping.emit(self.uid, Request.PT_FAILED, 0)
@@ -0,0 +1,29 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+# Storage builds on python-bitshares' DataDir
+pytest.importorskip("bitshares.storage")
+pytest.importorskip("appdirs")
+
+
+@pytest.fixture
+def datadir(tmp_path, monkeypatch):
+    """ Keep the shared data directory (asset catalog) inside tmp_path """
+    monkeypatch.setenv("HOME", str(tmp_path))
+    monkeypatch.setenv("XDG_DATA_HOME", str(tmp_path / "share"))
+    from bitsharesextra import storage
+    monkeypatch.setattr(storage, "system", "linux")
+    return tmp_path
+
+
+@pytest.fixture
+def wallet(datadir):
+    """ A fresh wallet database, closed after the test """
+    from bitsharesextra.storage import BitsharesStorageExtra
+    store = BitsharesStorageExtra(str(datadir / "wallet.bts"))
+    yield store
+    store.close()
@@ -0,0 +1,54 @@
+import sqlite3
+
+from bitsharesextra.storage import BitsharesStorageExtra, account_keys
+
+
+def alice(memo_key="BTSmemo"):
+    return { "id": "1.2.100", "name": "alice",
+             "owner": { "key_auths": [ [ "BTSowner", 1 ] ] },
+             "active": { "key_auths": [ [ "BTSactive", 1 ] ] },
+             "options": { "memo_key": memo_key } }
+
+
+def test_directory_resolves_names_in_bulk(wallet):
+    names = wallet.accountNameStorage
+    names.saveMany([ ("1.2.%d" % i, "user%d" % i) for i in range(1200) ])
+    found = names.getNames([ "1.2.5", "1.2.1100", "1.2.9999" ])
+    assert found == { "1.2.5": "user5", "1.2.1100": "user1100" }
+    assert names.getId("user7") == "1.2.7"
+    assert names.getId("nobody") is None
+
+
+def test_key_index(wallet):
+    keys = wallet.accountKeyStorage
+    assert account_keys(alice()) == [ ("BTSowner", "owner"), ("BTSactive", "active"), ("BTSmemo", "memo") ]
+    keys.setKeys("1.2.100", account_keys(alice()))
+    keys.addReferences([ ("BTSother", "1.2.100"), ("BTSactive", "1.2.200") ])
+
+    assert keys.getAccounts([ "BTSactive", "BTSnone" ]) == { "BTSactive": [ "1.2.100", "1.2.200" ] }
+    assert keys.getAccounts([ "BTSactive" ], references=False) == { "BTSactive": [ "1.2.100" ] }
+
+    # key rotation replaces authorities, keeps lookups
+    keys.setKeys("1.2.100", account_keys(alice("BTSmemo2")))
+    assert keys.getAccounts([ "BTSmemo", "BTSmemo2", "BTSother" ]) == {
+        "BTSmemo2": [ "1.2.100" ], "BTSother": [ "1.2.100" ] }
+
+
+def test_existing_accounts_migrate(datadir):
+    path = str(datadir / "old.bts")
+    store = BitsharesStorageExtra(path)
+    store.accountStorage.add("alice", "1.2.100")
+    store.accountStorage.update("alice", "graphene_json", alice())
+    store.close()
+    connection = sqlite3.connect(path)
+    connection.execute("DROP TABLE account_names")
+    connection.execute("DROP TABLE account_keys")
+    connection.commit()
+    connection.close()
+
+    store = BitsharesStorageExtra(path)
+    try:
+        assert store.accountNameStorage.getNames([ "1.2.100" ]) == { "1.2.100": "alice" }
+        assert store.accountKeyStorage.getAccounts([ "BTSmemo" ]) == { "BTSmemo": [ "1.2.100" ] }
+    finally:
+        store.close()
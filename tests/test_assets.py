@@ -0,0 +1,121 @@
+import gzip
+import threading
+
+import pytest
+
+from bitsharesextra.storage import Assets, BitsharesStorageExtra
+
+
+def asset(i, symbol, description=""):
+    return { "id": "1.3.%d" % i, "symbol": symbol, "precision": 5, "issuer": "1.2.1",
+             "options": { "description": description, "max_supply": 1000 } }
+
+
+def test_catalog_is_shared_and_chain_checked(datadir):
+    main = BitsharesStorageExtra(str(datadir / "main.bts"))
+    assert main.attachCatalog("MAINNET")
+    main.assetStorage.saveMany([ (a["id"], a["symbol"], a) for a in [ asset(0, "BTS"), asset(1, "USD") ] ])
+    main.close()
+
+    other = BitsharesStorageExtra(str(datadir / "other.bts"))
+    other.assetStorage.add("1.3.1", "TEST", asset(1, "TEST"))
+    # not attached before the chain is known
+    assert other.assetStorage.countEntries() == 1
+    assert not other.attachCatalog("TESTNET")
+    assert other.assetStorage.getById("1.3.1")["symbol"] == "TEST"
+    other.close()
+
+    main = BitsharesStorageExtra(str(datadir / "main.bts"))
+    assert main.assetStorage.catalogStorage # verified before
+    assert main.assetStorage.getById("1.3.1")["symbol"] == "USD"
+    main.close()
+
+
+def test_update_reaches_catalog_only_assets(wallet):
+    assert wallet.attachCatalog("MAINNET")
+    assets = wallet.assetStorage
+    assets.save("1.3.1", "USD", asset(1, "USD"))
+    assets.update("1.3.1", asset(1, "USD", "changed"))
+    assert assets.getById("1.3.1")["options"]["description"] == "changed"
+
+
+def test_catalog_connection_is_reused_per_thread(wallet):
+    assert wallet.attachCatalog("MAINNET")
+    assets = wallet.assetStorage
+    assets.save("1.3.0", "BTS", asset(0, "BTS"))
+    assets.getById("1.3.0")
+    first = assets._catalog_connection()
+    assets.getById("1.3.0")
+    assert assets._catalog_connection() is first
+
+    other = [ ]
+    t = threading.Thread(target=lambda: other.append(
+        (assets.getById("1.3.0")["symbol"], assets._catalog_connection())))
+    t.start()
+    t.join(10)
+    assert other[0][0] == "BTS"
+    assert other[0][1] is not first
+
+
+def test_changes_reach_listeners(wallet):
+    assets = wallet.assetStorage
+    seen = [ ]
+    assets.listeners.append(lambda *keys: seen.append(keys))
+    assets.save("1.3.1", "USD", asset(1, "USD"))
+    assets.update("1.3.1", asset(1, "USD", "changed"))
+    assets.deleteById("1.3.1")
+    assert seen == [ ("1.3.1", "USD"), ("1.3.1", "USD"), ( ) ]
+
+
+def test_symbol_search_prefix_then_suffix(wallet):
+    assets = wallet.assetStorage
+    assets.saveMany([ (a["id"], a["symbol"], a) for a in [
+        asset(0, "BTS"), asset(1, "USD", '{"main": "US Dollar"}'),
+        asset(2, "OPEN.USDT"), asset(3, "USDC"), asset(4, "EUR") ] ])
+    assert [ row[0] for row in assets.searchSymbols("usd") ] == [ "USD", "USDC", "OPEN.USDT" ]
+    assert assets.searchSymbols("usd", limit=1) == [ ("USD", "1.3.1", "US Dollar") ]
+
+    # index follows later writes
+    assets.save("1.3.5", "USDX", asset(5, "USDX"))
+    assert [ row[0] for row in assets.searchSymbols("usd") ] == [ "USD", "USDC", "USDX", "OPEN.USDT" ]
+    assets.deleteBySymbol("USDC")
+    assert [ row[0] for row in assets.searchSymbols("usd") ] == [ "USD", "USDX", "OPEN.USDT" ]
+
+
+def test_snapshot_roundtrip(datadir):
+    source = BitsharesStorageExtra(str(datadir / "source.bts"))
+    source.assetStorage.saveMany([ (a["id"], a["symbol"], a) for a in [
+        asset(0, "BTS"), asset(1, "USD", "x" * 1000) ] ])
+    path = str(datadir / "assets.jsonl.gz")
+    header = source.assetStorage.exportSnapshot(path, { "chain_id": "abc" })
+    source.close()
+    assert (header["chain_id"], header["count"]) == ("abc", 2)
+
+    target = BitsharesStorageExtra(str(datadir / "target.bts"))
+    try:
+        assert target.assetStorage.importSnapshot(path) == header
+        assert target.assetStorage.getById("1.3.1")["options"]["description"] == "x" * 1000
+        assert target.assetStorage.maxInstance() == 1
+    finally:
+        target.close()
+
+    with gzip.open(str(datadir / "other.gz"), "wt") as f:
+        f.write('{"format": "something-else"}\n')
+    with pytest.raises(ValueError):
+        Assets.snapshotHeader(str(datadir / "other.gz"))
+
+
+def test_dynamic_data_kept_apart(wallet):
+    bts = dict(asset(0, "BTS"), dynamic_asset_data_id="2.3.0",
+               dynamic_asset_data={ "id": "2.3.0", "current_supply": 100 })
+    wallet.assetStorage.saveMany([ ("1.3.0", "BTS", bts) ])
+
+    static, = wallet.assetStorage.getManyById([ "1.3.0" ])
+    assert "dynamic_asset_data" not in static
+    assert wallet.assetStorage.getById("1.3.0")["dynamic_asset_data"]["current_supply"] == 100
+
+    # refreshed on its own, leaving the definition alone
+    wallet.assetDataStorage.saveMany(
+        [ ("2.3.0", "1.3.0", "dynamic", { "id": "2.3.0", "current_supply": 200 }) ], updated=1000)
+    assert wallet.assetStorage.getById("1.3.0")["dynamic_asset_data"]["current_supply"] == 200
+    assert wallet.assetDataStorage.getUpdated([ "2.3.0", "2.3.1" ]) == { "2.3.0": 1000 }
@@ -0,0 +1,48 @@
+import gzip
+import os
+import sqlite3
+import time
+
+import pytest
+
+from bitsharesextra.storage import ONLINE_BACKUP
+
+pytestmark = pytest.mark.skipif(not ONLINE_BACKUP, reason="needs Connection.backup")
+
+
+def test_backup_is_a_readable_copy(wallet, datadir):
+    wallet.accountStorage.add("alice", "1.2.100")
+    wallet.flush()
+    path = wallet.backup()
+
+    with gzip.open(path) as src, open(str(datadir / "restored.bts"), "wb") as dst:
+        dst.write(src.read())
+    connection = sqlite3.connect(str(datadir / "restored.bts"))
+    assert connection.execute("SELECT account FROM accounts").fetchall() == [ ("alice", ) ]
+    connection.close()
+
+    # nothing changed since
+    assert wallet.backup() is None
+    time.sleep(0.01)
+    wallet.accountStorage.add("bob", "1.2.101")
+    wallet.flush()
+    assert wallet.backup() is not None
+
+
+def test_backup_prunes_oldest_across_name_schemes(wallet, datadir):
+    backupdir = datadir / "backups"
+    backupdir.mkdir()
+    # old scheme (no sub-second suffix) sorts after the new one by name
+    old = [ "wallet.bts-20200101-000000.sqlite.gz",
+            "wallet.bts-20200101-000000-000001000.sqlite.gz",
+            "wallet.bts-20210101-000000.sqlite.gz" ]
+    for n, name in enumerate(old):
+        (backupdir / name).write_bytes(b"")
+        # mtimes say nothing about their order
+        os.utime(str(backupdir / name), (time.time() - n, time.time() - n))
+    os.utime(wallet.accountStorage.sqlDataBaseFile, None)
+
+    path = wallet.backup(keep=2)
+
+    assert sorted(os.listdir(str(backupdir))) == sorted([
+        "wallet.bts-20210101-000000.sqlite.gz", os.path.basename(path) ])
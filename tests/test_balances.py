@@ -0,0 +1,72 @@
+import sqlite3
+
+from bitsharesextra.storage import BitsharesStorageExtra, pack_json
+
+
+def legacy_wallet(path):
+    """ Wallet from before the `balances` table: account with a
+        `balances_json` blob, asset known locally """
+    store = BitsharesStorageExtra(path)
+    store.assetStorage.add("1.3.0", "BTS", { "id": "1.3.0", "symbol": "BTS",
+        "precision": 5, "issuer": "1.2.3", "options": { } })
+    store.accountStorage.add("alice", "1.2.100")
+    store.accountStorage.update("alice", "graphene_json", { "id": "1.2.100", "name": "alice" })
+    store.close()
+    connection = sqlite3.connect(path)
+    connection.execute("UPDATE accounts SET balances_json=? WHERE account='alice'",
+                       (pack_json({ "BTS": 12.5 }), ))
+    connection.execute("DROP TABLE balances")
+    connection.commit()
+    connection.close()
+
+
+def test_legacy_balances_migrate_once(datadir):
+    path = str(datadir / "legacy.bts")
+    legacy_wallet(path)
+
+    store = BitsharesStorageExtra(path)
+    assert store.balanceStorage.getBalances("1.2.100") == [ ("1.3.0", 1250000) ]
+    assert "balances" not in store.accountStorage.getByName("alice")
+    # balances went to zero since
+    store.balanceStorage.setBalances("1.2.100", [ ])
+    store.close()
+
+    connection = sqlite3.connect(path)
+    assert connection.execute("SELECT balances_json FROM accounts").fetchall() == [ (None, ) ]
+    connection.close()
+
+    store = BitsharesStorageExtra(path)
+    assert store.balanceStorage.getBalances("1.2.100") == [ ]
+    store.close()
+
+
+def test_migration_keeps_newer_balances(datadir):
+    path = str(datadir / "legacy.bts")
+    legacy_wallet(path)
+    store = BitsharesStorageExtra(path)
+    store.close()
+    # A blob appearing again (older client) must not clobber the table
+    connection = sqlite3.connect(path)
+    connection.execute("UPDATE accounts SET balances_json=?", (pack_json({ "BTS": 99 }), ))
+    connection.commit()
+    connection.close()
+
+    store = BitsharesStorageExtra(path)
+    assert store.balanceStorage.getBalances("1.2.100") == [ ("1.3.0", 1250000) ]
+    store.close()
+
+
+def test_incremental_balance_updates(wallet):
+    balances = wallet.balanceStorage
+    balances.setBalances("1.2.100", [ ("1.3.0", 500), ("1.3.1", 7) ], updated_block=10)
+    balances.setBalances("1.2.101", [ ("1.3.0", 100) ], updated_block=10)
+
+    # one asset changes, the others are untouched
+    balances.setBalance("1.2.100", "1.3.1", 9, updated_block=11)
+    assert balances.getBalances("1.2.100") == [ ("1.3.0", 500), ("1.3.1", 9) ]
+    assert balances.getTotals() == [ ("1.3.0", 600), ("1.3.1", 9) ]
+    assert balances.getTotals([ "1.2.101" ]) == [ ("1.3.0", 100) ]
+
+    # a full refresh drops assets no longer held
+    balances.setBalances("1.2.100", [ ("1.3.0", 400) ], updated_block=12)
+    assert balances.getBalances("1.2.100") == [ ("1.3.0", 400) ]
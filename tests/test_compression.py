@@ -0,0 +1,39 @@
+import sqlite3
+
+from bitsharesextra.storage import (COMPRESS_MARKER, COMPRESS_THRESHOLD,
+    pack_text, unpack_text)
+
+
+def test_pack_roundtrip():
+    small = '{"a": 1}'
+    large = '{"key": "%s"}' % ("x" * COMPRESS_THRESHOLD)
+    assert pack_text(small) == small
+    assert pack_text(large)[:1] == COMPRESS_MARKER
+    assert len(pack_text(large)) < len(large)
+    for text in (None, small, large):
+        assert unpack_text(pack_text(text)) == text
+
+
+def test_large_json_stored_compressed(wallet):
+    body = { "id": "1.2.100", "name": "alice", "pad": "x" * 1000 }
+    wallet.accountStorage.add("alice", "1.2.100")
+    wallet.accountStorage.update("alice", "graphene_json", body)
+
+    raw, = wallet.accountStorage.sql_fetchone(
+        ("SELECT graphene_json FROM accounts WHERE account='alice'", ))
+    assert isinstance(raw, bytes) and raw[:1] == COMPRESS_MARKER
+    assert wallet.accountStorage.getByName("alice")["pad"] == body["pad"]
+
+
+def test_repack_compresses_legacy_text(wallet):
+    legacy = '{"id": "1.2.100", "pad": "%s"}' % ("y" * 1000)
+    wallet.accountStorage.add("alice", "1.2.100")
+    wallet.flush()
+    connection = sqlite3.connect(wallet.accountStorage.sqlDataBaseFile)
+    connection.execute("UPDATE accounts SET graphene_json=?", (legacy, ))
+    connection.commit()
+    connection.close()
+
+    assert wallet.accountStorage.repack() == 1
+    assert wallet.accountStorage.repack() == 0
+    assert wallet.accountStorage.getByName("alice")["pad"] == "y" * 1000
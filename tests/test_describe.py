@@ -0,0 +1,21 @@
+import pytest
+
+pytest.importorskip("bitsharesbase")
+
+from bitsharesqt.describe import SyntheticLookups, describe_many
+
+
+def test_failing_formatter_falls_back_to_generic():
+    iso = SyntheticLookups()
+    good = { "op": [ 0, { "from": "1.2.1", "to": "1.2.2",
+                          "amount": { "amount": 100000, "asset_id": "1.3.0" } } ] }
+    bad = dict(good, op=[ 0, dict(good["op"][1],
+                          amount={ "amount": 1, "asset_id": "1.3.999" }) ])
+
+    first, broken, last = describe_many(iso, [ good, bad, good ], { "id": "1.2.1" })
+
+    assert first == last
+    assert first["long"] == "Transfer from user1 to user2 - 1.00000 ASSET0"
+    assert first["minus"] == "1.00000 ASSET0"
+    assert broken["long"] == "Some operation"
+    assert (broken["short"], broken["plus"], broken["minus"]) == ("", "", "")
@@ -0,0 +1,48 @@
+import json
+
+from bitsharesextra.storage import History
+
+
+def add_op(store, account, n, details=None):
+    short = { "op": [ 0, { "amount": { "amount": n, "asset_id": "1.3.0" } } ], "result": [ 0, { } ] }
+    trx = json.dumps({ "ref_block_num": n })
+    store.historyStorage.add(account, "Transfer %d" % n, "1.11.%d" % n, json.dumps(short), 0,
+        1000 + n, 0, 0, 0, "trx%d" % n, trx, json.dumps(details or { }))
+
+
+def test_op_sequence():
+    assert History.opSequence("1.11.1234") == 1234
+    assert History.opSequence(None) is None
+    assert History.opSequence("1.11") is None
+
+
+def test_pages_follow_operation_order(wallet):
+    history = wallet.historyStorage
+    # "1.11.9" sorts after "1.11.10" as text
+    for n in [ 9, 10, 11, 100 ]:
+        add_op(wallet, "alice", n)
+    add_op(wallet, "bob", 500)
+
+    assert history.getLastOperation("alice") == "1.11.100"
+    assert history.getLastOperation("carol") is None
+    seqs = lambda rows: [ row[History.__listing__.index("op_seq")] for row in rows ]
+    assert seqs(history.getPage("alice")) == [ 100, 11, 10, 9 ]
+    assert seqs(history.getPage("alice", limit=2, before_seq=100)) == [ 11, 10 ]
+    assert seqs(history.getPage("alice", after_seq=10)) == [ 100, 11 ]
+    assert history.countEntries("alice") == 4
+    assert history.countEntries("alice", since_seq=11) == 2
+
+
+def test_records_decode_lazily(wallet):
+    add_op(wallet, "alice", 7, { "plus": "7 BTS", "icon": "transfer_from" })
+
+    record = wallet.historyStorage.getRecord("1.11.7", "alice")
+    assert record.op == [ 0, { "amount": { "amount": 7, "asset_id": "1.3.0" } } ]
+    assert record.info == { "short": "Transfer 7", "plus": "7 BTS", "minus": "", "icon": "transfer_from" }
+    # full transaction is joined back in from the transactions table
+    assert record.transaction == { "ref_block_num": 7 }
+
+    listed, = wallet.historyStorage.getRecords("alice")
+    assert (listed.op_index, listed.op_seq, listed.description) == ("1.11.7", 7, "Transfer 7")
+    assert listed.info["plus"] == "7 BTS"
+    assert listed.block_num is None and listed.transaction is None
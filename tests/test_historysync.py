@@ -0,0 +1,154 @@
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("bitsharesbase")
+
+from bitsharesqt import historysync
+from bitsharesqt.historysync import HistoryScheduler, sync_history
+
+
+class Account(dict):
+    def __init__(self, name):
+        super(Account, self).__init__(id="1.2.100", statistics="2.6.100")
+        self.name = name
+
+
+class FakeIso(object):
+    """ Just enough of BitsharesIsolator for `sync_history`: a chain
+        with operations 1.11.1 .. 1.11.`ops`, served `limit` a page """
+    offline = False
+
+    def __init__(self, store, ops, limit=3):
+        self.store = store
+        self.ops = ops
+        self.limit = limit
+        self.fetched = None # called before every page
+        self.history_locks = { }
+        self.bts = self
+        self.rpc = self
+        self.config = { }
+
+    def historyLock(self, name):
+        return self.history_locks.setdefault(name, threading.Lock())
+
+    def get_full_accounts(self, names, subscribe):
+        pass
+
+    def getAccount(self, name):
+        return Account(name)
+
+    def accountHistorySince(self, account_id, last_op_index=None, start_op_index=None):
+        stop = int(last_op_index.split(".")[2])
+        start = int(start_op_index.split(".")[2]) if start_op_index else self.ops
+        while start > stop:
+            if self.fetched:
+                self.fetched()
+            seqs = range(start, max(start - self.limit, stop), -1)
+            yield [ { "id": "1.11.%d" % n, "op": [ 1, { } ], "result": [ 0, { } ],
+                      "block_num": n, "trx_in_block": 0, "op_in_trx": 0,
+                      "virtual_op": 0 } for n in seqs ]
+            start -= self.limit
+
+    def getTransactions(self, positions):
+        return { }
+
+    def getTransactionIds(self, trxs):
+        return { }
+
+    def historyDescriptions(self, history, account=None):
+        return [ { "long": "Order" } for h in history ]
+
+    def softAccountName(self, name):
+        return name
+
+
+def stored(store):
+    return sorted(store.historyStorage.opSequence(e["op_index"])
+                  for e in store.historyStorage.getEntries("alice"))
+
+
+def test_interrupted_sync_resumes_from_checkpoint(wallet):
+    iso = FakeIso(wallet, 10)
+    assert sync_history(iso, Account("alice"), max_pages=2) == 6
+    checkpoint = wallet.checkpointStorage.getCheckpoint("alice")
+    assert (checkpoint["top"], checkpoint["cursor"], checkpoint["synced"]) == (10, 5, 6)
+
+    iso.ops = 12 # two more meanwhile
+    assert sync_history(iso, Account("alice")) == 6
+    assert stored(wallet) == list(range(1, 13))
+    assert wallet.checkpointStorage.getCheckpoint("alice") is None
+
+
+def test_halt_keeps_checkpoint(wallet):
+    iso = FakeIso(wallet, 10)
+    halt = threading.Event()
+    assert sync_history(iso, Account("alice"), halt=halt,
+        page_callback=lambda entries: halt.set()) == 3
+    assert wallet.checkpointStorage.getCheckpoint("alice")["cursor"] == 8
+
+    assert sync_history(iso, Account("alice")) == 7
+    assert stored(wallet) == list(range(1, 11))
+
+
+def test_halt_during_fetch_writes_nothing(wallet):
+    iso = FakeIso(wallet, 10)
+    halt = threading.Event()
+    iso.fetched = halt.set
+    assert sync_history(iso, Account("alice"), halt=halt) == 0
+    assert stored(wallet) == [ ]
+    assert wallet.checkpointStorage.getCheckpoint("alice") is None
+
+
+def test_failed_sync_retries_with_backoff(wallet, monkeypatch):
+    delays = [ ]
+    class Timer(object):
+        def __init__(self, delay, func, args):
+            delays.append(delay)
+            self.func, self.args = func, args
+        def start(self):
+            self.func(*self.args) # retry right away
+    monkeypatch.setattr(historysync.threading, "Timer", Timer)
+    monkeypatch.setattr(HistoryScheduler, "RETRY_DELAY_MAX", 15)
+
+    iso = FakeIso(wallet, 2)
+    done = threading.Event()
+    def fetched():
+        if len(delays) < 4:
+            raise IOError("node went away")
+        done.set()
+    iso.fetched = fetched
+    scheduler = HistoryScheduler(iso)
+    scheduler.start([ "alice" ])
+    try:
+        assert done.wait(10)
+        # success resets the backoff
+        deadline = time.time() + 10
+        while scheduler.failures and time.time() < deadline:
+            time.sleep(0.01)
+        assert scheduler.failures == { }
+    finally:
+        scheduler.stop()
+    assert delays == [ 5, 10, 15, 15 ]
+    assert stored(wallet) == [ 1, 2 ]
+
+
+def test_stop_waits_for_workers(wallet):
+    iso = FakeIso(wallet, 10)
+    fetching = threading.Event()
+    release = threading.Event()
+    def fetched():
+        fetching.set()
+        release.wait(10)
+    iso.fetched = fetched
+    scheduler = HistoryScheduler(iso)
+    scheduler.start([ "alice" ])
+    assert fetching.wait(10)
+
+    threading.Timer(0.2, release.set).start()
+    scheduler.stop()
+
+    assert not any(t.is_alive() for t in scheduler.workers)
+    # the page fetched before stop was not stored
+    assert stored(wallet) == [ ]
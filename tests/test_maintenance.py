@@ -0,0 +1,47 @@
+import os
+import sqlite3
+
+from bitsharesextra import maintenance
+from bitsharesextra.storage import BitsharesStorageExtra
+
+
+def test_maintain_runs_on_wallet_in_use(wallet):
+    wallet.accountStorage.add("alice", "1.2.100")
+    assert wallet.maintain(maintenance.integrity_check) == [ ]
+    wallet.maintain(maintenance.analyze)
+
+    stats = { entry["name"]: entry for entry in wallet.maintain(maintenance.table_stats) }
+    assert stats["accounts"]["type"] == "table"
+    assert stats["accounts"]["rows"] == 1
+    # queued writes went in first, ANALYZE saw them
+    assert stats["sqlite_stat1"]["rows"] > 0
+
+
+def test_vacuum_into_reclaims_space(datadir):
+    path = str(datadir / "wallet.bts")
+    store = BitsharesStorageExtra(path)
+    store.accountStorage.sql_executemany(
+        "INSERT INTO accounts (account, account_id, graphene_json) VALUES (?, ?, ?)",
+        [ ("user%d" % i, "1.2.%d" % i, "x" * 500) for i in range(2000) ])
+    store.accountStorage.sql_execute(("DELETE FROM accounts", ))
+    store.close()
+
+    before = os.path.getsize(path)
+    maintenance.vacuum_into(path)
+    assert os.path.getsize(path) < before
+    assert not os.path.exists(path + ".vacuum")
+    connection = sqlite3.connect(path)
+    try:
+        assert maintenance.integrity_check(connection) == [ ]
+        assert maintenance.database_size(connection)[1] == 0
+    finally:
+        connection.close()
+
+
+def test_command_line_check(datadir, capsys):
+    path = str(datadir / "wallet.bts")
+    BitsharesStorageExtra(path).close()
+    assert not maintenance.main([ path, "--check", "--stats" ])
+    out = capsys.readouterr().out
+    assert "Integrity check: ok" in out
+    assert "accounts" in out
@@ -0,0 +1,55 @@
+import sqlite3
+
+from bitsharesextra.storage import BitsharesStorageExtra, HistorySearch
+
+
+def add_op(store, account, n, description, counterparties="", memo_text=None):
+    store.historyStorage.add(account, description, "1.11.%d" % n, "{}", "",
+        100 + n, 0, 0, 0, "", None, "{}",
+        counterparties=counterparties, optype="transfer", memo_text=memo_text)
+
+
+def found(store, text, account_name=None):
+    return sorted(e["op_index"] for e in store.historyStorage.search(text, account_name))
+
+
+def test_search_descriptions_counterparties_and_memos(wallet):
+    assert wallet.historyStorage.searchable
+    add_op(wallet, "alice", 1, "Transfer from alice to bob - 1 BTS", "bob")
+    add_op(wallet, "alice", 2, "Buy 10 USD", memo_text="rent for march")
+    add_op(wallet, "carol", 3, "Transfer from carol to bob - 2 BTS", "bob")
+    # same entry again, must not be indexed twice
+    add_op(wallet, "alice", 1, "Transfer from alice to bob - 1 BTS", "bob")
+
+    assert found(wallet, "bo") == [ "1.11.1", "1.11.3" ]
+    assert found(wallet, "bob", "alice") == [ "1.11.1" ]
+    assert found(wallet, "rent march") == [ "1.11.2" ]
+    assert found(wallet, "transfer") == [ "1.11.1", "1.11.2", "1.11.3" ]
+
+
+def test_match_expression_is_safe():
+    assert HistorySearch.matchExpression('bob" OR NEAR(') == '"bob"* "OR"* "NEAR"*'
+    assert HistorySearch.matchExpression('"*()') == ""
+
+
+def test_existing_history_gets_indexed(datadir):
+    path = str(datadir / "old.bts")
+    store = BitsharesStorageExtra(path)
+    add_op(store, "alice", 1, "Transfer from alice to bob - 1 BTS")
+    store.close()
+    connection = sqlite3.connect(path)
+    connection.execute("DROP TABLE history_fts")
+    connection.commit()
+    connection.close()
+
+    store = BitsharesStorageExtra(path)
+    try:
+        assert found(store, "alice") == [ "1.11.1" ]
+    finally:
+        store.close()
+
+
+def test_like_fallback_without_index(wallet):
+    add_op(wallet, "alice", 1, "Transfer from alice to bob - 1 BTS")
+    wallet.historyStorage.searchable = False
+    assert found(wallet, "to bob") == [ "1.11.1" ]
@@ -0,0 +1,116 @@
+import json
+import sqlite3
+import time
+
+from bitsharesextra.storage import BitsharesStorageExtra
+
+
+def add_op(store, account, n, block_num, trx_in_block=0):
+    trx = json.dumps({ "ref_block_num": block_num, "operations": [ [ 0, { } ] ] })
+    store.historyStorage.add(account, "Transfer", "1.11.%d" % n, "{}", "",
+        block_num, trx_in_block, 0, 0, "trx%d" % block_num, trx, "{}")
+
+
+def positions(store):
+    rows = store.transactionStorage.sql_fetchall(
+        ("SELECT block_num FROM transactions ORDER BY block_num", ))
+    return [ row[0] for row in rows ]
+
+
+def test_prune_keeps_recent_rows_per_account(wallet):
+    for n in range(1, 6):
+        add_op(wallet, "alice", n, 100 + n)
+    add_op(wallet, "bob", 10, 200)
+    # shared with alice's oldest entry, still recent for bob
+    add_op(wallet, "bob", 11, 101)
+
+    n = wallet.transactionStorage.prune(wallet.historyStorage, rows=2)
+
+    assert n == 2
+    assert positions(wallet) == [ 101, 104, 105, 200 ]
+
+
+def test_prune_by_age_and_orphans(wallet):
+    add_op(wallet, "alice", 1, 101)
+    add_op(wallet, "alice", 2, 102)
+    wallet.transactionStorage.add(300, 0, "orphan", "{}")
+    wallet.transactionStorage.sql_execute(
+        ("UPDATE transactions SET stored=? WHERE block_num=101", (int(time.time()) - 10 * 86400, )))
+
+    n = wallet.transactionStorage.prune(wallet.historyStorage, days=7)
+
+    assert n == 2
+    assert positions(wallet) == [ 102 ]
+    # entries survive, only the cached transaction is gone
+    assert wallet.historyStorage.countEntries("alice") == 2
+
+
+def test_upgrade_adds_stored_column(datadir):
+    path = str(datadir / "old.bts")
+    store = BitsharesStorageExtra(path)
+    add_op(store, "alice", 1, 101)
+    store.close()
+    connection = sqlite3.connect(path)
+    connection.execute("CREATE TABLE t AS SELECT id, block_num, trx_in_block, trxid, trxfull FROM transactions")
+    connection.execute("DROP TABLE transactions")
+    connection.execute("ALTER TABLE t RENAME TO transactions")
+    connection.commit()
+    connection.close()
+
+    store = BitsharesStorageExtra(path)
+    try:
+        stored, = store.transactionStorage.sql_fetchone(("SELECT stored FROM transactions", ))
+        assert abs(stored - time.time()) < 60
+        assert store.transactionStorage.prune(store.historyStorage, days=1) == 0
+    finally:
+        store.close()
+
+
+def test_add_upgrades_partial_transaction(wallet):
+    store = wallet.transactionStorage
+    partial = json.dumps({ "operations": [ ] })
+    full = json.dumps({ "operations": [ [ 0, { "amount": 1 } ] ], "signatures": [ "x" * 200 ] })
+
+    store.add(101, 2, None, partial)
+    store.add(101, 2, "abc", full)
+    entry = store.getEntry(101, 2)
+    assert (entry["trxid"], entry["trxfull"]) == ("abc", full)
+
+    # a shorter copy never replaces what we have
+    store.add(101, 2, None, partial)
+    entry = store.getEntry(101, 2)
+    assert (entry["trxid"], entry["trxfull"]) == ("abc", full)
+
+
+def test_history_stores_each_transaction_once(wallet):
+    add_op(wallet, "alice", 1, 101)
+    add_op(wallet, "bob", 2, 101)
+
+    assert positions(wallet) == [ 101 ]
+    nulls, = wallet.historyStorage.sql_fetchone(
+        ("SELECT COUNT(*) FROM history WHERE trxfull IS NULL", ))
+    assert nulls == 2
+
+
+def test_legacy_history_transactions_migrate(datadir):
+    path = str(datadir / "legacy.bts")
+    store = BitsharesStorageExtra(path)
+    add_op(store, "alice", 1, 101)
+    add_op(store, "alice", 2, 102)
+    store.close()
+    connection = sqlite3.connect(path)
+    connection.execute("UPDATE history SET trxfull = " +
+        "(SELECT trxfull FROM transactions t WHERE t.block_num = history.block_num)")
+    connection.execute("DROP TABLE transactions")
+    connection.commit()
+    connection.close()
+
+    store = BitsharesStorageExtra(path)
+    try:
+        assert positions(store) == [ 101, 102 ]
+        assert json.loads(store.transactionStorage.getEntry(102, 0)["trxfull"])["ref_block_num"] == 102
+        nulls, = store.historyStorage.sql_fetchone(
+            ("SELECT COUNT(*) FROM history WHERE trxfull IS NULL", ))
+        assert nulls == 2
+    finally:
+        store.close()
@@ -0,0 +1,98 @@
+import sqlite3
+import threading
+
+from bitsharesextra.storage import BitsharesStorageExtra, WriteBehind
+
+
+def block_writer(store):
+    """ Keep the writer thread busy until the returned event is set """
+    release = threading.Event()
+    started = threading.Event()
+    def job(connection, progress):
+        started.set()
+        release.wait(10)
+    threading.Thread(target=store.writer.call, args=(job, )).start()
+    started.wait(10)
+    return release
+
+
+def test_writes_apply_in_order(wallet):
+    remotes = wallet.remotesStorage
+    for i in range(200):
+        remotes.sql_execute(("DELETE FROM %s" % remotes.__tablename__, ))
+        remotes.sql_execute(("INSERT INTO %s (label, url, ctype) VALUES (?, ?, ?)" % remotes.__tablename__,
+                             ("node", "wss://node/%d" % i, 0)))
+    rows = remotes.sql_fetchall(("SELECT url FROM %s" % remotes.__tablename__, ))
+    assert rows == [ ("wss://node/199", ) ]
+
+
+def test_close_makes_writes_durable(datadir):
+    path = str(datadir / "durable.bts")
+    store = BitsharesStorageExtra(path)
+    table = store.remotesStorage.__tablename__
+    for i in range(500):
+        store.remotesStorage.sql_execute(
+            ("INSERT INTO %s (label, url, ctype) VALUES (?, ?, ?)" % table, ("n", "wss://%d" % i, 0)))
+    store.close()
+    connection = sqlite3.connect(path)
+    try:
+        assert connection.execute("SELECT COUNT(*) FROM %s" % table).fetchone()[0] == 500
+    finally:
+        connection.close()
+
+
+def test_own_writes_are_visible(wallet):
+    remotes = wallet.remotesStorage
+    remotes.sql_execute(("INSERT INTO %s (label, url, ctype) VALUES (?, ?, ?)" % remotes.__tablename__,
+                         ("mine", "wss://mine", 0)))
+    row = remotes.sql_fetchone(("SELECT url FROM %s WHERE label=?" % remotes.__tablename__, ("mine", )))
+    assert row == ("wss://mine", )
+
+
+def test_reads_do_not_wait_for_other_threads(wallet):
+    remotes = wallet.remotesStorage
+    table = remotes.__tablename__
+    release = block_writer(wallet)
+    try:
+        def sync_thread():
+            remotes.sql_execute(("INSERT INTO %s (label, url, ctype) VALUES (?, ?, ?)" % table,
+                                 ("other", "wss://other", 0)))
+        t = threading.Thread(target=sync_thread)
+        t.start()
+        t.join(10)
+
+        done = threading.Event()
+        result = [ ]
+        def reader():
+            result.append(remotes.sql_fetchall(("SELECT url FROM %s" % table, )))
+            done.set()
+        threading.Thread(target=reader).start()
+        # writer is stuck, yet this thread's read returns
+        assert done.wait(5)
+        assert result[0] == [ ]
+    finally:
+        release.set()
+    wallet.flush()
+    assert remotes.sql_fetchall(("SELECT url FROM %s" % table, )) == [ ("wss://other", ) ]
+
+
+def test_settle_all_hands_over_writes(wallet):
+    remotes = wallet.remotesStorage
+    table = remotes.__tablename__
+    def worker():
+        remotes.sql_execute(("INSERT INTO %s (label, url, ctype) VALUES (?, ?, ?)" % table,
+                             ("w", "wss://w", 0)))
+        WriteBehind.settleAll() # as work.handoff does
+    t = threading.Thread(target=worker)
+    t.start()
+    t.join(10)
+    assert remotes.sql_fetchall(("SELECT url FROM %s" % table, )) == [ ("wss://w", ) ]
+
+
+def test_writer_job_may_read_storage(wallet):
+    remotes = wallet.remotesStorage
+    remotes.sql_execute(("INSERT INTO %s (label, url, ctype) VALUES (?, ?, ?)" % remotes.__tablename__,
+                         ("x", "wss://x", 0)))
+    count = wallet.writer.call(lambda connection, progress:
+        remotes.sql_fetchone(("SELECT COUNT(*) FROM %s" % remotes.__tablename__, ))[0])
+    assert count == 1